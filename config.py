@@ -1,5 +1,6 @@
 import yaml, datetime
 from pytz import timezone
+import us_finance_streaming_data_miner.ingest.streaming.export_format as export_format
 
 def load(filename):
     with open(filename, 'r') as ymlfile:
@@ -43,3 +44,57 @@ def get_market_ingest_end(cfg):
     '''
     t = datetime.datetime.strptime(cfg['market']['ingest_end'], '%H:%M:%S')
     return datetime.time(t.hour, t.minute, t.second, tzinfo=get_tz(cfg))
+
+def get_export_format(cfg):
+    '''
+    Get the ExportFormat of the minute and daily files, csv if not configured.
+
+    :param cfg:
+    :return:
+    '''
+    export_cfg = cfg.get('export') or {}
+    return export_format.get_export_format(export_cfg.get('format', 'csv'), export_cfg.get('compression'))
+
+def get_export_partition_by_date(cfg):
+    export_cfg = cfg.get('export') or {}
+    return bool(export_cfg.get('partition_by_date', False))
+
+def get_export_segment_dir(cfg):
+    '''
+    Get the directory the minute bars are persisted to during the session, None if not configured.
+
+    :param cfg:
+    :return:
+    '''
+    export_cfg = cfg.get('export') or {}
+    return export_cfg.get('segment_dir')
+
+def get_history_path(cfg):
+    '''
+    Get the file the run dates are saved to, None if not configured.
+
+    :param cfg:
+    :return:
+    '''
+    recovery_cfg = cfg.get('recovery') or {}
+    return recovery_cfg.get('history_path')
+
+def get_snapshot_dir(cfg):
+    '''
+    Get the directory the aggregations are snapshotted to during the session, None if not configured.
+
+    :param cfg:
+    :return:
+    '''
+    recovery_cfg = cfg.get('recovery') or {}
+    return recovery_cfg.get('snapshot_dir')
+
+def get_snapshot_interval_seconds(cfg):
+    '''
+    Get the seconds between the snapshots of the aggregations, 60 if not configured.
+
+    :param cfg:
+    :return:
+    '''
+    recovery_cfg = cfg.get('recovery') or {}
+    return float(recovery_cfg.get('snapshot_interval_seconds', 60))
@@ -0,0 +1,197 @@
+import argparse, datetime, json, os, platform, statistics, subprocess, sys, time
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Aggregations
+from us_finance_streaming_data_miner.ingest.streaming.aggregation_benchmark import new_daily_aggregations, new_trades, new_bars_with_time
+from us_finance_streaming_data_miner.ingest.streaming.decode import decode_events, get_decoder_names, get_loads
+from us_finance_streaming_data_miner.ingest.streaming.decode_benchmark import new_polygon_payloads
+from us_finance_streaming_data_miner.ingest.streaming.trade_signal import TradeSignal
+import us_finance_streaming_data_miner.util.logging as logging
+
+_RESULTS_DIR = 'benchmark_results'
+_REGRESSION_THRESHOLD = 0.2
+_CHANGE_WINDOW_MINUTES = 10
+_QUERY_RANGE_MINUTES = 30
+
+# the scale of a trading day: symbols, minutes, trades and payloads of events_per_payload trades
+_FULL_SCALE = {'symbols': 3500, 'minutes': 390, 'trades': 1000000, 'payloads': 20000, 'events_per_payload': 50}
+_QUICK_SCALE = {'symbols': 350, 'minutes': 390, 'trades': 100000, 'payloads': 2000, 'events_per_payload': 50}
+
+
+def _setup_on_trade(scale):
+    trades = new_trades(scale['symbols'], scale['trades'], scale['minutes'])
+    def setup():
+        aggregations = Aggregations()
+        return lambda: [aggregations.on_trade(trade) for trade in trades]
+    return setup, len(trades)
+
+def _setup_on_bar_with_time(scale):
+    bars_with_time = new_bars_with_time(scale['symbols'], scale['minutes'])
+    def setup():
+        aggregations = Aggregations()
+        return lambda: [aggregations.on_bar_with_time(bar_with_time) for bar_with_time in bars_with_time]
+    return setup, len(bars_with_time)
+
+def _setup_get_minute_df(scale):
+    aggregations = new_daily_aggregations(scale['symbols'], scale['minutes'])
+    return lambda: lambda: aggregations.get_minute_df(print_log=False), scale['symbols'] * scale['minutes']
+
+def _setup_get_daily_df(scale):
+    aggregations = new_daily_aggregations(scale['symbols'], scale['minutes'])
+    return lambda: lambda: aggregations.get_daily_df(print_log=False), scale['symbols']
+
+def _setup_get_change_df(scale):
+    # the change of every symbol over the last minutes, as the signals query it at a minute close
+    signals = {}
+    for trade in new_trades(scale['symbols'], scale['symbols'] * scale['minutes'], scale['minutes']):
+        signal = signals.get(trade.symbol)
+        if signal is None:
+            signal = TradeSignal(100, trade.symbol)
+            signals[trade.symbol] = signal
+        signal.on_trade(trade)
+    def setup():
+        return lambda: [signal.get_change_df('close', _CHANGE_WINDOW_MINUTES, _QUERY_RANGE_MINUTES) for signal in signals.values()]
+    return setup, len(signals)
+
+def _new_setup_decode(decoder_name):
+    def setup_decode(scale):
+        payloads = new_polygon_payloads(scale['payloads'], scale['events_per_payload'])
+        loads = get_loads(decoder_name)
+        return lambda: lambda: [decode_events(data, loads) for data in payloads], scale['payloads'] * scale['events_per_payload']
+    return setup_decode
+
+def get_benchmarks():
+    '''
+    :return: list of (name, setup) where setup(scale) prepares the inputs untimed and returns (new_run, op_cnt),
+        new_run() giving a fresh function to time, which runs op_cnt operations.
+    '''
+    benchmarks = [
+        ('Aggregations.on_trade', _setup_on_trade),
+        ('Aggregations.on_bar_with_time', _setup_on_bar_with_time),
+        ('Aggregations.get_minute_df', _setup_get_minute_df),
+        ('DailyAggregations.get_daily_df', _setup_get_daily_df),
+        ('TradeSignal.get_change_df', _setup_get_change_df),
+    ]
+    benchmarks.extend(('decode_events[{name}]'.format(name=name), _new_setup_decode(name)) for name in get_decoder_names())
+    return benchmarks
+
+def _git(*args):
+    try:
+        return subprocess.run(('git',) + args, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def run_benchmark(setup, scale, repeat):
+    '''
+    Times a benchmark repeat times, each on fresh state.
+
+    :return: dict of the seconds of the runs, their min and median, and the microseconds per operation of the min.
+    '''
+    new_run, op_cnt = setup(scale)
+    seconds = []
+    for _ in range(repeat):
+        f = new_run()
+        t_1 = time.perf_counter()
+        f()
+        seconds.append(time.perf_counter() - t_1)
+    return {'op_cnt': op_cnt, 'seconds': seconds, 'min_seconds': min(seconds), 'median_seconds': statistics.median(seconds),
+        'us_per_op': min(seconds) / op_cnt * 1e6}
+
+def run(scale, repeat, name_filter = None):
+    '''
+    :return: the result dict, keyed by the commit and with the environment, to be saved and compared across commits.
+    '''
+    results = {}
+    for name, setup in get_benchmarks():
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = run_benchmark(setup, scale, repeat)
+        print('{name}: {op_cnt} ops, min {min_seconds:.3f} seconds, median {median_seconds:.3f} seconds, {us_per_op:.2f} microseconds per op'.format(
+            name=name, **results[name]))
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'saved_at': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_cnt': os.cpu_count(),
+        'scale': scale,
+        'repeat': repeat,
+        'results': results,
+    }
+
+def save_result(result, results_dir = _RESULTS_DIR):
+    '''
+    Saves the result as results_dir/<commit>.json, replacing an earlier run on the same commit,
+    or as results_dir/<commit>-dirty.json if the working tree had uncommitted changes.
+    '''
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, '{commit}{suffix}.json'.format(commit=result['commit'][:12] or 'unknown',
+        suffix='-dirty' if result['dirty'] else ''))
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    return path
+
+def load_results(results_dir = _RESULTS_DIR):
+    '''
+    :return: list of the saved results, oldest first.
+    '''
+    if not os.path.isdir(results_dir):
+        return []
+    results = []
+    for filename in os.listdir(results_dir):
+        if filename.endswith('.json'):
+            with open(os.path.join(results_dir, filename), 'r') as f:
+                results.append(json.load(f))
+    return sorted(results, key=lambda result: result['saved_at'])
+
+def find_baseline(result, results_dir = _RESULTS_DIR, commit = None):
+    '''
+    Finds the result to compare with: the one of the given commit, or else the latest one of another commit at the same scale.
+    '''
+    for baseline in reversed(load_results(results_dir)):
+        if commit:
+            if baseline['commit'].startswith(commit):
+                return baseline
+        elif baseline['commit'] != result['commit'] and baseline['scale'] == result['scale']:
+            return baseline
+    return None
+
+def compare(result, baseline, threshold = _REGRESSION_THRESHOLD):
+    '''
+    Compares the min seconds of the benchmarks in both results.
+
+    :return: the names of the benchmarks slower than the baseline by more than the threshold ratio.
+    '''
+    print('compared with {commit} saved at {saved_at}'.format(commit=baseline['commit'][:12], saved_at=baseline['saved_at']))
+    regressions = []
+    for name, benchmark in result['results'].items():
+        benchmark_baseline = baseline['results'].get(name)
+        if not benchmark_baseline:
+            continue
+        ratio = benchmark['min_seconds'] / benchmark_baseline['min_seconds']
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(name)
+        print('{name}: {baseline_seconds:.3f} -> {seconds:.3f} seconds, x{ratio:.2f}{mark}'.format(
+            name=name, baseline_seconds=benchmark_baseline['min_seconds'], seconds=benchmark['min_seconds'], ratio=ratio,
+            mark=' REGRESSION' if regressed else ''))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-q", "--quick", action='store_true', help="run at a tenth of the symbols and the trades of a trading day.")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="number of timed runs per benchmark, the min is compared.")
+    parser.add_argument("-k", "--filter", default=None, help="run only the benchmarks whose name contains this.")
+    parser.add_argument("-d", "--results_dir", default=_RESULTS_DIR, help="directory the results are saved to, one json per commit, suffixed with -dirty for uncommitted changes.")
+    parser.add_argument("-c", "--compare", default=None, help="commit to compare with, the latest saved other commit if not given.")
+    parser.add_argument("-t", "--threshold", type=float, default=_REGRESSION_THRESHOLD, help="slowdown ratio reported as a regression.")
+    parser.add_argument("--no_save", action='store_true', help="do not save the result.")
+    args = parser.parse_args()
+    logging.set_sink(logging.LocalSink())
+
+    result = run(_QUICK_SCALE if args.quick else _FULL_SCALE, args.repeat, args.filter)
+    baseline = find_baseline(result, args.results_dir, args.compare)
+    if not args.no_save:
+        print('saved to {path}'.format(path=save_result(result, args.results_dir)))
+    regressions = compare(result, baseline, args.threshold) if baseline else []
+    sys.exit(1 if regressions else 0)
@@ -1,6 +1,27 @@
 
 # import to include the unit test in the module
 from us_finance_streaming_data_miner.ingest.streaming.aggregation_test import *
+from us_finance_streaming_data_miner.ingest.streaming.bar_buffer_test import *
+from us_finance_streaming_data_miner.ingest.streaming.matrix_aggregation_test import *
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation_test import *
+from us_finance_streaming_data_miner.ingest.streaming.batch_ingest_test import *
+from us_finance_streaming_data_miner.ingest.streaming.decode_test import *
+from us_finance_streaming_data_miner.ingest.streaming.sharding_test import *
+from us_finance_streaming_data_miner.ingest.streaming.shard_supervisor_test import *
+from us_finance_streaming_data_miner.ingest.streaming.indicators_test import *
+from us_finance_streaming_data_miner.ingest.streaming.export_format_test import *
+from us_finance_streaming_data_miner.ingest.streaming.segment_writer_test import *
+from us_finance_streaming_data_miner.ingest.streaming.snapshot_test import *
+from us_finance_streaming_data_miner.ingest.streaming.bar_fanout_test import *
+from us_finance_streaming_data_miner.ingest.streaming.polygon_run_test import *
+from us_finance_streaming_data_miner.ingest.streaming.binance_run_test import *
+from us_finance_streaming_data_miner.history.history_test import *
+from us_finance_streaming_data_miner.upload.daily_test import *
+from us_finance_streaming_data_miner.publish.publish_test import *
+from us_finance_streaming_data_miner.util.logging_test import *
+from us_finance_streaming_data_miner.util.single_writer_test import *
+from us_finance_streaming_data_miner.util.minute_clock_test import *
+from us_finance_streaming_data_miner.util.fake_pubsub_test import *
 
 if __name__ == '__main__':
   unittest.main()
@@ -9,8 +9,8 @@ import us_finance_streaming_data_miner.util.logging as logging
 from us_finance_streaming_data_miner.ingest.streaming.polygon_run import PolygonAggregationsMockRun
 
 
-def run():
-    polygon_run = PolygonAggregationsMockRun()
+def run(recorded_path, speed, batched):
+    polygon_run = PolygonAggregationsMockRun(recorded_path = recorded_path, speed = speed, batched = batched)
 
     while True:
         polygon_run.on_daily_trade_start()
@@ -23,5 +23,8 @@ def run():
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--recorded", default=None, help="recorded Pub/Sub messages to replay, one JSON per line.")
+    parser.add_argument("-s", "--speed", type=float, default=None, help="replay speed, 1 for the wall clock, as fast as possible if not given.")
+    parser.add_argument("-b", "--batched", action='store_true', help="ingest the messages in batches.")
     args = parser.parse_args()
-    run()
+    run(args.recorded, args.speed, args.batched)
@@ -1,42 +1,158 @@
-import asyncio, json, datetime, time, threading
+import argparse, asyncio, functools, json, time
+import numpy as np
 import websockets
+import us_finance_streaming_data_miner.util.symbols
 
-async def run(websocket, path):
-    greeting = f"Hello to the mock server!"
-    await websocket.send(greeting)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PROFILE_FLAT = 'flat'
+PROFILE_SESSION = 'session'
+_SESSION_MINUTES = 390
+_TICK_SECONDS = 0.01
+_STATS_INTERVAL_SECONDS = 10.0
 
-    auth_msg = await websocket.recv()
-    on_auth_message(auth_msg)
-    await websocket.send("authenticated by the server")
 
-    async def generate_signals():
-        while True:
-            await websocket.send(generate_a_signal())
-            time.sleep(1)
+def _dumps(obj):
+    if orjson:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(',', ':'))
 
+class LoadProfile:
     '''
-    signal_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(signal_loop)
-    signal_loop.run_until_complete(generate_signals())
+    The rate of the events over a simulated trading session.
+
+    The session profile bursts at the open, decaying from open_multiplier times the rate to the rate over
+    burst_minutes, and at the close, rising to close_multiplier times the rate over the last burst_minutes.
+    speed is the session minutes per wall clock minute, to go through a session in a short run.
     '''
+    def __init__(self, rate, profile = PROFILE_SESSION, burst_minutes = 30, open_multiplier = 3.0, close_multiplier = 2.0, speed = 1.0):
+        '''
 
-    #th = threading.Thread(target=generate_signals)
-    #th.start()
+        :param rate: events per second outside of the bursts
+        '''
+        self.rate = rate
+        self.profile = profile
+        self.burst_minutes = burst_minutes
+        self.open_multiplier = open_multiplier
+        self.close_multiplier = close_multiplier
+        self.speed = speed
 
-    #'''
-    msg = await websocket.recv()
-    on_subs_message(msg)
+    def get_session_minute(self, elapsed_seconds):
+        return (elapsed_seconds * self.speed / 60) % _SESSION_MINUTES
 
-    while True:
-        await websocket.send(generate_a_signal())
-        time.sleep(1)
-    #'''
+    def get_rate(self, elapsed_seconds):
+        if self.profile == PROFILE_FLAT:
+            return self.rate
+        minute = self.get_session_minute(elapsed_seconds)
+        if minute < self.burst_minutes:
+            multiplier = self.open_multiplier + (1 - self.open_multiplier) * minute / self.burst_minutes
+        elif minute > _SESSION_MINUTES - self.burst_minutes:
+            multiplier = 1 + (self.close_multiplier - 1) * (minute - _SESSION_MINUTES + self.burst_minutes) / self.burst_minutes
+        else:
+            multiplier = 1.0
+        return self.rate * multiplier
+
+class EventGenerator:
+    '''
+    Generates polygon T (trade) and A (second aggregate) events over a universe of symbols.
+    The symbols are picked with a Zipf like popularity and their prices follow random walks.
+    '''
+    def __init__(self, symbols, trade_ratio = 0.8, seed = 0):
+        '''
+
+        :param trade_ratio: the fraction of T events, the rest being A events.
+        '''
+        self.rng = np.random.default_rng(seed)
+        self.symbols = list(symbols)
+        popularity = 1.0 / np.arange(1, len(self.symbols) + 1)
+        self.rng.shuffle(popularity)
+        self.weights = popularity / popularity.sum()
+        self.prices = np.round(np.exp(self.rng.normal(3.5, 1.0, size=len(self.symbols))), 2)
+        self.trade_ratio = trade_ratio
+
+    def set_symbols(self, symbols):
+        '''
+        Restricts the events to the subscribed symbols that are in the universe.
+        '''
+        subscribed = set(symbols)
+        weights = np.where([symbol in subscribed for symbol in self.symbols], self.weights, 0)
+        if weights.sum():
+            self.weights = weights / weights.sum()
+
+    def generate(self, n, now_ms):
+        '''
+        :return: list of n event dicts stamped at now_ms.
+        '''
+        indices = self.rng.choice(len(self.symbols), size=n, p=self.weights)
+        self.prices[indices] = np.maximum(np.round(self.prices[indices] * (1 + self.rng.normal(0, 0.0005, size=n)), 2), 0.01)
+        prices = self.prices[indices].tolist()
+        is_trades = (self.rng.random(n) < self.trade_ratio).tolist()
+        sizes = self.rng.integers(1, 500, size=n).tolist()
+        events = []
+        for i, symbol_index in enumerate(indices.tolist()):
+            symbol, price, size = self.symbols[symbol_index], prices[i], sizes[i]
+            if is_trades[i]:
+                events.append({'ev': 'T', 'sym': symbol, 'p': price, 's': size, 't': now_ms})
+            else:
+                events.append({'ev': 'A', 'sym': symbol, 'o': price, 'h': price, 'l': price, 'c': price, 'v': size,
+                    's': now_ms - 1000, 'e': now_ms})
+        return events
 
+async def generate_signals(websocket, generator, load_profile, max_events_per_message):
     '''
+    Sends the events at the rate of the load profile, in messages of at most max_events_per_message events.
+    The sends are awaited and the pacing sleeps without blocking the event loop.
+    '''
+    start = last = time.monotonic()
+    due = 0.0
+    sent_cnt, stats_cnt, stats_start = 0, 0, start
     while True:
-        msg = await websocket.recv()
-        on_subs_message(msg)
-    #'''
+        now = time.monotonic()
+        due += load_profile.get_rate(now - start) * (now - last)
+        last = now
+        n = int(due)
+        due -= n
+        if n:
+            events = generator.generate(n, int(time.time() * 1000))
+            for i in range(0, n, max_events_per_message):
+                await websocket.send(_dumps(events[i:i + max_events_per_message]))
+            sent_cnt += n
+            stats_cnt += n
+        if now - stats_start >= _STATS_INTERVAL_SECONDS:
+            print('sent {cnt} events, {rate:.0f} events per second, session minute {minute:.0f}'.format(
+                cnt=sent_cnt, rate=stats_cnt / (now - stats_start), minute=load_profile.get_session_minute(now - start)))
+            stats_cnt, stats_start = 0, now
+        await asyncio.sleep(_TICK_SECONDS)
+
+async def run(websocket, args):
+    greeting = f"Hello to the mock server!"
+    await websocket.send(greeting)
+
+    auth_msg = await websocket.recv()
+    on_auth_message(auth_msg)
+    await websocket.send("authenticated by the server")
+
+    msg = await websocket.recv()
+    generator = EventGenerator(us_finance_streaming_data_miner.util.symbols.get_symbols_nasdaq(), args.trade_ratio, args.seed)
+    generator.set_symbols(on_subs_message(msg))
+    load_profile = LoadProfile(args.rate, args.profile, args.burst_minutes, args.open_multiplier, args.close_multiplier, args.speed)
+
+    async def receive_messages():
+        async for msg in websocket:
+            on_subs_message(msg)
+
+    tasks = [asyncio.create_task(generate_signals(websocket, generator, load_profile, args.max_events_per_message)),
+             asyncio.create_task(receive_messages())]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        ex = task.exception()
+        if ex and not isinstance(ex, websockets.ConnectionClosed):
+            raise ex
 
 def on_auth_message(msg_strs):
     if not msg_strs:
@@ -44,24 +160,19 @@ def on_auth_message(msg_strs):
     print('on_auth_message', msg_strs)
 
 def on_subs_message(msg_strs):
+    '''
+    :return: the symbols subscribed to, e.g. AAPL of "T.AAPL,A.AAPL", none if all (*) are.
+    '''
     if not msg_strs:
         print('the subs message is not valid')
-    print('on_subs_message', msg_strs)
-
-def generate_a_signal():
-    signal = {
-        "ev": "A"
-    }
-    epoch_s = datetime.datetime.now().timestamp()
-    epoch_s_int = int(epoch_s)
-    syms = ['AABA', 'AAPL', 'ABIO']
-    signal['sym'] = syms[epoch_s_int % 3]
-    signal['c'] = 100 + (int(epoch_s * 100) % 20)
-    signal['v'] = 1
-    signal['s'] = int(epoch_s_int)
-
-    print('about to generate A signal', signal)
-    return json.dumps([signal])
+        return []
+    print('on_subs_message', msg_strs[:200])
+    try:
+        params = json.loads(msg_strs).get('params', '')
+    except (ValueError, AttributeError):
+        return []
+    symbols = [param.split('.', 1)[-1] for param in params.split(',') if param]
+    return [symbol for symbol in symbols if symbol != '*']
 
 def on_message(msg_strs):
     if not msg_strs:
@@ -70,7 +181,22 @@ def on_message(msg_strs):
     msg_js = json.loads(msg_strs)
     print('on_message', msg_js)
 
+async def main(args):
+    async with websockets.serve(functools.partial(run, args=args), args.host, args.port):
+        await asyncio.Future()
+
 if __name__ == '__main__':
-    start_server = websockets.serve(run, "localhost", 8765)
-    asyncio.get_event_loop().run_until_complete(start_server)
-    asyncio.get_event_loop().run_forever()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost", help="host to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on.")
+    parser.add_argument("-r", "--rate", type=float, default=1000, help="events per second outside of the bursts.")
+    parser.add_argument("-p", "--profile", default=PROFILE_SESSION, choices=[PROFILE_FLAT, PROFILE_SESSION], help="load profile over the session.")
+    parser.add_argument("--burst_minutes", type=int, default=30, help="minutes of the bursts after the open and before the close.")
+    parser.add_argument("--open_multiplier", type=float, default=3.0, help="rate multiplier at the open.")
+    parser.add_argument("--close_multiplier", type=float, default=2.0, help="rate multiplier at the close.")
+    parser.add_argument("-s", "--speed", type=float, default=1.0, help="session minutes per wall clock minute.")
+    parser.add_argument("-t", "--trade_ratio", type=float, default=0.8, help="fraction of T events, the rest being A events.")
+    parser.add_argument("-m", "--max_events_per_message", type=int, default=1000, help="maximum events per websocket message.")
+    parser.add_argument("--seed", type=int, default=0, help="random seed.")
+    args = parser.parse_args()
+    asyncio.run(main(args))
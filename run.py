@@ -6,41 +6,62 @@ import us_finance_streaming_data_miner.history.history
 import us_finance_streaming_data_miner.util.time
 import config
 import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregations
 from us_finance_streaming_data_miner.ingest.streaming.polygon_run import PolygonAggregationsRun
+import us_finance_streaming_data_miner.ingest.streaming.snapshot as snapshot
+from us_finance_streaming_data_miner.ingest.streaming.segment_writer import SegmentWriter
+from us_finance_streaming_data_miner.ingest.streaming.batch_ingest import DEFAULT_MAX_MESSAGES, DEFAULT_MAX_BYTES
 import us_finance_streaming_data_miner.upload.daily as daily_upload
 
+_BASE_DIR = 'data'
 
-def run(forcerun):
+def run(forcerun, batched, max_messages, max_bytes):
     cfg = config.load('config.us.yaml')
     tz = config.get_tz(cfg)
-    polygon_run = PolygonAggregationsRun(subscription_id = os.getenv('FINANCE_STREAM_INTRADAY_PUBSUB_SUBSCRIPTION_ID'))
+    history_path = config.get_history_path(cfg)
+    if history_path:
+        us_finance_streaming_data_miner.history.history.load(history_path)
+    # the minute bars are flushed to the segments during the session, so a crash does not lose them
+    segment_dir = config.get_export_segment_dir(cfg)
+    segment_writer = SegmentWriter(segment_dir).start() if segment_dir else None
+    # recovered before the ingestion starts, in case the process restarted during the session
+    aggregations = DailyAggregations()
+    snapshot_dir = config.get_snapshot_dir(cfg)
+    if snapshot_dir:
+        snapshot.recover(aggregations, snapshot_dir, segment_writer)
+    polygon_run = PolygonAggregationsRun(aggregations = aggregations, subscription_id = os.getenv('FINANCE_STREAM_INTRADAY_PUBSUB_SUBSCRIPTION_ID'),
+                                         batched = batched, max_messages = max_messages, max_bytes = max_bytes,
+                                         export_format = config.get_export_format(cfg), partition_by_date = config.get_export_partition_by_date(cfg),
+                                         segment_writer = segment_writer)
+    if snapshot_dir:
+        threading.Thread(target=save_snapshots, args=(polygon_run, snapshot_dir, config.get_snapshot_interval_seconds(cfg),), daemon=True).start()
 
     while True:
         dt = us_finance_streaming_data_miner.util.time.get_utcnow().astimezone(tz)
         dt_str = str(dt.date())
 
         if dt.weekday() >= 5:
-            logging.info('skipping the routing during weekend, weekday: {weekday} for {dt_str}'.format(
-                weekday=dt.weekday(), dt_str=dt_str))
+            logging.info('skipping the routing during weekend, weekday: {weekday} for {dt_str}',
+                weekday=dt.weekday(), dt_str=dt_str)
             time.sleep(60 * 60)
             continue
 
 
-        logging.info('checking if run for {date_str} should be done'.format(date_str=dt_str))
+        logging.info('checking if run for {date_str} should be done', date_str=dt_str)
         if not forcerun and us_finance_streaming_data_miner.history.history.did_run_today(cfg):
-            logging.info('run for {date_str} is already done'.format(date_str=dt_str))
+            logging.info('run for {date_str} is already done', date_str=dt_str)
             time.sleep(10 * 60)
             continue
 
         t_market_open = config.get_market_open(cfg)
         while True:
             t_cur = us_finance_streaming_data_miner.util.time.get_utcnow().astimezone(tz).time()
-            logging.info(cfg, 'checking if the schedule time for {dt_str} has reached'.format(dt_str=dt_str))
+            logging.info('checking if the schedule time for {dt_str} has reached', dt_str=dt_str)
             if forcerun or t_cur > t_market_open:
                 polygon_run.on_daily_trade_start()
                 break
 
-            logging.info(cfg, 'schedule time {t_run_after} not yet reached at {t_cur}'.format(t_run_after=t_market_open, t_cur=t_cur))
+            logging.info('schedule time {t_run_after} not yet reached at {t_cur}', t_run_after=t_market_open, t_cur=t_cur)
             time.sleep(10 * 60)
 
         if forcerun:
@@ -49,23 +70,43 @@ def run(forcerun):
         t_ingest_end = config.get_market_ingest_end(cfg)
         while True:
             t_cur = us_finance_streaming_data_miner.util.time.get_utcnow().astimezone(tz).time()
-            logging.info(cfg, 'checking if the schedule time for {dt_str} has reached'.format(dt_str=dt_str))
+            logging.info('checking if the schedule time for {dt_str} has reached', dt_str=dt_str)
             logging.info(polygon_run.get_status_string())
             if forcerun or t_cur > t_ingest_end:
-                polygon_run.save_daily_df()
-                daily_upload.upload()
+                # saves the minute and the daily files, in the configured format and partitions
+                polygon_run.on_daily_trade_end(_BASE_DIR)
+                upload_result = daily_upload.upload_session(_BASE_DIR, dt_str, config.get_export_partition_by_date(cfg))
+                if upload_result.failed:
+                    logging.error('failed to upload {failed} for {dt_str}', failed=upload_result.failed, dt_str=dt_str)
 
-                polygon_run.on_daily_trade_end()
                 us_finance_streaming_data_miner.history.history.on_run(cfg)
+                if snapshot_dir:
+                    snapshot.remove_snapshots(snapshot_dir)
                 break
 
-            logging.info(cfg, 'schedule time {t_run_after} not yet reached at {t_cur}'.format(t_run_after=t_ingest_end, t_cur=t_cur))
+            logging.info('schedule time {t_run_after} not yet reached at {t_cur}', t_run_after=t_ingest_end, t_cur=t_cur)
             time.sleep(10 * 60)
 
         if forcerun:
             # forcerun runs only once
             break
 
+    polygon_run.minute_clock.stop()
+    if segment_writer:
+        segment_writer.stop()
+
+def save_snapshots(polygon_run, snapshot_dir, interval_seconds):
+    '''
+    Snapshots the aggregations every interval_seconds during the session, much more often than the schedule is polled,
+    so a restart replays only the bars flushed to the segments since.
+    '''
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            polygon_run.save_snapshot(snapshot_dir)
+        except Exception as ex:
+            logging.error('failed to save the snapshot to {snapshot_dir}: {ex}', snapshot_dir=snapshot_dir, ex=ex)
+
 def log_heartbeat():
     while True:
         logging.info("us_finance_streaming_data_miner: heartbeat message.")
@@ -74,9 +115,12 @@ def log_heartbeat():
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--forcerun", action="store_true", help="forces run without waiting without observing the schedule.")
+    parser.add_argument("-b", "--batched", action="store_true", help="applies the messages in batches, acking them after being applied.")
+    parser.add_argument("--max_messages", type=int, default=DEFAULT_MAX_MESSAGES, help="maximum number of outstanding messages, the client library default if not given.")
+    parser.add_argument("--max_bytes", type=int, default=DEFAULT_MAX_BYTES, help="maximum bytes of outstanding messages, the client library default if not given.")
     args = parser.parse_args()
 
     threading.Thread(target=log_heartbeat).start()
     if args.forcerun:
         print('forcerun on')
-    run(args.forcerun)
+    run(args.forcerun, args.batched, args.max_messages, args.max_bytes)
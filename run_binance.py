@@ -4,23 +4,42 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(os.getcwd(), 'creden
 import time, datetime, threading
 import us_finance_streaming_data_miner.util.logging as logging
 from us_finance_streaming_data_miner.ingest.streaming.binance_run import BinanceAggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.batch_ingest import DEFAULT_MAX_MESSAGES, DEFAULT_MAX_BYTES
+from us_finance_streaming_data_miner.ingest.streaming.shard_supervisor import ShardSupervisor, run_loop
 
-def run(subscription_id, shard_id, shard_size):
-    logging.info('starting the job: {dt_str}'.format(dt_str=datetime.datetime.now()))
-    _ = BinanceAggregationsRun(shard_id = shard_id, shard_size = shard_size, subscription_id = subscription_id)
+def run(subscription_id, shard_id, shard_size, batched, max_messages, max_bytes):
+    logging.info('starting the job: {dt_str}', dt_str=datetime.datetime.now())
+    _ = BinanceAggregationsRun(shard_id = shard_id, shard_size = shard_size, subscription_id = subscription_id,
+                               batched = batched, max_messages = max_messages, max_bytes = max_bytes)
 
-def log_heartbeat():
+def run_supervisor(subscription_id, workers, max_messages, max_bytes):
+    logging.info('starting the job with {workers} shard workers: {dt_str}', workers=workers, dt_str=datetime.datetime.now())
+    supervisor = ShardSupervisor(workers)
+    threading.Thread(target=run_loop, args=(supervisor, subscription_id, max_messages, max_bytes,)).start()
+    return supervisor
+
+def log_heartbeat(supervisor = None):
     while True:
         logging.info("us_finance_streaming_data_miner: heartbeat message.")
+        if supervisor:
+            logging.info(supervisor.get_status_string())
         time.sleep(30 * 60)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     pubsub_id_default = os.getenv('BINANCE_STREAM_INTRADAY_PUBSUB_SUBSCRIPTION_ID')
     parser.add_argument("-s", "--subscription_id", default=pubsub_id_default, help="pubsub subscription id to read the stream from.")
-    parser.add_argument("-i", "--shard_id", default=0, help="zero-based shard id.")
-    parser.add_argument("-z", "--shard_size", default=1, help="total number of shards.")
+    parser.add_argument("-i", "--shard_id", type=int, default=0, help="zero-based shard id.")
+    parser.add_argument("-z", "--shard_size", type=int, default=1, help="total number of shards.")
+    parser.add_argument("-b", "--batched", action="store_true", help="applies the messages in batches, acking them after being applied.")
+    parser.add_argument("--max_messages", type=int, default=DEFAULT_MAX_MESSAGES, help="maximum number of outstanding messages, the client library default if not given.")
+    parser.add_argument("--max_bytes", type=int, default=DEFAULT_MAX_BYTES, help="maximum bytes of outstanding messages, the client library default if not given.")
+    parser.add_argument("-w", "--workers", type=int, default=0, help="runs this many shard worker processes under a supervisor, instead of the single shard given by shard_id and shard_size.")
     args = parser.parse_args()
 
-    threading.Thread(target=log_heartbeat).start()
-    run(args.subscription_id, args.shard_id, args.shard_size)
+    if args.workers:
+        supervisor = run_supervisor(args.subscription_id, args.workers, args.max_messages, args.max_bytes)
+        threading.Thread(target=log_heartbeat, args=(supervisor,)).start()
+    else:
+        threading.Thread(target=log_heartbeat).start()
+        run(args.subscription_id, args.shard_id, args.shard_size, args.batched, args.max_messages, args.max_bytes)
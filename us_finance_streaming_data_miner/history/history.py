@@ -1,9 +1,26 @@
+import os
 import config
 import us_finance_streaming_data_miner.util.time as util_time
 
 _run_dates = set()
+# file the run dates are appended to, so a restarted process knows the days already run
+_history_path = None
 
 
+def load(path):
+    '''
+    Loads the run dates saved to the path, and appends the later runs to it.
+    '''
+    global _history_path
+    _history_path = path
+    if not os.path.exists(path):
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            dt_str = line.strip()
+            if dt_str:
+                _run_dates.add(dt_str)
+
 def _did_run_today_run_dates(cfg):
     tz = config.get_tz(cfg)
     dt_str = str(util_time.get_utcnow().astimezone(tz).date())
@@ -21,4 +38,13 @@ def did_run_today(cfg):
 
 def on_run(cfg):
     global _run_dates
-    _run_dates.add(util_time.get_today_str_tz(cfg))
+    dt_str = util_time.get_today_str_tz(cfg)
+    _run_dates.add(dt_str)
+    if _history_path:
+        dir_name = os.path.dirname(_history_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        with open(_history_path, 'a') as f:
+            f.write(dt_str + '\n')
+            f.flush()
+            os.fsync(f.fileno())
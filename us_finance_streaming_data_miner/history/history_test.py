@@ -0,0 +1,24 @@
+import unittest, os, tempfile
+
+import us_finance_streaming_data_miner.history.history as history
+
+_CFG = {'market': {'timezone': 'US/EASTERN'}}
+
+class TestHistory(unittest.TestCase):
+    def tearDown(self):
+        history._run_dates.clear()
+        history._history_path = None
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            path = os.path.join(base_dir, 'history', 'history.txt')
+            history.load(path)
+            self.assertFalse(history.did_run_today(_CFG))
+            history.on_run(_CFG)
+            self.assertTrue(history.did_run_today(_CFG))
+
+            # a restarted process
+            history._run_dates.clear()
+            self.assertFalse(history.did_run_today(_CFG))
+            history.load(path)
+            self.assertTrue(history.did_run_today(_CFG))
@@ -1,7 +1,11 @@
 import pandas as pd, numpy as np
-import datetime, os
+import copy, datetime, functools, os
 import pytz
 import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.util.single_writer import SingleWriter
+from us_finance_streaming_data_miner.ingest.streaming.bar_buffer import BarRingBuffer, OPEN, HIGH, LOW, CLOSE, VOLUME
+import us_finance_streaming_data_miner.ingest.streaming.snapshot as snapshot
+from us_finance_streaming_data_miner.ingest.streaming.bar_fanout import BarFanout
 
 from enum import Enum
 
@@ -36,6 +40,22 @@ class Bar:
     def to_tuple(self):
         return (self.symbol, self.open, self.high, self.low, self.close, self.volume, )
 
+def datetime_to_epoch_minute(t):
+    return int(t.timestamp()) // 60
+
+def epoch_minute_to_datetime(minute):
+    return datetime.datetime.fromtimestamp(minute * 60, pytz.utc)
+
+_EPOCH_DATE = datetime.date(year=1970, month=1, day=1)
+# the minutes a minute stays open after its end on the clock, for the trades delivered late
+_CLOSE_LAG_MINUTES = 1
+
+def epoch_minute_to_date(minute):
+    '''
+    :return: the utc date of the epoch minute.
+    '''
+    return _EPOCH_DATE + datetime.timedelta(days=minute // (24 * 60))
+
 class BarWithTime:
     def truncate_to_minute(timestamp_seconds):
         t = datetime.datetime.utcfromtimestamp(timestamp_seconds)
@@ -43,15 +63,42 @@ class BarWithTime:
         t_tz_minute = t_tz.replace(second=0, microsecond=0)
         return t_tz_minute
 
-    def __init__(self, time, bar):
+    @staticmethod
+    def truncate_to_epoch_minute(timestamp_seconds):
+        return int(timestamp_seconds) // 60
+
+    def __init__(self, time, bar, epoch_minute = None):
         '''
 
         :param time: datetime instance in utc timezone
         :param bar:
+        :param epoch_minute: the minutes since epoch, given in place of time to materialize the datetime lazily.
         '''
-        self.time = time
+        self._time = time
+        self._epoch_minute = epoch_minute
         self.bar = bar
 
+    @staticmethod
+    def from_epoch_minute(epoch_minute, bar):
+        return BarWithTime(None, bar, epoch_minute)
+
+    @property
+    def time(self):
+        if self._time is None:
+            self._time = epoch_minute_to_datetime(self._epoch_minute)
+        return self._time
+
+    @time.setter
+    def time(self, time):
+        self._time = time
+        self._epoch_minute = None
+
+    @property
+    def epoch_minute(self):
+        if self._epoch_minute is None:
+            self._epoch_minute = datetime_to_epoch_minute(self._time)
+        return self._epoch_minute
+
     def get_next_bar_time(self):
         return self.time + datetime.timedelta(minutes=1)
 
@@ -66,12 +113,176 @@ class BarWithTime:
     def to_tuple(self):
         return (self.time,) + self.bar.to_tuple()
 
+class BarWithTimes:
+    '''
+    List-like view of the bars of an Aggregation.
+    Indexing materializes BarWithTime snapshots; changing them does not change the stored bars.
+    '''
+    def __init__(self, aggregation):
+        self.aggregation = aggregation
+
+    def _bar_with_time_at_slot(self, slot):
+        minute, open_, high, low, close_, volume = self.aggregation.bars.get_bar(slot)
+        return BarWithTime.from_epoch_minute(minute, Bar(self.aggregation.symbol, open_, high, low, close_, volume))
+
+    def __len__(self):
+        return len(self.aggregation.bars)
+
+    def __getitem__(self, i):
+        bars = self.aggregation.bars
+        if isinstance(i, slice):
+            return [self._bar_with_time_at_slot(slot) for slot in bars.ordered_slots()[i]]
+        return self._bar_with_time_at_slot(bars.slot_at(i))
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def append(self, bar_with_time):
+        bar = bar_with_time.bar
+        self.aggregation.bars.append(bar_with_time.epoch_minute, bar.open, bar.high, bar.low, bar.close, bar.volume)
+
+_MINUTES_PER_DAY = 24 * 60
+
+class DailyBar:
+    '''
+    Running OHLCV of the bars of a (utc) day, updated with each bar once its minute is over.
+
+    It is kept apart from the retained bars, so the open of the day is not lost past the retention.
+    A bar of a later day starts the accumulation over.
+    '''
+    def __init__(self):
+        self.first_minute = None
+        self.open, self.high, self.low, self.close, self.volume = None, None, None, None, 0.0
+
+    def on_bar(self, minute, open_, high, low, close_, volume):
+        if self.first_minute is None or minute // _MINUTES_PER_DAY != self.first_minute // _MINUTES_PER_DAY:
+            self.first_minute = minute
+            self.open, self.high, self.low, self.volume = open_, high, low, 0.0
+        else:
+            if high > self.high:
+                self.high = high
+            if low < self.low:
+                self.low = low
+        self.close = close_
+        self.volume += volume
+
 class Aggregation:
     def __init__(self, symbol):
         self.symbol = symbol
-        self.bar_with_times = []
         self._bar_with_times_max_length = 300
+        self.bars = BarRingBuffer(self._bar_with_times_max_length)
         self.t_now_tz = None
+        # functions called with (minute, open, high, low, close, volume) of each bar once its minute is over
+        self.bar_listeners = []
+        self._finalized_minute = None
+        self.daily_bar = DailyBar()
+
+    @property
+    def bar_with_times(self):
+        return BarWithTimes(self)
+
+    @bar_with_times.setter
+    def bar_with_times(self, bar_with_times):
+        self.bars.clear()
+        view = BarWithTimes(self)
+        for bar_with_time in bar_with_times:
+            view.append(bar_with_time)
+        # the bars set replace the history, the listeners are notified of them once their minutes are over
+        self._finalized_minute = None
+        self.daily_bar = DailyBar()
+
+    def add_bar_listener(self, listener, replay = True):
+        '''
+        Adds a function called with (minute, open, high, low, close, volume) of each bar once a later minute starts.
+        The bar still in progress is the last one of self.bars.
+
+        :param replay: if True, the listener is first called with the retained bars that are already over.
+        '''
+        if replay and self._finalized_minute is not None and len(self.bars):
+            for slot in self.bars.ordered_slots(0, max(self._finalized_minute - self.bars.first_minute + 1, 0)):
+                listener(*self.bars.get_bar(slot))
+        self.bar_listeners.append(listener)
+
+    def _finalize_bars(self, until_minute):
+        '''
+        Notifies the bar_listeners of the bars up to until_minute, which are over.
+        '''
+        if self._finalized_minute is not None and until_minute <= self._finalized_minute:
+            return
+        for slot in self._get_unfinalized_slots(until_minute):
+            bar = self.bars.get_bar(slot)
+            self.daily_bar.on_bar(*bar)
+            for listener in self.bar_listeners:
+                listener(*bar)
+        self._finalized_minute = until_minute
+
+    def _fill_flat_and_finalize(self, fill_minute, finalize_minute):
+        '''
+        Fills the gap up to fill_minute with flat bars and notifies the listeners of the bars up to finalize_minute.
+        The pending bars are notified before the gap is filled, as a gap of the capacity or longer overwrites them.
+        '''
+        self._finalize_bars(min(self.bars.last_minute, finalize_minute))
+        self.bars.append_flat(fill_minute, self.bars.get_last_close())
+        self._finalize_bars(finalize_minute)
+
+    def _get_unfinalized_slots(self, until_minute):
+        '''
+        :return: the slots of the retained bars up to until_minute that the listeners are not notified of yet.
+        '''
+        if not len(self.bars):
+            return []
+        start = max(until_minute - self.bars.capacity + 1, self.bars.first_minute)
+        if self._finalized_minute is not None:
+            start = max(start, self._finalized_minute + 1)
+        return [minute % self.bars.capacity for minute in range(start, min(until_minute, self.bars.last_minute) + 1)]
+
+    def get_daily_tuple(self):
+        '''
+        Gets the daily bar of the day of the latest bar, the bar in progress included.
+
+        :return: a tuple in the order of BarWithTime.get_daily_tuple_names(), None if there is no bar.
+        '''
+        if not len(self.bars):
+            return None
+        daily_bar = copy.copy(self.daily_bar)
+        for slot in self._get_unfinalized_slots(self.bars.last_minute):
+            daily_bar.on_bar(*self.bars.get_bar(slot))
+        return (
+            epoch_minute_to_date(daily_bar.first_minute),
+            self.symbol,
+            daily_bar.open,
+            daily_bar.high,
+            daily_bar.low,
+            daily_bar.close,
+            daily_bar.volume,
+        )
+
+    def get_daily_df(self):
+        daily_tuple = self.get_daily_tuple()
+        return pd.DataFrame([daily_tuple] if daily_tuple else [], columns = BarWithTime.get_daily_tuple_names())
+
+    def get_state(self):
+        '''
+        :return: the state besides the bars arrays, to be given back to restore().
+        '''
+        daily_bar = self.daily_bar
+        return (self.bars.size, self.bars.last_minute, self._finalized_minute,
+            daily_bar.first_minute, daily_bar.open, daily_bar.high, daily_bar.low, daily_bar.close, daily_bar.volume)
+
+    def restore(self, minutes, values, state):
+        '''
+        Restores the bars and their state, e.g. from a snapshot. The listeners are not notified of the restored bars.
+
+        :param minutes: int array of shape (capacity,) of the epoch minutes per slot
+        :param values: float array of shape (5, capacity) of open, high, low, close, volume per slot
+        :param state: tuple given by get_state()
+        '''
+        self.bars.minutes[:] = minutes
+        self.bars.values[:] = values
+        self.bars.size, self.bars.last_minute, self._finalized_minute = state[:3]
+        daily_bar = DailyBar()
+        daily_bar.first_minute, daily_bar.open, daily_bar.high, daily_bar.low, daily_bar.close, daily_bar.volume = state[3:]
+        self.daily_bar = daily_bar
 
     def set_now_tz(self, now_tz):
         self.t_now_tz = now_tz
@@ -84,118 +295,169 @@ class Aggregation:
 
     def _on_first_trade(self, trade):
         assert self.symbol == trade.symbol
-        bar_timestamped = BarWithTime(BarWithTime.truncate_to_minute(trade.timestamp_seconds), Bar.new_bar_with_trade(trade.symbol, trade.price, 0))
-        self.bar_with_times.append(bar_timestamped)
-        self._on_append_new_bar_with_time()
+        minute = BarWithTime.truncate_to_epoch_minute(trade.timestamp_seconds)
+        self.bars.append(minute, trade.price, trade.price, trade.price, trade.price, 0)
 
     def _on_first_bar_with_time(self, bar_with_time):
         assert self.symbol == bar_with_time.bar.symbol
-        bar_timestamped = BarWithTime(bar_with_time.time, bar_with_time.bar)
-        self.bar_with_times.append(bar_timestamped)
-        self._on_append_new_bar_with_time()
+        bar = bar_with_time.bar
+        self.bars.append(bar_with_time.epoch_minute, bar.open, bar.high, bar.low, bar.close, bar.volume)
 
-    def _new_bar_with_zero_volume(self, t, price):
-        bar_timestamped = BarWithTime(t, Bar.new_bar_with_trade(self.symbol, price, 0))
-        self.bar_with_times.append(bar_timestamped)
-        self._on_append_new_bar_with_time()
-
-    def _on_append_new_bar_with_time(self):
-        if len(self.bar_with_times) > self._bar_with_times_max_length:
-            self.bar_with_times = self.bar_with_times[-self._bar_with_times_max_length:]
+    def _new_bar_with_zero_volume(self, minute, price):
+        self.bars.append(minute, price, price, price, price, 0)
 
     def on_trade(self, trade):
         assert self.symbol == trade.symbol
-        if not self.bar_with_times:
+        if not len(self.bars):
             self._on_first_trade(trade)
 
-        trade_t = BarWithTime.truncate_to_minute(trade.timestamp_seconds)
-        while True:
-            bar_with_time = self.bar_with_times[-1]
-            if bar_with_time.time == trade_t:
-                break
+        trade_minute = BarWithTime.truncate_to_epoch_minute(trade.timestamp_seconds)
+        if trade_minute == self.bars.last_minute:
+            self.bars.apply_trade(trade_minute % self.bars.capacity, trade.price, trade.volume)
+            return
 
-            time = bar_with_time.get_next_bar_time()
-            price = bar_with_time.bar.close
-            if time == trade_t:
-                price = trade.price
-            self._new_bar_with_zero_volume(time, price)
+        if trade_minute < self.bars.last_minute:
+            # a late trade only counts towards the bar of its minute if that is still retained
+            slot = self.bars.slot_of(trade_minute)
+            if slot is not None:
+                self.bars.apply_trade(slot, trade.price, trade.volume, update_close=False)
+            return
 
-        bar_with_time = self.bar_with_times[-1]
-        assert bar_with_time.time == trade_t
-        bar_with_time.bar.on_trade(trade)
+        self._fill_flat_and_finalize(trade_minute - 1, trade_minute - 1)
+        self._new_bar_with_zero_volume(trade_minute, trade.price)
+        self.bars.apply_trade(trade_minute % self.bars.capacity, trade.price, trade.volume)
 
     def on_bar_with_time(self, new_bar_with_time):
         assert self.symbol == new_bar_with_time.bar.symbol
-        if not self.bar_with_times:
+        if not len(self.bars):
             self._on_first_bar_with_time(new_bar_with_time)
 
-        bar_t = new_bar_with_time.time
-        cnt = 0
-        while True:
-            cnt += 1
-            if cnt > 100:
-                print('breaking after more than {cnt} loops'.format(cnt=cnt))
-                break
-            bar_with_time = self.bar_with_times[-1]
-            if bar_with_time.time >= bar_t:
-                break
-
-            time = bar_with_time.get_next_bar_time()
-            price = bar_with_time.bar.close
-            if time == bar_t:
-                price = bar_with_time.bar.open
-            self._new_bar_with_zero_volume(time, price)
-
-        if len(self.bar_with_times) == 0:
-            print('bar_with_times has no elements')
-
-        inserted_bar = self.bar_with_times[-1].bar
-        inserted_bar.open = new_bar_with_time.bar.open
-        inserted_bar.high = new_bar_with_time.bar.high
-        inserted_bar.low = new_bar_with_time.bar.low
-        inserted_bar.close = new_bar_with_time.bar.close
-        inserted_bar.volume = new_bar_with_time.bar.volume
+        bar_minute = new_bar_with_time.epoch_minute
+        self._fill_flat_and_finalize(bar_minute, bar_minute - 1)
+
+        slot = self.bars.slot_of(bar_minute)
+        if slot is None:
+            return
+        bar = new_bar_with_time.bar
+        self.bars.set_bar(slot, bar.open, bar.high, bar.low, bar.close, bar.volume)
 
     def get_minute_df(self, range_minutes = None, print_log = True):
         if print_log:
-            print('Aggregation.get_minute_df for {symbol}, {l} total bars, range_minutes: {range_minutes}'.format(
-                symbol=self.symbol, l=len(self.bar_with_times), range_minutes=range_minutes if range_minutes else 'all'))
-        tuples = list(map(lambda b: b.to_tuple(), self.bar_with_times))
+            logging.debug('Aggregation.get_minute_df for {symbol}, {l} total bars, range_minutes: {range_minutes}',
+                symbol=self.symbol, l=len(self.bars), range_minutes=range_minutes if range_minutes else 'all')
+        minutes, values = self.bars.to_columns()
         if range_minutes:
-            t_now_tz = self._get_t_now_tz()
-            i = len(tuples)
-            while True:
-                if i == 0:
-                    break
-                else:
-                    dt = t_now_tz - tuples[i - 1][0]
-                    if dt.seconds / 60 >= range_minutes:
-                        break
-                i -= 1
-            tuples = tuples[i:]
-        return pd.DataFrame(tuples, columns = BarWithTime.get_minute_tuple_names())
+            t_now_seconds = self._get_t_now_tz().timestamp()
+            i = np.searchsorted(minutes * 60, t_now_seconds - range_minutes * 60, side='right')
+            minutes, values = minutes[i:], values[:, i:]
+        return bar_columns_to_minute_df(minutes, self.symbol, values)
+
+
+def bar_columns_to_minute_df(minutes, symbols, values):
+    '''
+    Builds the minute DataFrame out of bar columns.
+
+    :param minutes: int array of epoch minutes
+    :param symbols: a symbol or an array of symbols per bar
+    :param values: float array of shape (5, n) of open, high, low, close, volume
+    '''
+    return pd.DataFrame({
+        'datetime': pd.to_datetime(minutes * 60, unit='s', utc=True),
+        'symbol': symbols,
+        'open': values[OPEN],
+        'high': values[HIGH],
+        'low': values[LOW],
+        'close': values[CLOSE],
+        'volume': values[VOLUME],
+    }, columns = BarWithTime.get_minute_tuple_names())
 
 
 class Aggregations:
     def __init__(self):
         self.aggregation_per_symbol = {}
+        # functions called with (symbol, minute, open, high, low, close, volume) of each bar once its minute is over
+        self.bar_listeners = []
 
     def clean(self):
         self.aggregation_per_symbol = {}
 
+    def _new_aggregation(self, symbol):
+        return Aggregation(symbol)
+
+    def _get_aggregation(self, symbol):
+        aggregation = self.aggregation_per_symbol.get(symbol)
+        if aggregation is None:
+            aggregation = self._new_aggregation(symbol)
+            for listener in self.bar_listeners:
+                aggregation.add_bar_listener(functools.partial(listener, symbol), replay=False)
+            self.aggregation_per_symbol[symbol] = aggregation
+        return aggregation
+
+    def add_bar_listener(self, listener, replay = False):
+        '''
+        Adds a function called with (symbol, minute, open, high, low, close, volume) of the bars of all the symbols,
+        the ones seen later included, once their minutes are over. It stays through clean().
+
+        :param replay: if True, the listener is first called with the retained bars that are already over.
+        '''
+        self.bar_listeners.append(listener)
+        for symbol, aggregation in self.aggregation_per_symbol.items():
+            aggregation.add_bar_listener(functools.partial(listener, symbol), replay=replay)
+
+    def finalize_bars(self, until_minute = None):
+        '''
+        Notifies the bar listeners of the bars up to until_minute without waiting for the next bars of the symbols,
+        e.g. when the minute closes. The symbols without a trade since are filled with flat bars up to until_minute.
+        A trade of a finalized minute arriving later still updates the bar but is not notified again.
+
+        :param until_minute: the last minute that is over, the bars in progress included if not given, e.g. at the end of the day.
+        '''
+        for aggregation in self.aggregation_per_symbol.values():
+            bars = aggregation.bars
+            if not len(bars):
+                continue
+            if until_minute is None:
+                aggregation._finalize_bars(bars.last_minute)
+                continue
+            aggregation._fill_flat_and_finalize(until_minute, until_minute)
+
+    def get_minute_bars(self, minute):
+        '''
+        Gets the bars of all the symbols at the epoch minute.
+
+        :return: (symbols, values) where symbols is an object array and values has shape (len(symbols), 5)
+            of open, high, low, close, volume.
+        '''
+        symbols, values = [], []
+        for symbol, aggregation in self.aggregation_per_symbol.items():
+            slot = aggregation.bars.slot_of(minute)
+            if slot is not None:
+                symbols.append(symbol)
+                values.append(aggregation.bars.values[:, slot])
+        return np.asarray(symbols, dtype=object), np.array(values, dtype=np.float64).reshape(len(symbols), 5)
+
     def on_trade(self, trade):
-        if trade.symbol not in self.aggregation_per_symbol:
-            self.aggregation_per_symbol[trade.symbol] = Aggregation(trade.symbol)
-        self.aggregation_per_symbol[trade.symbol].on_trade(trade)
+        self._get_aggregation(trade.symbol).on_trade(trade)
 
     def on_bar_with_time(self, bar_with_time):
-        symbol = bar_with_time.bar.symbol
-        if symbol not in self.aggregation_per_symbol:
-            self.aggregation_per_symbol[symbol] = Aggregation(symbol)
-        self.aggregation_per_symbol[symbol].on_bar_with_time(bar_with_time)
+        self._get_aggregation(bar_with_time.bar.symbol).on_bar_with_time(bar_with_time)
+
+    def replay_minute_df(self, df_minute):
+        '''
+        Applies the bars of a minute DataFrame indexed by datetime, e.g. read back from the saved bars, in time order per symbol.
+
+        :return: the number of the bars replayed.
+        '''
+        if not len(df_minute):
+            return 0
+        epoch_minutes = (df_minute.index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(minutes=1)
+        for minute, row in zip(epoch_minutes, df_minute.itertuples(index=False)):
+            bar = Bar(row.symbol, row.open, row.high, row.low, row.close, row.volume)
+            self.on_bar_with_time(BarWithTime.from_epoch_minute(int(minute), bar))
+        return len(df_minute)
 
     def get_status_string(self):
-        bars_avg = np.mean(list(map(lambda ag: len(ag.bar_with_times), self.aggregation_per_symbol.values())))
+        bars_avg = np.mean(list(map(lambda ag: len(ag.bars), self.aggregation_per_symbol.values())))
         return 'size of aggregation_per_symbol: {l}, bars_avg: {bars_avg}'.format(
             l = len(self.aggregation_per_symbol),
             bars_avg = bars_avg
@@ -203,50 +465,176 @@ class Aggregations:
 
     def get_minute_df(self, print_log = True):
         if print_log:
-            logging.info('Aggregations.get_minute_df for {l_s} symbols'.format(l_s=len(self.aggregation_per_symbol)))
-        df = pd.DataFrame(columns=BarWithTime.get_minute_tuple_names())
+            logging.info('Aggregations.get_minute_df for {l_s} symbols', l_s=len(self.aggregation_per_symbol))
+        t_1 = datetime.datetime.utcnow()
+        symbols, minutes, values = [], [], []
         for symbol, aggregation in self.aggregation_per_symbol.items():
-            t_1 = datetime.datetime.utcnow()
-            df_ = aggregation.get_minute_df()
-            t_2 = datetime.datetime.utcnow()
-            dt_21 = t_2 - t_1
-            logging.info('{s} seconds {ms} microseconds took to get minute_df for symbol {symbol}'.format(
-                s=dt_21.seconds, ms=dt_21.microseconds, symbol=symbol))
-            df = df.append(df_)
-            t_3 = datetime.datetime.utcnow()
-            dt_32 = t_3 - t_2
-            logging.info('{s} seconds {ms} microseconds took to append for symbol {symbol}'.format(
-                s=dt_32.seconds, ms=dt_32.microseconds, symbol=symbol))
+            minutes_, values_ = aggregation.bars.to_columns()
+            symbols.append(symbol)
+            minutes.append(minutes_)
+            values.append(values_)
+        lengths = [len(m) for m in minutes]
+        df = bar_columns_to_minute_df(
+            np.concatenate(minutes) if minutes else np.zeros(0, dtype=np.int64),
+            np.repeat(np.asarray(symbols, dtype=object), lengths),
+            np.concatenate(values, axis=1) if values else np.zeros((5, 0)))
+        if print_log:
+            dt_21 = datetime.datetime.utcnow() - t_1
+            logging.info('{s} seconds {ms} microseconds took to get minute_df of {l} bars',
+                s=dt_21.seconds, ms=dt_21.microseconds, l=len(df))
         return df.set_index('datetime')
 
+    def get_daily_df(self, print_log = True):
+        '''
+        Gets the daily bars of all the symbols from their running daily bars, without going through the minute bars.
+        '''
+        if print_log:
+            logging.info('Aggregations.get_daily_df for {l_s} symbols', l_s=len(self.aggregation_per_symbol))
+        t_1 = datetime.datetime.utcnow()
+        daily_tuples = []
+        for aggregation in self.aggregation_per_symbol.values():
+            daily_tuple = aggregation.get_daily_tuple()
+            if daily_tuple:
+                daily_tuples.append(daily_tuple)
+        df = pd.DataFrame(daily_tuples, columns=BarWithTime.get_daily_tuple_names())
+        if print_log:
+            dt_21 = datetime.datetime.utcnow() - t_1
+            logging.info('{s} seconds {ms} microseconds took to get daily_df of {l} symbols',
+                s=dt_21.seconds, ms=dt_21.microseconds, l=len(df))
+        return df.set_index('date')
+
 
 class AggregationsRun:
-    def __init__(self, aggregations = None):
+    def __init__(self, aggregations = None, single_writer = False):
+        '''
+
+        :param single_writer: if True, the aggregations are mutated only by a dedicated writer thread, so
+            on_trade and on_bar_with_time can be called from many threads. They return before being applied.
+        '''
         self.aggregations = aggregations if aggregations else Aggregations()
         self.daily_trade_started = True
+        self.writer = SingleWriter(name='aggregations_writer') if single_writer else None
+        # SegmentWriter the finalized bars are persisted to, if any
+        self.segment_writer = None
+        self.bar_fanout = BarFanout()
+        self.aggregations.add_bar_listener(self.bar_fanout.on_bar)
+
+    def _write(self, f, *args):
+        if self.writer:
+            self.writer.submit(f, *args)
+        else:
+            f(*args)
+
+    def _read(self, f, *args):
+        if self.writer:
+            return self.writer.call(f, *args)
+        return f(*args)
 
     def print_msg(self, msg):
         print('[print_msg]', msg)
 
-    def on_trade(self, trade):
+    def _on_trade(self, trade):
         if self.daily_trade_started:
             self.aggregations.on_trade(trade)
 
-    def on_bar_with_time(self, bar_with_time):
+    def on_trade(self, trade):
+        self._write(self._on_trade, trade)
+
+    def _on_bar_with_time(self, bar_with_time):
         if self.daily_trade_started:
             self.aggregations.on_bar_with_time(bar_with_time)
 
-    def on_daily_trade_start(self):
+    def on_bar_with_time(self, bar_with_time):
+        self._write(self._on_bar_with_time, bar_with_time)
+
+    def wait_applied(self):
+        '''
+        Returns once the trades and the bars submitted so far are applied to the aggregations.
+        '''
+        self._read(lambda: None)
+
+    def add_bar_sink(self, sink):
+        '''
+        Adds a consumer of the finalized bars, see BarFanout.add_sink.
+        '''
+        self._read(self.bar_fanout.add_sink, sink)
+
+    def _on_minute_close(self, minute):
+        if not self.daily_trade_started:
+            return
+        self.aggregations.finalize_bars(minute)
+        if self.bar_fanout.has_minute_sinks():
+            symbols, values = self.aggregations.get_minute_bars(minute)
+            self.bar_fanout.on_minute_bars(minute, symbols, values)
+
+    def on_minute_close(self, minute):
+        '''
+        Finalizes the bars of the epoch minute that is over for all the symbols, so the sinks get them at once
+        rather than at the next trade of each symbol, and gives the sinks the bars of all the symbols at the minute.
+        '''
+        self._write(self._on_minute_close, minute)
+
+    def attach_minute_clock(self, minute_clock, close_lag_minutes = _CLOSE_LAG_MINUTES):
+        '''
+        Closes the minutes as the MinuteClock crosses their ends, close_lag_minutes later.
+
+        :param close_lag_minutes: the grace period for the trades of a minute delivered after its end, e.g. by Pub/Sub.
+            A trade later than that updates the bar without the sinks seeing it, as they already took the closed bar.
+        '''
+        minute_clock.add_callback(lambda minute: self.on_minute_close(minute - 1 - close_lag_minutes))
+
+    def _on_daily_trade_start(self):
         logging.info('on_daily_trade_start')
         self.daily_trade_started = True
 
-    def save_daily_df(self, base_dir='data'):
+    def on_daily_trade_start(self):
+        self._read(self._on_daily_trade_start)
+
+    def _save_daily_df(self, base_dir):
         pass
 
-    def on_daily_trade_end(self, base_dir='data'):
+    def save_daily_df(self, base_dir='data'):
+        return self._read(self._save_daily_df, base_dir)
+
+    def _on_daily_trade_end(self, base_dir):
         logging.info('on_daily_trade_end')
         self.daily_trade_started = False
         self.aggregations.clean()
 
+    def on_daily_trade_end(self, base_dir='data'):
+        return self._read(self._on_daily_trade_end, base_dir)
+
+    def _copy_snapshot_state(self):
+        if not self.daily_trade_started:
+            return None
+        segment_seq = 0
+        if self.segment_writer:
+            self.segment_writer.flush()
+            segment_seq = self.segment_writer.get_next_seq()
+        return snapshot.copy_snapshot_state(self.aggregations), segment_seq
+
+    def save_snapshot(self, snapshot_dir):
+        '''
+        Saves the state of the aggregations to be recovered from after a restart.
+        The bars persisted by the segment_writer after the snapshot are replayed on top of it.
+        Only the copy of the bars is run on the writer, they are written on the calling thread.
+
+        :return: the path of the snapshot, None if the daily trade is not started.
+        '''
+        copied = self._read(self._copy_snapshot_state)
+        if copied is None:
+            return None
+        snapshot_state, segment_seq = copied
+        return snapshot.write_snapshot(snapshot_state, snapshot_dir, segment_seq)
+
+    def _recover(self, snapshot_dir):
+        return snapshot.recover(self.aggregations, snapshot_dir, self.segment_writer)
+
+    def recover(self, snapshot_dir):
+        '''
+        Restores the aggregations from the latest snapshot and the bars persisted after it, before the ingestion starts.
+        '''
+        return self._read(self._recover, snapshot_dir)
+
     def get_status_string(self):
-        return self.aggregations.get_status_string()
+        return self._read(self.aggregations.get_status_string)
@@ -0,0 +1,90 @@
+import argparse, time
+import pandas as pd, numpy as np
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Aggregations, Trade, Bar, BarWithTime
+from us_finance_streaming_data_miner.ingest.streaming.bar_buffer import BarRingBuffer
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregations
+
+_MINUTES_PER_DAY = 390
+_FIRST_MINUTE = 1577975400 // 60 # 2020-01-02 09:30 US/Eastern
+
+
+def new_daily_aggregations(symbol_cnt, minute_cnt = _MINUTES_PER_DAY):
+    '''
+    Builds DailyAggregations holding minute_cnt bars for each of symbol_cnt symbols.
+    '''
+    aggregations = DailyAggregations()
+    rng = np.random.default_rng(0)
+    for i in range(symbol_cnt):
+        aggregation = aggregations._get_aggregation('SYM{i}'.format(i=i))
+        aggregation.bars = BarRingBuffer(minute_cnt)
+        closes = 100 + np.cumsum(rng.normal(size=minute_cnt))
+        volumes = rng.integers(0, 1000, size=minute_cnt)
+        for j in range(minute_cnt):
+            close_ = closes[j]
+            aggregation.bars.append(_FIRST_MINUTE + j, close_, close_ + 1, close_ - 1, close_, volumes[j])
+        # the bars appended directly are over but the last, as they would be once ingested
+        aggregation._finalize_bars(aggregation.bars.last_minute - 1)
+    return aggregations
+
+def new_trades(symbol_cnt, trade_cnt, minute_cnt = _MINUTES_PER_DAY):
+    '''
+    Generates trade_cnt time ordered trades spread over symbol_cnt symbols and minute_cnt minutes.
+    '''
+    rng = np.random.default_rng(0)
+    timestamps = np.sort(_FIRST_MINUTE * 60 + rng.integers(0, minute_cnt * 60, size=trade_cnt))
+    symbols = rng.integers(0, symbol_cnt, size=trade_cnt)
+    prices = 100 + rng.normal(size=trade_cnt)
+    return [Trade(int(t), 'SYM{i}'.format(i=i), float(p), 100) for t, i, p in zip(timestamps, symbols, prices)]
+
+def new_bars_with_time(symbol_cnt, minute_cnt = _MINUTES_PER_DAY):
+    '''
+    Generates the minute ordered bars of symbol_cnt symbols over minute_cnt minutes, as the second aggregates give them.
+    '''
+    rng = np.random.default_rng(0)
+    closes = 100 + np.cumsum(rng.normal(size=(minute_cnt, symbol_cnt)), axis=0)
+    symbols = ['SYM{i}'.format(i=i) for i in range(symbol_cnt)]
+    return [BarWithTime.from_epoch_minute(_FIRST_MINUTE + j, Bar(symbol, close_, close_ + 1, close_ - 1, close_, 100))
+        for j in range(minute_cnt) for symbol, close_ in zip(symbols, closes[j].tolist())]
+
+def _per_symbol_concat_minute_df(aggregations):
+    # the export as it used to be done, a DataFrame append per symbol
+    df = pd.DataFrame()
+    for aggregation in aggregations.aggregation_per_symbol.values():
+        df = pd.concat([df, aggregation.get_minute_df(print_log=False)])
+    return df.set_index('datetime')
+
+def _time(f):
+    t_1 = time.perf_counter()
+    f()
+    return time.perf_counter() - t_1
+
+def run_on_trade(symbol_cnt, trade_cnt):
+    trades = new_trades(symbol_cnt, trade_cnt)
+    aggregations = Aggregations()
+    dt = _time(lambda: [aggregations.on_trade(trade) for trade in trades])
+    print('Aggregations.on_trade: {trade_cnt} trades over {symbol_cnt} symbols, {dt:.3f} seconds, {us:.2f} microseconds per trade'.format(
+        trade_cnt=trade_cnt, symbol_cnt=symbol_cnt, dt=dt, us=dt / trade_cnt * 1e6))
+
+def run(symbol_cnt, baseline_symbol_cnt):
+    aggregations = new_daily_aggregations(symbol_cnt)
+    dt = _time(lambda: aggregations.get_minute_df(print_log=False))
+    print('get_minute_df: {symbol_cnt} symbols x {m} minutes, {dt:.3f} seconds'.format(symbol_cnt=symbol_cnt, m=_MINUTES_PER_DAY, dt=dt))
+    dt = _time(lambda: aggregations.get_daily_df(print_log=False))
+    print('get_daily_df: {symbol_cnt} symbols, {dt:.3f} seconds'.format(symbol_cnt=symbol_cnt, dt=dt))
+
+    if baseline_symbol_cnt:
+        aggregations = new_daily_aggregations(baseline_symbol_cnt)
+        dt = _time(lambda: _per_symbol_concat_minute_df(aggregations))
+        print('per symbol append baseline: {symbol_cnt} symbols x {m} minutes, {dt:.3f} seconds'.format(
+            symbol_cnt=baseline_symbol_cnt, m=_MINUTES_PER_DAY, dt=dt))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--symbols", type=int, default=3500, help="number of symbols.")
+    parser.add_argument("-t", "--trades", type=int, default=1000000, help="number of trades for the on_trade benchmark, 0 to skip.")
+    parser.add_argument("-b", "--baseline_symbols", type=int, default=500, help="number of symbols for the per symbol append baseline, 0 to skip.")
+    args = parser.parse_args()
+    if args.trades:
+        run_on_trade(args.symbols, args.trades)
+    run(args.symbols, args.baseline_symbols)
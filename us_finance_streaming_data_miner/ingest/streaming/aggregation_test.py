@@ -1,7 +1,12 @@
-import unittest, datetime
+import unittest, datetime, threading
 import pytz
 
+import us_finance_streaming_data_miner.util.logging as logging
 from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun, Aggregations, Aggregation, BarWithTime, Bar, Trade
+from us_finance_streaming_data_miner.ingest.streaming.bar_buffer import BarRingBuffer
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
 
 class TestBar(unittest.TestCase):
     def test_bar_on_trade(self):
@@ -27,6 +32,18 @@ class TestBar(unittest.TestCase):
         self.assertEqual(90, bar.close)
         self.assertEqual(3, bar.volume)
 
+class TestBarWithTime(unittest.TestCase):
+    def test_epoch_minute(self):
+        symbol = 'DUMMY_SYMBOL'
+        self.assertEqual(2, BarWithTime.truncate_to_epoch_minute(179))
+
+        bar_with_time = BarWithTime.from_epoch_minute(2, Bar(symbol, 100, 110, 90, 100, 1))
+        self.assertEqual(2, bar_with_time.epoch_minute)
+        self.assertEqual(BarWithTime.truncate_to_minute(120), bar_with_time.time)
+
+        bar_with_time = BarWithTime(BarWithTime.truncate_to_minute(179), Bar(symbol, 100, 110, 90, 100, 1))
+        self.assertEqual(2, bar_with_time.epoch_minute)
+
 class TestAggregation(unittest.TestCase):
     def test_on_trade(self):
         one_minute_seconds = 60
@@ -123,6 +140,51 @@ class TestAggregation(unittest.TestCase):
         self.assertEqual(130, bar_t_2.bar.close)
         self.assertEqual(3.0, bar_t_2.bar.volume)
 
+    def test_on_trade_retention(self):
+        one_minute_seconds = 60
+        symbol = 'DUMMY_SYMBOL'
+        aggregation = Aggregation(symbol)
+        for i in range(400):
+            aggregation.on_trade(Trade(one_minute_seconds * i, symbol, 100.0 + i, 1.0))
+
+        self.assertEqual(300, len(aggregation.bar_with_times))
+        self.assertEqual(one_minute_seconds * 100, aggregation.bar_with_times[0].time.timestamp())
+        self.assertEqual(499, aggregation.bar_with_times[-1].bar.close)
+
+        # a late trade is applied to the bar of its minute without changing the close
+        aggregation.on_trade(Trade(one_minute_seconds * 398 + 1, symbol, 600.0, 1.0))
+        bar_t_398 = aggregation.bar_with_times[-2]
+        self.assertEqual(600, bar_t_398.bar.high)
+        self.assertEqual(498, bar_t_398.bar.close)
+        self.assertEqual(2, bar_t_398.bar.volume)
+
+    def test_long_gap(self):
+        one_minute_seconds = 60
+        one_day_seconds = 3600 * 24
+        symbol = 'DUMMY_SYMBOL'
+        aggregation = Aggregation(symbol)
+        aggregation.on_trade(Trade(0, symbol, 100.0, 1.0))
+        aggregation.on_trade(Trade(one_minute_seconds * 200, symbol, 110.0, 1.0))
+        self.assertEqual(201, len(aggregation.bar_with_times))
+        self.assertEqual(100, aggregation.bar_with_times[199].bar.close)
+        self.assertEqual(0, aggregation.bar_with_times[199].bar.volume)
+        self.assertEqual(110, aggregation.bar_with_times[200].bar.close)
+
+        # a gap longer than the retention keeps only the latest minutes
+        aggregation.on_trade(Trade(one_day_seconds, symbol, 120.0, 2.0))
+        self.assertEqual(300, len(aggregation.bar_with_times))
+        self.assertEqual(one_day_seconds - one_minute_seconds * 299, aggregation.bar_with_times[0].time.timestamp())
+        self.assertEqual(110, aggregation.bar_with_times[0].bar.close)
+        self.assertEqual(0, aggregation.bar_with_times[-2].bar.volume)
+        self.assertEqual(120, aggregation.bar_with_times[-1].bar.open)
+        self.assertEqual(2, aggregation.bar_with_times[-1].bar.volume)
+
+        aggregation.on_bar_with_time(BarWithTime.from_epoch_minute(one_day_seconds // 60 + 150, Bar(symbol, 130, 140, 120, 135, 3.0)))
+        self.assertEqual(300, len(aggregation.bar_with_times))
+        self.assertEqual(120, aggregation.bar_with_times[-2].bar.close)
+        self.assertEqual(130, aggregation.bar_with_times[-1].bar.open)
+        self.assertEqual(3, aggregation.bar_with_times[-1].bar.volume)
+
     def test_minute_df(self):
         one_minute_seconds = 60
         symbol = 'DUMMY_SYMBOL'
@@ -186,6 +248,34 @@ class TestAggregation(unittest.TestCase):
         self.assertEqual(130, row_0.close)
         self.assertEqual(4, row_0.volume)
 
+    def test_daily_df_past_retention(self):
+        one_minute_seconds = 60
+        symbol = 'DUMMY_SYMBOL'
+        aggregation = Aggregation(symbol)
+        aggregation.bars = BarRingBuffer(3)
+        for i in range(10):
+            aggregation.on_trade(Trade(one_minute_seconds * i, symbol, 100.0 + i, 1.0))
+        aggregation.on_trade(Trade(one_minute_seconds * 9 + 1, symbol, 90.0, 1.0))
+
+        self.assertEqual(3, len(aggregation.bars))
+        row_0 = aggregation.get_daily_df().iloc[0]
+        self.assertEqual(100, row_0.open)
+        self.assertEqual(109, row_0.high)
+        self.assertEqual(90, row_0.low)
+        self.assertEqual(90, row_0.close)
+        self.assertEqual(11, row_0.volume)
+
+    def test_daily_df_next_day(self):
+        one_day_seconds = 3600 * 24
+        symbol = 'DUMMY_SYMBOL'
+        aggregation = Aggregation(symbol)
+        aggregation.on_trade(Trade(one_day_seconds - 60, symbol, 100.0, 1.0))
+        aggregation.on_trade(Trade(one_day_seconds, symbol, 110.0, 2.0))
+        aggregation.on_trade(Trade(one_day_seconds + 60, symbol, 120.0, 3.0))
+
+        daily_tuple = aggregation.get_daily_tuple()
+        self.assertEqual((datetime.date(year=1970, month=1, day=2), symbol, 110.0, 120.0, 110.0, 120.0, 5.0), daily_tuple)
+
 class TestAggregations(unittest.TestCase):
     def test_on_trade(self):
         aggregations = Aggregations()
@@ -304,6 +394,44 @@ class TestAggregations(unittest.TestCase):
         self.assertEqual(120, row_1.close)
         self.assertEqual(1, row_1.volume)
 
+    def test_bar_listener(self):
+        aggregations = Aggregations()
+        bars = []
+        aggregations.on_trade(Trade(0, 'SYM1', 100.0, 1.0))
+        aggregations.add_bar_listener(lambda *bar: bars.append(bar))
+        aggregations.on_trade(Trade(0, 'SYM2', 200.0, 2.0))
+        aggregations.on_trade(Trade(60, 'SYM1', 110.0, 1.0))
+        aggregations.on_trade(Trade(120, 'SYM2', 210.0, 1.0))
+        self.assertEqual([('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0),
+            ('SYM2', 0, 200.0, 200.0, 200.0, 200.0, 2.0),
+            ('SYM2', 1, 200.0, 200.0, 200.0, 200.0, 0.0)], bars)
+
+        aggregations.finalize_bars()
+        self.assertEqual([('SYM1', 1, 110.0, 110.0, 110.0, 110.0, 1.0), ('SYM2', 2, 210.0, 210.0, 210.0, 210.0, 1.0)], bars[3:])
+
+        # the listener stays for the symbols of the next day
+        aggregations.clean()
+        aggregations.on_trade(Trade(0, 'SYM3', 300.0, 1.0))
+        aggregations.finalize_bars()
+        self.assertEqual(('SYM3', 0, 300.0, 300.0, 300.0, 300.0, 1.0), bars[-1])
+
+    def test_bar_listener_gap_over_capacity(self):
+        aggregations = Aggregations()
+        bars = []
+        aggregations.add_bar_listener(lambda *bar: bars.append(bar))
+        aggregations.on_trade(Trade(0, 'SYM1', 100.0, 1.0))
+        aggregations.on_trade(Trade(30, 'SYM1', 105.0, 10.0))
+        # a gap longer than the 300 minutes retained
+        aggregations.on_trade(Trade(400 * 60, 'SYM1', 110.0, 1.0))
+        self.assertEqual(('SYM1', 0, 100.0, 105.0, 100.0, 105.0, 11.0), bars[0])
+        self.assertEqual(399, bars[-1][1])
+        self.assertEqual(11.0, aggregations.aggregation_per_symbol['SYM1'].daily_bar.volume)
+
+        aggregations.on_trade(Trade(401 * 60, 'SYM2', 200.0, 2.0))
+        aggregations.finalize_bars(800)
+        self.assertEqual(('SYM1', 400, 110.0, 110.0, 110.0, 110.0, 1.0), [bar for bar in bars if bar[1] == 400][0])
+        self.assertEqual(('SYM2', 401, 200.0, 200.0, 200.0, 200.0, 2.0), [bar for bar in bars if bar[0] == 'SYM2'][0])
+
 class TestAggregationsRun(unittest.TestCase):
     def test_on_trade(self):
         aggregations_run = AggregationsRun()
@@ -332,3 +460,22 @@ class TestAggregationsRun(unittest.TestCase):
         aggregations_run.on_daily_trade_end(base_dir='data_unittest')
         self.assertEqual(0, len(aggregations_run.aggregations.aggregation_per_symbol))
 
+    def test_single_writer(self):
+        aggregations_run = AggregationsRun(single_writer=True)
+        one_minute_seconds = 60
+        symbols = ['SYM{i}'.format(i=i) for i in range(4)]
+
+        def ingest(symbol):
+            for i in range(100):
+                aggregations_run.on_trade(Trade(one_minute_seconds * i, symbol, 100.0 + i, 1.0))
+
+        threads = [threading.Thread(target=ingest, args=(symbol,)) for symbol in symbols]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIn('bars_avg: 100.0', aggregations_run.get_status_string())
+        aggregations_run.on_daily_trade_end(base_dir='data_unittest')
+        self.assertEqual(0, len(aggregations_run.aggregations.aggregation_per_symbol))
+        aggregations_run.writer.stop(1)
@@ -0,0 +1,254 @@
+import numpy as np
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+_VALUE_COLUMNS = 5
+_EMPTY_MINUTE = -1
+
+
+class BarRingBuffer:
+    '''
+    Fixed-capacity columnar storage of consecutive one minute bars.
+
+    A bar of epoch minute m lives in the slot m % capacity, so appends are O(1) and
+    the retained bars are always the latest `capacity` minutes.
+    '''
+    def __init__(self, capacity=300, minutes=None, values=None):
+        '''
+
+        :param capacity: the number of minutes retained
+        :param minutes: optional int64 array of shape (capacity,) to store the epoch minutes in
+        :param values: optional float64 array of shape (5, capacity) to store open, high, low, close, volume in
+        '''
+        self.capacity = capacity
+        self.size = 0
+        self.last_minute = None
+        self.bind(
+            minutes if minutes is not None else np.full(capacity, _EMPTY_MINUTE, dtype=np.int64),
+            values if values is not None else np.zeros((_VALUE_COLUMNS, capacity), dtype=np.float64))
+
+    def bind(self, minutes, values):
+        '''
+        Points the buffer to (possibly shared) backing arrays, keeping the current content as is.
+        '''
+        self.minutes, self.values = minutes, values
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.minutes[:] = _EMPTY_MINUTE
+        self.values[:] = 0
+        self.size = 0
+        self.last_minute = None
+
+    @property
+    def first_minute(self):
+        if not self.size:
+            return None
+        return self.last_minute - self.size + 1
+
+    def slot_of(self, minute):
+        '''
+        :return: the slot of the bar for the minute, None if the minute is not retained.
+        '''
+        if not self.size or minute > self.last_minute or minute < self.last_minute - self.size + 1:
+            return None
+        return minute % self.capacity
+
+    def slot_at(self, i):
+        '''
+        :param i: position of the bar in time order, negative values count from the latest bar.
+        '''
+        if i < 0:
+            i += self.size
+        if i < 0 or i >= self.size:
+            raise IndexError('bar index out of range')
+        return (self.last_minute - self.size + 1 + i) % self.capacity
+
+    def append(self, minute, open_, high, low, close_, volume):
+        if self.size and minute != self.last_minute + 1:
+            raise ValueError('minute {minute} does not follow the last minute {last_minute}'.format(
+                minute=minute, last_minute=self.last_minute))
+        slot = minute % self.capacity
+        self.minutes[slot] = minute
+        v = self.values
+        v[OPEN, slot], v[HIGH, slot], v[LOW, slot], v[CLOSE, slot], v[VOLUME, slot] = open_, high, low, close_, volume
+        self.last_minute = minute
+        if self.size < self.capacity:
+            self.size += 1
+
+    def append_flat(self, until_minute, price):
+        '''
+        Appends flat bars of zero volume at the price for every minute after the last minute up to until_minute.
+        When the gap is longer than the capacity, only the latest `capacity` minutes are written.
+        '''
+        if not self.size:
+            raise ValueError('can not fill the gap of an empty buffer')
+        n = until_minute - self.last_minute
+        if n <= 0:
+            return
+        if n == 1:
+            self.append(until_minute, price, price, price, price, 0)
+            return
+        k = min(n, self.capacity)
+        first = until_minute - k + 1
+        start = first % self.capacity
+        stop = start + k
+        if stop <= self.capacity:
+            self._fill_flat(slice(start, stop), first, price)
+        else:
+            self._fill_flat(slice(start, self.capacity), first, price)
+            self._fill_flat(slice(0, stop - self.capacity), first + self.capacity - start, price)
+        self.last_minute = until_minute
+        self.size = min(self.size + n, self.capacity)
+
+    def _fill_flat(self, slots, first, price):
+        self.minutes[slots] = np.arange(first, first + slots.stop - slots.start, dtype=np.int64)
+        self.values[:VOLUME, slots] = price
+        self.values[VOLUME, slots] = 0
+
+    def set_bar(self, slot, open_, high, low, close_, volume):
+        v = self.values
+        v[OPEN, slot], v[HIGH, slot], v[LOW, slot], v[CLOSE, slot], v[VOLUME, slot] = open_, high, low, close_, volume
+
+    def apply_trade(self, slot, price, volume, update_close=True):
+        v = self.values
+        if price > v[HIGH, slot]:
+            v[HIGH, slot] = price
+        if price < v[LOW, slot]:
+            v[LOW, slot] = price
+        if update_close:
+            v[CLOSE, slot] = price
+        v[VOLUME, slot] += volume
+
+    def get_bar(self, slot):
+        '''
+        :return: (minute, open, high, low, close, volume) tuple of the bar in the slot.
+        '''
+        v = self.values
+        return (int(self.minutes[slot]), float(v[OPEN, slot]), float(v[HIGH, slot]), float(v[LOW, slot]),
+                float(v[CLOSE, slot]), float(v[VOLUME, slot]),)
+
+    def get_close(self, slot):
+        return float(self.values[CLOSE, slot])
+
+    def get_last_close(self):
+        return float(self.values[CLOSE, self.last_minute % self.capacity])
+
+    def ordered_slots(self, start=0, stop=None):
+        '''
+        :return: int array of the slots in time order, sliced by positions [start:stop].
+        '''
+        if not self.size:
+            return np.zeros(0, dtype=np.int64)
+        first = self.last_minute - self.size + 1
+        return np.arange(first, first + self.size, dtype=np.int64)[start:stop] % self.capacity
+
+    def to_columns(self, start=0, stop=None):
+        '''
+        Copies the retained bars in time order.
+
+        :return: (minutes, values) where minutes has shape (n,) and values (5, n).
+        '''
+        slots = self.ordered_slots(start, stop)
+        return self.minutes[slots], self.values[:, slots]
+
+
+class BarMatrix:
+    '''
+    Bars of many symbols in one set of 2-D arrays, a row per symbol and a column per minute slot.
+
+    Each row is exposed as a BarRingBuffer backed by the row views, so a bar of epoch minute m of any symbol
+    is at column m % capacity and cross-sectional reads are single column slices.
+    '''
+    def __init__(self, capacity=300, initial_rows=64):
+        self.capacity = capacity
+        self.symbols = []
+        self.row_per_symbol = {}
+        self.buffers = []
+        self.minutes = np.full((initial_rows, capacity), _EMPTY_MINUTE, dtype=np.int64)
+        self.values = np.zeros((initial_rows, _VALUE_COLUMNS, capacity), dtype=np.float64)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _grow(self):
+        rows = len(self.minutes)
+        minutes = np.full((rows * 2, self.capacity), _EMPTY_MINUTE, dtype=np.int64)
+        values = np.zeros((rows * 2, _VALUE_COLUMNS, self.capacity), dtype=np.float64)
+        minutes[:rows], values[:rows] = self.minutes, self.values
+        self.minutes, self.values = minutes, values
+        for row, buffer in enumerate(self.buffers):
+            buffer.bind(minutes[row], values[row])
+
+    def add_row(self, symbol):
+        '''
+        Adds a row for the symbol.
+
+        :return: BarRingBuffer that stores its bars in the new row.
+        '''
+        if symbol in self.row_per_symbol:
+            raise ValueError('{symbol} already has a row'.format(symbol=symbol))
+        row = len(self.symbols)
+        if row == len(self.minutes):
+            self._grow()
+        buffer = BarRingBuffer(self.capacity, self.minutes[row], self.values[row])
+        self.symbols.append(symbol)
+        self.row_per_symbol[symbol] = row
+        self.buffers.append(buffer)
+        return buffer
+
+    def get_sizes(self):
+        '''
+        :return: int array of the number of bars per row.
+        '''
+        return np.count_nonzero(self.minutes[:len(self.symbols)] != _EMPTY_MINUTE, axis=1)
+
+    def get_minute_snapshot(self, minute):
+        '''
+        Gets the bars of all the symbols at the minute.
+
+        :return: (rows, values) where rows are the indices of the symbols having a bar at the minute and values has shape (len(rows), 5).
+        '''
+        slot = minute % self.capacity
+        rows = np.flatnonzero(self.minutes[:len(self.symbols), slot] == minute)
+        return rows, self.values[rows, :, slot]
+
+    def get_window(self, end_minute, window):
+        '''
+        Gets the closes and the volumes of all the rows over the window minutes ending at end_minute, aligned by minute.
+
+        A minute after the last bar of a row is filled flat with its last close and zero volume, as a minute without
+        trades would be. A minute before the first retained bar of a row is nan.
+
+        :return: (closes, volumes), both of shape (len(symbols), window) in time order.
+        '''
+        if window > self.capacity:
+            raise ValueError('window {window} is longer than the capacity {capacity}'.format(window=window, capacity=self.capacity))
+        n = len(self.symbols)
+        window_minutes = np.arange(end_minute - window + 1, end_minute + 1, dtype=np.int64)
+        slots = window_minutes % self.capacity
+        minutes = self.minutes[:n]
+        closes = self.values[:n, CLOSE][:, slots]
+        volumes = self.values[:n, VOLUME][:, slots]
+
+        is_present = minutes[:, slots] == window_minutes
+        last_minutes = minutes.max(axis=1)
+        last_closes = self.values[np.arange(n), CLOSE, last_minutes % self.capacity]
+        is_flat = (window_minutes > last_minutes[:, None]) & (last_minutes[:, None] != _EMPTY_MINUTE)
+        closes = np.where(is_present, closes, np.where(is_flat, last_closes[:, None], np.nan))
+        volumes = np.where(is_present, volumes, np.where(is_flat, 0.0, np.nan))
+        return closes, volumes
+
+    def to_columns(self):
+        '''
+        Copies all the bars ordered by row and then by time.
+
+        :return: (rows, minutes, values) where rows and minutes have shape (n,) and values (5, n).
+        '''
+        minutes = self.minutes[:len(self.symbols)]
+        rows, slots = np.nonzero(minutes != _EMPTY_MINUTE)
+        bar_minutes = minutes[rows, slots]
+        order = np.lexsort((bar_minutes, rows))
+        rows, slots, bar_minutes = rows[order], slots[order], bar_minutes[order]
+        return rows, bar_minutes, self.values[rows, :, slots].T
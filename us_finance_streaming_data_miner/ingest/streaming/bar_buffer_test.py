@@ -0,0 +1,87 @@
+import unittest
+import numpy as np
+
+from us_finance_streaming_data_miner.ingest.streaming.bar_buffer import BarRingBuffer, OPEN, HIGH, LOW, CLOSE, VOLUME
+
+class TestBarRingBuffer(unittest.TestCase):
+    def test_append(self):
+        buffer = BarRingBuffer(3)
+        buffer.append(10, 100, 110, 90, 105, 1.0)
+        buffer.append(11, 105, 120, 100, 115, 2.0)
+        self.assertEqual(2, len(buffer))
+        self.assertEqual(10, buffer.first_minute)
+        self.assertEqual(11, buffer.last_minute)
+        self.assertEqual((11, 105, 120, 100, 115, 2.0), buffer.get_bar(buffer.slot_at(-1)))
+        self.assertEqual((10, 100, 110, 90, 105, 1.0), buffer.get_bar(buffer.slot_at(0)))
+
+    def test_append_not_consecutive(self):
+        buffer = BarRingBuffer(3)
+        buffer.append(10, 100, 110, 90, 105, 1.0)
+        with self.assertRaises(ValueError):
+            buffer.append(12, 100, 110, 90, 105, 1.0)
+        with self.assertRaises(ValueError):
+            buffer.append(10, 100, 110, 90, 105, 1.0)
+
+    def test_wrap_around(self):
+        buffer = BarRingBuffer(3)
+        for minute in range(10, 15):
+            buffer.append(minute, minute, minute, minute, minute, 1.0)
+        self.assertEqual(3, len(buffer))
+        self.assertEqual(12, buffer.first_minute)
+        self.assertIsNone(buffer.slot_of(11))
+        self.assertIsNotNone(buffer.slot_of(12))
+
+        minutes, values = buffer.to_columns()
+        np.testing.assert_array_equal([12, 13, 14], minutes)
+        np.testing.assert_array_equal([12, 13, 14], values[CLOSE])
+
+        minutes, values = buffer.to_columns(-2)
+        np.testing.assert_array_equal([13, 14], minutes)
+
+    def test_apply_trade(self):
+        buffer = BarRingBuffer(3)
+        buffer.append(10, 100, 100, 100, 100, 0)
+        slot = buffer.slot_at(-1)
+        buffer.apply_trade(slot, 110, 1.0)
+        buffer.apply_trade(slot, 90, 2.0)
+        self.assertEqual((10, 100, 110, 90, 90, 3.0), buffer.get_bar(slot))
+
+        buffer.apply_trade(slot, 120, 1.0, update_close=False)
+        self.assertEqual((10, 100, 120, 90, 90, 4.0), buffer.get_bar(slot))
+
+    def test_shared_backing_arrays(self):
+        minutes = np.full((2, 3), -1, dtype=np.int64)
+        values = np.zeros((2, 5, 3))
+        buffer = BarRingBuffer(3, minutes[1], values[1])
+        buffer.append(10, 100, 110, 90, 105, 1.0)
+        self.assertEqual(10, minutes[1, 10 % 3])
+        self.assertEqual(110, values[1, HIGH, 10 % 3])
+        self.assertEqual(-1, minutes[0, 10 % 3])
+
+    def test_append_flat(self):
+        buffer = BarRingBuffer(5)
+        buffer.append(10, 100, 110, 90, 105, 1.0)
+        buffer.append_flat(13, 105)
+        self.assertEqual(4, len(buffer))
+        minutes, values = buffer.to_columns()
+        np.testing.assert_array_equal([10, 11, 12, 13], minutes)
+        np.testing.assert_array_equal([105, 105, 105, 105], values[CLOSE])
+        np.testing.assert_array_equal([110, 105, 105, 105], values[HIGH])
+        np.testing.assert_array_equal([1, 0, 0, 0], values[VOLUME])
+
+        # wraps around the end of the arrays
+        buffer.append_flat(16, 106)
+        self.assertEqual(5, len(buffer))
+        minutes, values = buffer.to_columns()
+        np.testing.assert_array_equal([12, 13, 14, 15, 16], minutes)
+        np.testing.assert_array_equal([105, 105, 106, 106, 106], values[OPEN])
+
+    def test_append_flat_longer_than_capacity(self):
+        buffer = BarRingBuffer(3)
+        buffer.append(10, 100, 110, 90, 105, 1.0)
+        buffer.append_flat(1000, 105)
+        self.assertEqual(3, len(buffer))
+        self.assertEqual(998, buffer.first_minute)
+        minutes, values = buffer.to_columns()
+        np.testing.assert_array_equal([998, 999, 1000], minutes)
+        np.testing.assert_array_equal([0, 0, 0], values[VOLUME])
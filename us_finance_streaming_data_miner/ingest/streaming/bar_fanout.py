@@ -0,0 +1,47 @@
+import us_finance_streaming_data_miner.util.logging as logging
+
+
+class BarFanout:
+    '''
+    Hands each finalized bar to all the sinks in process, as the single bar listener of the aggregations.
+
+    A sink has on_bar(symbol, minute, open, high, low, close, volume), called with each bar once its minute is over,
+    and optionally on_minute_bars(minute, symbols, values), called once the minute is closed for all the symbols
+    with values of shape (len(symbols), 5). SegmentWriter and BatchPublisher are sinks.
+    The sinks share the same bar and the same read-only arrays, nothing is copied per sink.
+    A sink that fails is logged and does not keep the bar from the others.
+    '''
+    def __init__(self):
+        self.sinks = []
+        self._bar_sinks = []
+        self._minute_sinks = []
+        self.failed_cnt = 0
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        if hasattr(sink, 'on_bar'):
+            self._bar_sinks.append(sink.on_bar)
+        if hasattr(sink, 'on_minute_bars'):
+            self._minute_sinks.append(sink.on_minute_bars)
+
+    def has_minute_sinks(self):
+        return bool(self._minute_sinks)
+
+    def _on_failure(self, sink_method, ex):
+        self.failed_cnt += 1
+        logging.error('bar sink {sink} failed: {ex}', sink=type(getattr(sink_method, '__self__', sink_method)).__name__, ex=ex)
+
+    def on_bar(self, symbol, minute, open_, high, low, close_, volume):
+        for on_bar in self._bar_sinks:
+            try:
+                on_bar(symbol, minute, open_, high, low, close_, volume)
+            except Exception as ex:
+                self._on_failure(on_bar, ex)
+
+    def on_minute_bars(self, minute, symbols, values):
+        values.flags.writeable = False
+        for on_minute_bars in self._minute_sinks:
+            try:
+                on_minute_bars(minute, symbols, values)
+            except Exception as ex:
+                self._on_failure(on_minute_bars, ex)
@@ -0,0 +1,95 @@
+import unittest
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun, Trade
+from us_finance_streaming_data_miner.ingest.streaming.matrix_aggregation import MatrixAggregations
+from us_finance_streaming_data_miner.util.current_time import MockCurrentTime
+from us_finance_streaming_data_miner.util.minute_clock import MinuteClock
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class _BarSink:
+    def __init__(self):
+        self.bars = []
+
+    def on_bar(self, symbol, minute, open_, high, low, close_, volume):
+        self.bars.append((symbol, minute, close_, volume))
+
+class _MinuteSink:
+    def __init__(self):
+        self.minute_bars = []
+
+    def on_minute_bars(self, minute, symbols, values):
+        self.minute_bars.append((minute, symbols, values))
+
+class _FailingSink:
+    def on_bar(self, symbol, minute, open_, high, low, close_, volume):
+        raise ValueError('failing sink')
+
+class TestBarFanout(unittest.TestCase):
+    def test_sinks(self):
+        aggregations_run = AggregationsRun()
+        bar_sink, minute_sink = _BarSink(), _MinuteSink()
+        aggregations_run.add_bar_sink(_FailingSink())
+        aggregations_run.add_bar_sink(bar_sink)
+        aggregations_run.add_bar_sink(minute_sink)
+
+        aggregations_run.on_trade(Trade(0, 'SYM1', 100.0, 1.0))
+        aggregations_run.on_trade(Trade(0, 'SYM2', 200.0, 2.0))
+        aggregations_run.on_trade(Trade(60, 'SYM1', 110.0, 1.0))
+        self.assertEqual([('SYM1', 0, 100.0, 1.0)], bar_sink.bars)
+        self.assertEqual(1, aggregations_run.bar_fanout.failed_cnt)
+
+        # the bar of SYM2 is over as the minute closes, without waiting for its next trade
+        aggregations_run.on_minute_close(0)
+        self.assertEqual([('SYM1', 0, 100.0, 1.0), ('SYM2', 0, 200.0, 2.0)], bar_sink.bars)
+        minute, symbols, values = minute_sink.minute_bars[0]
+        self.assertEqual(0, minute)
+        self.assertEqual(['SYM1', 'SYM2'], list(symbols))
+        self.assertEqual([100.0, 200.0], list(values[:, 3]))
+        self.assertFalse(values.flags.writeable)
+
+        # SYM2 is filled flat up to the closed minute
+        aggregations_run.on_minute_close(2)
+        self.assertEqual([('SYM1', 1, 110.0, 1.0), ('SYM1', 2, 110.0, 0.0), ('SYM2', 1, 200.0, 0.0), ('SYM2', 2, 200.0, 0.0)], bar_sink.bars[2:])
+        aggregations_run.on_trade(Trade(180, 'SYM2', 210.0, 1.0))
+        self.assertEqual(6, len(bar_sink.bars))
+
+    def test_minute_clock(self):
+        aggregations_run = AggregationsRun(MatrixAggregations(), single_writer=True)
+        minute_sink = _MinuteSink()
+        aggregations_run.add_bar_sink(minute_sink)
+        minute_clock = MinuteClock(MockCurrentTime(600))
+        aggregations_run.attach_minute_clock(minute_clock)
+
+        aggregations_run.on_trade(Trade(600, 'SYM1', 100.0, 1.0))
+        aggregations_run.on_trade(Trade(630, 'SYM2', 200.0, 2.0))
+        minute_clock.advance_to(660)
+        # the minute 10 stays open for a minute after its end, its late trades still count
+        aggregations_run.on_trade(Trade(659, 'SYM1', 101.0, 3.0))
+        aggregations_run.get_status_string() # waits for the writer to apply what is submitted
+        self.assertEqual([], [minute for minute, _, _ in minute_sink.minute_bars if minute >= 10])
+
+        minute_clock.advance_to(720)
+        aggregations_run.get_status_string()
+        minute, symbols, values = minute_sink.minute_bars[-1]
+        self.assertEqual(10, minute)
+        self.assertEqual(['SYM1', 'SYM2'], list(symbols))
+        self.assertEqual([4.0, 2.0], list(values[:, 4]))
+        self.assertEqual(101.0, values[0, 3])
+
+        # the minutes skipped by a jump of the clock are closed as well
+        minute_clock.advance_to(900)
+        aggregations_run.get_status_string()
+        self.assertEqual([10, 11, 12, 13], [minute for minute, _, _ in minute_sink.minute_bars if minute >= 10])
+        aggregations_run.writer.stop()
+
+    def test_daily_trade_ended(self):
+        aggregations_run = AggregationsRun()
+        bar_sink = _BarSink()
+        aggregations_run.add_bar_sink(bar_sink)
+        aggregations_run.on_trade(Trade(0, 'SYM1', 100.0, 1.0))
+        aggregations_run.on_daily_trade_end()
+        aggregations_run.on_minute_close(0)
+        self.assertEqual([], bar_sink.bars)
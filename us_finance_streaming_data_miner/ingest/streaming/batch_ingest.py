@@ -0,0 +1,116 @@
+import queue, threading, time
+from google.cloud import pubsub_v1
+import us_finance_streaming_data_miner.util.logging as logging
+
+_MAX_BATCH_SIZE = 1000
+_MAX_QUEUE_SIZE = 20000
+_BATCH_MAX_LATENCY_SECONDS = 0.05
+
+# None keeps the default of the client library
+DEFAULT_MAX_MESSAGES = None
+DEFAULT_MAX_BYTES = None
+
+def get_flow_control(max_messages=DEFAULT_MAX_MESSAGES, max_bytes=DEFAULT_MAX_BYTES):
+    '''
+    Gets the subscriber flow control, bounding the number and the size of the leased (not yet acked) messages.
+    The bounds not given are left to the defaults of the client library.
+    '''
+    kwargs = {}
+    if max_messages is not None:
+        kwargs['max_messages'] = max_messages
+    if max_bytes is not None:
+        kwargs['max_bytes'] = max_bytes
+    return pubsub_v1.types.FlowControl(**kwargs)
+
+class BatchIngest:
+    '''
+    Ingests Pub/Sub messages in batches on a dedicated worker thread.
+
+    The subscriber callback only puts the message into a bounded queue. The worker takes
+    up to max_batch_size messages at once, decodes them, applies the decoded events, and acks
+    the messages only after that, so the messages of a crashed process are redelivered.
+    '''
+    def __init__(self, decode, apply, max_batch_size=_MAX_BATCH_SIZE, max_queue_size=_MAX_QUEUE_SIZE, max_latency_seconds=_BATCH_MAX_LATENCY_SECONDS,
+                 wait_applied=None):
+        '''
+
+        :param decode: function that takes a message and returns a list of events
+        :param apply: function that takes an event
+        :param wait_applied: function that returns once the events applied so far take effect, for an apply that
+            only queues them, e.g. to a SingleWriter. The messages are acked after it returns.
+        '''
+        self.decode = decode
+        self.apply = apply
+        self.wait_applied = wait_applied
+        self.max_batch_size = max_batch_size
+        self.max_latency_seconds = max_latency_seconds
+        self.queue = queue.Queue(max_queue_size)
+        self.processed_cnt = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def callback(self, message):
+        '''
+        The callback to pass to SubscriberClient.subscribe. Blocks while the queue is full.
+        '''
+        self.queue.put(message)
+
+    def stop(self, timeout=None):
+        '''
+        Processes the messages queued so far and stops the worker.
+        '''
+        self.queue.put(None)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        messages = []
+        message = self.queue.get()
+        deadline = time.monotonic() + self.max_latency_seconds
+        while message is not None:
+            messages.append(message)
+            if len(messages) >= self.max_batch_size:
+                break
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    message = self.queue.get(timeout=remaining)
+                else:
+                    message = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        return messages, message is None
+
+    def apply_batch(self, messages):
+        events = []
+        for message in messages:
+            try:
+                events.extend(self.decode(message))
+            except Exception as ex:
+                logging.error('failed to decode the message {data}: {ex}', data=message.data, ex=ex)
+
+        for event in events:
+            try:
+                self.apply(event)
+            except Exception as ex:
+                logging.error('failed to apply the event {event}: {ex}', event=event, ex=ex)
+
+        if self.wait_applied:
+            try:
+                self.wait_applied()
+            except Exception as ex:
+                logging.error('failed to wait for {l} messages to be applied, nacking them: {ex}', l=len(messages), ex=ex)
+                for message in messages:
+                    message.nack()
+                return
+
+        for message in messages:
+            message.ack()
+        self.processed_cnt += len(messages)
+
+    def _run(self):
+        while True:
+            messages, stopped = self._next_batch()
+            if messages:
+                self.apply_batch(messages)
+            if stopped:
+                break
@@ -0,0 +1,75 @@
+import unittest, json, time
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun, Trade
+from google.cloud import pubsub_v1
+from us_finance_streaming_data_miner.ingest.streaming.batch_ingest import BatchIngest, get_flow_control
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class _Message:
+    def __init__(self, data):
+        self.data = data
+        self.acked = False
+
+    def ack(self):
+        self.acked = True
+
+class TestBatchIngest(unittest.TestCase):
+    def test_apply_then_ack(self):
+        applied = []
+        acked_when_applied = []
+        messages = [_Message(json.dumps([i, i + 1]).encode('utf-8')) for i in range(5)]
+
+        def apply(event):
+            applied.append(event)
+            acked_when_applied.append(any(m.acked for m in messages))
+
+        batch_ingest = BatchIngest(lambda m: json.loads(m.data), apply, max_batch_size=10, max_latency_seconds=10)
+        for message in messages:
+            batch_ingest.callback(message)
+        batch_ingest.stop(1)
+
+        self.assertEqual([0, 1, 1, 2, 2, 3, 3, 4, 4, 5], applied)
+        self.assertFalse(any(acked_when_applied))
+        self.assertTrue(all(m.acked for m in messages))
+        self.assertEqual(5, batch_ingest.processed_cnt)
+
+    def test_invalid_message(self):
+        applied = []
+        batch_ingest = BatchIngest(lambda m: json.loads(m.data), applied.append)
+        invalid_message = _Message(b'not a json')
+        batch_ingest.callback(invalid_message)
+        batch_ingest.callback(_Message(b'[1]'))
+        batch_ingest.stop(1)
+
+        self.assertEqual([1], applied)
+        self.assertTrue(invalid_message.acked)
+
+    def test_ack_after_applied_by_single_writer(self):
+        aggregations_run = AggregationsRun(single_writer=True)
+        # holds the writer, so the trades queued behind are not applied yet
+        aggregations_run.writer.submit(time.sleep, 0.2)
+        applied_when_acked = []
+
+        class _CheckedMessage(_Message):
+            def ack(self):
+                applied_when_acked.append(self.data.decode() in aggregations_run.aggregations.aggregation_per_symbol)
+                super(_CheckedMessage, self).ack()
+
+        batch_ingest = BatchIngest(lambda m: [Trade(0, m.data.decode(), 100.0, 1.0)], aggregations_run.on_trade,
+            wait_applied=aggregations_run.wait_applied)
+        for symbol in ('SYM1', 'SYM2', 'SYM3'):
+            batch_ingest.callback(_CheckedMessage(symbol.encode('utf-8')))
+        batch_ingest.stop(5)
+
+        self.assertEqual([True, True, True], applied_when_acked)
+
+class TestFlowControl(unittest.TestCase):
+    def test_get_flow_control(self):
+        default = pubsub_v1.types.FlowControl()
+        self.assertEqual(default, get_flow_control())
+        flow_control = get_flow_control(max_messages=10)
+        self.assertEqual(10, flow_control.max_messages)
+        self.assertEqual(default.max_bytes, flow_control.max_bytes)
@@ -1,27 +1,58 @@
-import json, os
-import hashlib
+import os
 from google.cloud import pubsub_v1
 from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun, Aggregations, BarWithTime, Bar
+from us_finance_streaming_data_miner.ingest.streaming.decode import decode_events
+from us_finance_streaming_data_miner.ingest.streaming.sharding import ShardFilter
+from us_finance_streaming_data_miner.ingest.streaming.batch_ingest import BatchIngest, get_flow_control, DEFAULT_MAX_MESSAGES, DEFAULT_MAX_BYTES
 from threading import Thread
 import us_finance_streaming_data_miner.util.logging as logging
 
 _cnt_msg = 0
 
-def run_loop(aggregations_run, shard_id, shard_size, subscription_id):
+def _decode_message(message_payload):
+    return decode_events(message_payload.data)
+
+def _decode_shard_message(message_payload, shard_filter):
+    if not shard_filter.accepts_message(message_payload):
+        return []
+    return _decode_message(message_payload)
+
+def run_loop(aggregations_run, shard_filter, subscription_id, batched = False, max_messages = DEFAULT_MAX_MESSAGES, max_bytes = DEFAULT_MAX_BYTES, subscriber = None):
+    '''
+    Subscribes to the binance stream.
+
+    :param shard_filter: ShardFilter, the messages routed to the other shards are acked without being decoded.
+    :param batched: if True, the messages are applied in batches by a single worker and acked after being applied.
+    :param max_messages: flow control, the maximum number of messages leased at once
+    :param max_bytes: flow control, the maximum bytes of messages leased at once
+    :param subscriber: SubscriberClient to subscribe with, e.g. a FakeSubscriberClient replaying recorded messages.
+    '''
     project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
 
-    subscriber = pubsub_v1.SubscriberClient()
+    if subscriber is None:
+        subscriber = pubsub_v1.SubscriberClient()
     subscription_path = subscriber.subscription_path(
         project_id, subscription_id
     )
 
-    def callback(message_payload):
-        msg = json.loads(message_payload.data.decode('utf-8'))
-        message_payload.ack()
-        on_message(aggregations_run, msg, shard_id, shard_size)
+    if batched:
+        batch_ingest = BatchIngest(
+            lambda message_payload: _decode_shard_message(message_payload, shard_filter),
+            lambda msg: on_message(aggregations_run, msg, shard_filter))
+        callback = batch_ingest.callback
+    else:
+        def callback(message_payload):
+            msgs = _decode_shard_message(message_payload, shard_filter)
+            message_payload.ack()
+            for msg in msgs:
+                # the message is acked already, a malformed event must not lose the rest of it
+                try:
+                    on_message(aggregations_run, msg, shard_filter)
+                except Exception as ex:
+                    logging.error('failed to apply the event {msg}: {ex}', msg=msg, ex=ex)
 
     streaming_pull_future = subscriber.subscribe(
-        subscription_path, callback=callback
+        subscription_path, callback=callback, flow_control=get_flow_control(max_messages, max_bytes)
     )
     print("Listening for messages on {}\n".format(subscription_path))
 
@@ -31,11 +62,11 @@ def run_loop(aggregations_run, shard_id, shard_size, subscription_id):
         logging.error(ex)
         streaming_pull_future.cancel()
 
-def _binance_kline_msg_to_on_bar_with_time(msg, shard_id, shard_size):
+def _binance_kline_msg_to_on_bar_with_time(msg):
     global _cnt_msg
     _cnt_msg += 1
     if _cnt_msg % 50 == 0:
-        print("< {msg}".format(msg=msg))
+        logging.debug('< {msg}', msg=msg)
 
     keys = ['s', 'o', 'h', 'l', 'c', 'v', 't']
     for key in keys:
@@ -43,55 +74,46 @@ def _binance_kline_msg_to_on_bar_with_time(msg, shard_id, shard_size):
             raise Exception('"{key}" field not present in the message: {msg}'.format(key=key, msg=msg))
 
     symbol = msg['s']
-
-    hashed_v = int(hashlib.sha256(symbol.encode('utf-8')).hexdigest(), 16)
-    hashed_id = hashed_v % shard_size
-    if hashed_id != shard_id:
-        return None
-
     open_, high, low, close_ = float(msg['o']), float(msg['h']), float(msg['l']), float(msg['c'])
     volume = float(msg['v'])
     timestamp_milli = int(msg['t'])
     timestamp_second = timestamp_milli // 1000
 
-    t = BarWithTime.truncate_to_minute(timestamp_second)
     bar = Bar(symbol, open_, high, low, close_, volume)
-    bar_with_time = BarWithTime(t, bar)
+    bar_with_time = BarWithTime.from_epoch_minute(BarWithTime.truncate_to_epoch_minute(timestamp_second), bar)
     return bar_with_time
 
-def _on_kline_message(aggregations_run, msg, shard_id, shard_size):
+def _on_kline_message(aggregations_run, msg, shard_filter):
     global _cnt_msg
     _cnt_msg += 1
     if _cnt_msg % 100 == 0:
-        print("< {msg}".format(msg=msg))
+        logging.debug('< {msg}', msg=msg)
 
     if 'k' not in msg:
-        logging.error('"k" field not present in the kline message: {msg}'.format(msg=msg))
+        logging.error('"k" field not present in the kline message: {msg}', msg=msg)
     k = msg['k']
-    bar_with_time = _binance_kline_msg_to_on_bar_with_time(k, shard_id, shard_size)
-    if bar_with_time:
-        aggregations_run.on_bar_with_time(bar_with_time)
-    else:
-        pass # print('does not correspond to this shard')
+    if not shard_filter.accepts_symbol(k['s']):
+        return # does not correspond to this shard
+    bar_with_time = _binance_kline_msg_to_on_bar_with_time(k)
+    aggregations_run.on_bar_with_time(bar_with_time)
 
 def _on_undefined_message(aggregations_run, msg):
-    print("< (undefined) {msg}".format(msg=msg))
-    logging.error("< (undefined) {msg}".format(msg=msg))
+    logging.error('< (undefined) {msg}', msg=msg)
 
-def on_message(aggregations_run, msg, shard_id, shard_size):
+def on_message(aggregations_run, msg, shard_filter):
     if not msg:
         logging.error('the message is not valid')
 
     if 'e' not in msg:
-        logging.error('"e" field not present in the message: {msg}'.format(msg=msg))
+        logging.error('"e" field not present in the message: {msg}', msg=msg)
     e = msg['e']
     if e == 'kline':
-        _on_kline_message(aggregations_run, msg, shard_id, shard_size)
+        _on_kline_message(aggregations_run, msg, shard_filter)
     else:
         _on_undefined_message(aggregations_run, msg)
 
 class BinanceAggregationsRun(AggregationsRun):
-    def __init__(self, shard_id = 0, shard_size = 1, aggregations = None, subscription_id = None):
-        super(BinanceAggregationsRun, self).__init__()
-        self.aggregations = aggregations if aggregations else Aggregations()
-        Thread(target=run_loop, args=(self, shard_id, shard_size, subscription_id,)).start()
+    def __init__(self, shard_id = 0, shard_size = 1, aggregations = None, subscription_id = None, batched = False, max_messages = DEFAULT_MAX_MESSAGES, max_bytes = DEFAULT_MAX_BYTES):
+        super(BinanceAggregationsRun, self).__init__(aggregations, single_writer = True)
+        self.shard_filter = ShardFilter(shard_id, shard_size)
+        Thread(target=run_loop, args=(self, self.shard_filter, subscription_id, batched, max_messages, max_bytes,)).start()
@@ -0,0 +1,25 @@
+import unittest, json
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.binance_run import run_loop
+from us_finance_streaming_data_miner.ingest.streaming.sharding import ShardFilter
+from us_finance_streaming_data_miner.util.fake_pubsub import FakeSubscriberClient, FakeMessage
+import us_finance_streaming_data_miner.util.logging as logging
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+def _kline_msg(symbol):
+    return {'e': 'kline', 'k': {'s': symbol, 'o': '10.0', 'h': '11.0', 'l': '9.0', 'c': '10.5', 'v': '100.0', 't': 1577975400 * 1000}}
+
+class TestBinanceRun(unittest.TestCase):
+    def test_run_loop_malformed_event(self):
+        for batched in (False, True):
+            msgs = [_kline_msg('BTCUSDT'), {'k': {'s': 'XRPUSDT'}}, _kline_msg('ETHUSDT')]
+            subscriber = FakeSubscriberClient([FakeMessage(json.dumps(msgs).encode('utf-8'))])
+            run = AggregationsRun(single_writer=True)
+            run_loop(run, ShardFilter(), 'mock', batched, subscriber=subscriber)
+            self.assertEqual(1, subscriber.acked_cnt)
+            df = run._read(run.aggregations.get_minute_df)
+            # the events after the malformed one are applied
+            self.assertEqual(['BTCUSDT', 'ETHUSDT'], sorted(df['symbol'].unique()))
@@ -1,72 +1,77 @@
-import pandas as pd, numpy as np
-import datetime, os
+import datetime
 import us_finance_streaming_data_miner.util.logging as logging
-from us_finance_streaming_data_miner.ingest.streaming.aggregation import BarWithTime, Bar, Aggregation, Aggregations, AggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Aggregation, Aggregations, AggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.export_format import get_export_format, export_df
 
 
 class DailyAggregation(Aggregation):
-    def get_daily_df(self):
-        df_minute = self.get_minute_df()
-        print('Aggregation.get_daily_df for {symbol}, df_minute length: {l}'.format(symbol=self.symbol, l=len(df_minute )))
-        df_daily = pd.DataFrame(columns = BarWithTime.get_daily_tuple_names()).append(
-            {
-                'date': df_minute.datetime.dt.date.iloc[0],
-                'symbol': df_minute.symbol.iloc[0],
-                'open': df_minute.open.iloc[0],
-                'high': df_minute.high.max(),
-                'low': df_minute.low.min(),
-                'close': df_minute.close.iloc[-1],
-                'volume': df_minute.volume.sum()
-            }, ignore_index=True)
-        return df_daily
+    '''
+    Aggregation of a symbol whose daily bar is saved at the end of the day.
+    The daily bar itself is kept by Aggregation as it is updated with every bar.
+    '''
+    pass
 
 class DailyAggregations(Aggregations):
-    def get_daily_df(self):
-        logging.info('Aggregations.get_daily_df for {l_s} symbols'.format(l_s=len(self.aggregation_per_symbol)))
-        df = pd.DataFrame(columns=BarWithTime.get_daily_tuple_names())
-        for symbol, aggregation in self.aggregation_per_symbol.items():
-            t_1 = datetime.datetime.utcnow()
-            df_ = aggregation.get_daily_df()
-            t_2 = datetime.datetime.utcnow()
-            dt_21 = t_2 - t_1
-            logging.info('{s} seconds {ms} microseconds took to get minute_df for symbol {symbol}'.format(
-                s=dt_21.seconds, ms=dt_21.microseconds, symbol=symbol))
-            df = df.append(df_)
-            t_3 = datetime.datetime.utcnow()
-            dt_32 = t_3 - t_2
-            logging.info('{s} seconds {ms} microseconds took to append for symbol {symbol}'.format(
-                s=dt_32.seconds, ms=dt_32.microseconds, symbol=symbol))
-
-        return df.set_index('date')
+    def _new_aggregation(self, symbol):
+        return DailyAggregation(symbol)
 
 class DailyAggregationsRun(AggregationsRun):
-    def save_daily_df(self, base_dir='data'):
+    def __init__(self, aggregations = None, single_writer = False, export_format = None, partition_by_date = False, segment_writer = None):
+        '''
+
+        :param export_format: ExportFormat the minute and daily DataFrames are saved in, csv if not given.
+        :param partition_by_date: if True, the files are saved under base_dir/date=YYYY-MM-DD/.
+        :param segment_writer: SegmentWriter the minute bars are persisted to during the session. If given,
+            the minute file at the end of the day is made of its segments, so it has all the bars of the day
+            rather than the retained ones only.
+        '''
+        super(DailyAggregationsRun, self).__init__(aggregations if aggregations else DailyAggregations(), single_writer)
+        self.export_format = export_format if export_format else get_export_format()
+        self.partition_by_date = partition_by_date
+        if segment_writer:
+            self.segment_writer = segment_writer
+            self.bar_fanout.add_sink(segment_writer)
+
+    def _export_df(self, df, base_dir, name):
+        t_1 = datetime.datetime.utcnow()
+        paths = export_df(df, base_dir, name, self.export_format, self.partition_by_date)
+        dt_21 = datetime.datetime.utcnow() - t_1
+        logging.info('{s} seconds {ms} microseconds took to save {name} to {paths}',
+            s=dt_21.seconds, ms=dt_21.microseconds, name=name, paths=paths)
+        return paths
+
+    def _get_minute_df(self):
+        if not self.segment_writer:
+            return self.aggregations.get_minute_df()
+        self.aggregations.finalize_bars()
+        self.segment_writer.flush()
+        return self.segment_writer.read_segments()
+
+    def _save_daily_df(self, base_dir):
         logging.info('upload_daily_df')
         self.daily_trade_started = False
         t_1 = datetime.datetime.utcnow()
         df_daily = self.aggregations.get_daily_df()
         t_2 = datetime.datetime.utcnow()
         dt_21 = t_2 - t_1
-        logging.info('[save_daily_df] {s} seconds took to get daily_df'.format(s=dt_21.seconds))
-        if not os.path.exists(base_dir):
-            os.mkdir(base_dir)
-        df_daily.to_csv('{base_dir}/daily.csv'.format(base_dir=base_dir))
+        logging.info('[save_daily_df] {s} seconds took to get daily_df', s=dt_21.seconds)
+        self._export_df(df_daily, base_dir, 'daily')
         return df_daily
 
-    def on_daily_trade_end(self, base_dir='data'):
+    def _on_daily_trade_end(self, base_dir):
         logging.info('on_daily_trade_end')
         self.daily_trade_started = False
         t_1 = datetime.datetime.utcnow()
-        df_minute = self.aggregations.get_minute_df()
+        df_minute = self._get_minute_df()
         t_2 = datetime.datetime.utcnow()
         dt_21 = t_2 - t_1
-        logging.info('{s} seconds took to get minute_df'.format(s=dt_21.seconds))
+        logging.info('{s} seconds took to get minute_df', s=dt_21.seconds)
         df_daily = self.aggregations.get_daily_df()
         t_3 = datetime.datetime.utcnow()
         dt_32 = t_3 - t_2
-        logging.info('{s} seconds took to get daily_df'.format(s=dt_32.seconds))
-        if not os.path.exists(base_dir):
-            os.mkdir(base_dir)
-        df_minute.to_csv('{base_dir}/minute.csv'.format(base_dir=base_dir))
-        df_daily.to_csv('{base_dir}/daily.csv'.format(base_dir=base_dir))
+        logging.info('{s} seconds took to get daily_df', s=dt_32.seconds)
+        self._export_df(df_minute, base_dir, 'minute')
+        self._export_df(df_daily, base_dir, 'daily')
+        if self.segment_writer:
+            self.segment_writer.remove_segments()
         self.aggregations.clean()
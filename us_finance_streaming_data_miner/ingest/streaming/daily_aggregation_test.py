@@ -0,0 +1,41 @@
+import unittest, datetime
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Trade
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregations
+
+class TestDailyAggregations(unittest.TestCase):
+    def test_daily_df(self):
+        aggregations = DailyAggregations()
+        one_minute_seconds = 60
+        symbol_1 = 'SYM1'
+        symbol_2 = 'SYM2'
+
+        aggregations.on_trade(Trade(0, symbol_1, 100.0, 1.0))
+        aggregations.on_trade(Trade(1, symbol_1, 110.0, 1.0))
+        aggregations.on_trade(Trade(one_minute_seconds, symbol_1, 120.0, 1.0))
+        aggregations.on_trade(Trade(one_minute_seconds + 1, symbol_1, 130.0, 1.0))
+        aggregations.on_trade(Trade(0, symbol_2, 120.0, 1.0))
+
+        df = aggregations.get_daily_df(print_log=False)
+        d_zero_epoch = datetime.date(year=1970, month=1, day=1)
+
+        self.assertEqual(2, len(df))
+        row_0 = df.iloc[0]
+        self.assertEqual(d_zero_epoch, row_0.name)
+        self.assertEqual('SYM1', row_0.symbol)
+        self.assertEqual(100, row_0.open)
+        self.assertEqual(130, row_0.high)
+        self.assertEqual(100, row_0.low)
+        self.assertEqual(130, row_0.close)
+        self.assertEqual(4, row_0.volume)
+
+        row_1 = df.iloc[1]
+        self.assertEqual(d_zero_epoch, row_1.name)
+        self.assertEqual('SYM2', row_1.symbol)
+        self.assertEqual(120, row_1.open)
+        self.assertEqual(120, row_1.close)
+        self.assertEqual(1, row_1.volume)
+
+    def test_daily_df_empty(self):
+        df = DailyAggregations().get_daily_df(print_log=False)
+        self.assertEqual(0, len(df))
@@ -0,0 +1,56 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DECODER_JSON = 'json'
+DECODER_ORJSON = 'orjson'
+
+
+def get_decoder_names():
+    '''
+    :return: the names of the decoders available in this environment, the fastest first.
+    '''
+    return ([DECODER_ORJSON] if orjson else []) + [DECODER_JSON]
+
+def get_loads(decoder_name=None):
+    '''
+    Gets the function that decodes a JSON bytes or str.
+
+    :param decoder_name: one of get_decoder_names(), the fastest available if not given.
+    '''
+    if decoder_name is None:
+        decoder_name = get_decoder_names()[0]
+    if decoder_name == DECODER_ORJSON:
+        if not orjson:
+            raise ValueError('orjson is not installed')
+        return orjson.loads
+    if decoder_name == DECODER_JSON:
+        return json.loads
+    raise ValueError('unknown decoder: {decoder_name}'.format(decoder_name=decoder_name))
+
+_loads = get_loads()
+
+def set_decoder(decoder_name):
+    global _loads
+    _loads = get_loads(decoder_name)
+
+def decode_events(data, loads=None):
+    '''
+    Decodes a message payload into the list of its events.
+
+    The polygon payload is a JSON string whose content is the JSON array of the events,
+    the binance payload is a JSON object of a single event. Both forms are accepted.
+
+    :param data: bytes of the payload
+    :return: list of dict
+    '''
+    loads = loads or _loads
+    decoded = loads(data)
+    if isinstance(decoded, str):
+        decoded = loads(decoded)
+    if isinstance(decoded, dict):
+        return [decoded]
+    return decoded
@@ -0,0 +1,57 @@
+import argparse, json, time
+import numpy as np
+
+from us_finance_streaming_data_miner.ingest.streaming.decode import decode_events, get_decoder_names, get_loads
+from us_finance_streaming_data_miner.ingest.streaming.polygon_run import _t_msg_to_trade
+
+_FIRST_TIMESTAMP_MILLI = 1577975400 * 1000 # 2020-01-02 09:30 US/Eastern
+
+
+def new_polygon_payloads(payload_cnt, events_per_payload):
+    '''
+    Generates payloads shaped as the polygon trade messages published to Pub/Sub,
+    a JSON string of the JSON array of the trade events.
+    '''
+    rng = np.random.default_rng(0)
+    payloads = []
+    for i in range(payload_cnt):
+        events = [{
+            'ev': 'T', 'sym': 'SYM{j}'.format(j=int(j)), 'x': 4, 'i': str(i * events_per_payload + k),
+            'z': 3, 'p': round(float(p), 2), 's': 100, 'c': [14, 41], 't': _FIRST_TIMESTAMP_MILLI + i,
+        } for k, (j, p) in enumerate(zip(rng.integers(0, 3500, size=events_per_payload), 100 + rng.normal(size=events_per_payload)))]
+        payloads.append(json.dumps(json.dumps(events)).encode('utf-8'))
+    return payloads
+
+def _legacy_decode(data):
+    # the decode as it used to be done, decoding the utf-8 first and keeping only the first event
+    msg_str = json.loads(data.decode('utf-8'))
+    return json.loads(msg_str)[:1]
+
+def _time(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+def _decode_to_trades(payloads, loads):
+    return [_t_msg_to_trade(msg) for data in payloads for msg in decode_events(data, loads)]
+
+def run(payload_cnt, events_per_payload):
+    payloads = new_polygon_payloads(payload_cnt, events_per_payload)
+    event_cnt = payload_cnt * events_per_payload
+
+    dt = _time(lambda: [_t_msg_to_trade(msg) for data in payloads for msg in _legacy_decode(data)])
+    print('legacy json, first event only: {payload_cnt} payloads, {dt:.3f} seconds, {us:.2f} microseconds per payload'.format(
+        payload_cnt=payload_cnt, dt=dt, us=dt / payload_cnt * 1e6))
+
+    for decoder_name in get_decoder_names():
+        loads = get_loads(decoder_name)
+        dt = _time(lambda: _decode_to_trades(payloads, loads))
+        print('{decoder_name}, all events: {event_cnt} events, {dt:.3f} seconds, {us:.2f} microseconds per event'.format(
+            decoder_name=decoder_name, event_cnt=event_cnt, dt=dt, us=dt / event_cnt * 1e6))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--payloads", type=int, default=20000, help="number of payloads.")
+    parser.add_argument("-e", "--events", type=int, default=10, help="number of trade events per payload.")
+    args = parser.parse_args()
+    run(args.payloads, args.events)
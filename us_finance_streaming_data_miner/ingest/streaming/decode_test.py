@@ -0,0 +1,35 @@
+import unittest, json
+
+from us_finance_streaming_data_miner.ingest.streaming.decode import decode_events, get_decoder_names, get_loads, DECODER_JSON
+from us_finance_streaming_data_miner.ingest.streaming.polygon_run import _t_msg_to_trade, _a_msg_to_trade
+
+_T_EVENTS = [
+    {'ev': 'T', 'sym': 'AAPL', 'p': 300.5, 's': 100, 't': 1577975400123},
+    {'ev': 'T', 'sym': 'MSFT', 'p': 160.25, 's': 20, 't': 1577975401000},
+]
+
+class TestDecode(unittest.TestCase):
+    def test_decoder_names(self):
+        self.assertEqual(DECODER_JSON, get_decoder_names()[-1])
+        with self.assertRaises(ValueError):
+            get_loads('unknown')
+
+    def test_polygon_payload(self):
+        data = json.dumps(json.dumps(_T_EVENTS)).encode('utf-8')
+        for decoder_name in get_decoder_names():
+            self.assertEqual(_T_EVENTS, decode_events(data, get_loads(decoder_name)))
+
+    def test_binance_payload(self):
+        data = json.dumps(_T_EVENTS[0]).encode('utf-8')
+        for decoder_name in get_decoder_names():
+            self.assertEqual(_T_EVENTS[:1], decode_events(data, get_loads(decoder_name)))
+
+    def test_t_msg_to_trade(self):
+        trade = _t_msg_to_trade(_T_EVENTS[0])
+        self.assertEqual(('AAPL', 300.5, 100, 1577975400), (trade.symbol, trade.price, trade.volume, trade.timestamp_seconds))
+        with self.assertRaises(Exception):
+            _t_msg_to_trade({'ev': 'T', 'sym': 'AAPL'})
+
+    def test_a_msg_to_trade(self):
+        trade = _a_msg_to_trade({'ev': 'A', 'sym': 'AAPL', 'c': 300.5, 'v': 1000, 's': 1577975400000})
+        self.assertEqual(('AAPL', 300.5, 1000, 1577975400), (trade.symbol, trade.price, trade.volume, trade.timestamp_seconds))
@@ -0,0 +1,34 @@
+import argparse, os, tempfile, time
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation_benchmark import new_daily_aggregations
+from us_finance_streaming_data_miner.ingest.streaming.export_format import get_export_format, export_df, FORMAT_CSV, FORMAT_PARQUET, FORMAT_FEATHER
+
+
+def _time(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+def run(symbol_cnt, format_names, compression):
+    '''
+    Writes the minute DataFrame of symbol_cnt symbols over a full day in each format, printing the time and the size.
+    '''
+    df_minute = new_daily_aggregations(symbol_cnt).get_minute_df(print_log=False)
+    print('minute_df: {l} bars of {symbol_cnt} symbols'.format(l=len(df_minute), symbol_cnt=symbol_cnt))
+    for format_name in format_names:
+        export_format = get_export_format(format_name, compression)
+        with tempfile.TemporaryDirectory() as base_dir:
+            paths = []
+            dt_write = _time(lambda: paths.extend(export_df(df_minute, base_dir, 'minute', export_format)))
+            size = os.path.getsize(paths[0])
+            dt_read = _time(lambda: export_format.read(paths[0]))
+        print('{format_name}: write {dt_write:.3f} seconds, read {dt_read:.3f} seconds, {mb:.1f} MB'.format(
+            format_name=format_name, dt_write=dt_write, dt_read=dt_read, mb=size / 1024 / 1024))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--symbols", type=int, default=3500, help="number of symbols.")
+    parser.add_argument("-f", "--formats", default=','.join([FORMAT_CSV, FORMAT_PARQUET, FORMAT_FEATHER]), help="comma separated export formats.")
+    parser.add_argument("-c", "--compression", default=None, help="compression codec of parquet and feather.")
+    args = parser.parse_args()
+    run(args.symbols, args.formats.split(','), args.compression)
@@ -0,0 +1,115 @@
+import os
+from abc import ABC, abstractmethod
+import pandas as pd
+
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+FORMAT_FEATHER = 'feather'
+
+
+class ExportFormat(ABC):
+    '''
+    File format the minute and daily DataFrames are exported in.
+    The index is written as a column, as read() gives it back.
+    '''
+    extension = None
+
+    @abstractmethod
+    def write(self, df, path):
+        '''
+        Writes the DataFrame to path, its index as a column.
+        '''
+
+    @abstractmethod
+    def read(self, path):
+        '''
+        :return: the DataFrame written to path, with the index as a column.
+        '''
+
+    def get_filename(self, name):
+        return '{name}.{extension}'.format(name=name, extension=self.extension)
+
+class CsvFormat(ExportFormat):
+    extension = 'csv'
+
+    def write(self, df, path):
+        df.reset_index().to_csv(path, index=False)
+
+    def read(self, path):
+        return pd.read_csv(path)
+
+class ParquetFormat(ExportFormat):
+    '''
+    Parquet, compressed per column. Keeps the dtypes, the timezone of the datetime included.
+    Requires pyarrow.
+    '''
+    extension = 'parquet'
+
+    def __init__(self, compression = 'zstd'):
+        self.compression = compression
+
+    def write(self, df, path):
+        df.reset_index().to_parquet(path, engine='pyarrow', compression=self.compression, index=False)
+
+    def read(self, path):
+        return pd.read_parquet(path, engine='pyarrow')
+
+class FeatherFormat(ExportFormat):
+    '''
+    Arrow IPC (Feather v2), the fastest to write and read. Requires pyarrow.
+    '''
+    extension = 'feather'
+
+    def __init__(self, compression = 'zstd'):
+        self.compression = compression
+
+    def write(self, df, path):
+        df.reset_index().to_feather(path, compression=self.compression)
+
+    def read(self, path):
+        return pd.read_feather(path)
+
+def get_export_format(name = FORMAT_CSV, compression = None):
+    '''
+    :param name: one of FORMAT_CSV, FORMAT_PARQUET, FORMAT_FEATHER
+    :param compression: the compression codec of parquet and feather, zstd if not given.
+    '''
+    if name == FORMAT_CSV:
+        return CsvFormat()
+    if name == FORMAT_PARQUET:
+        return ParquetFormat(compression or 'zstd')
+    if name == FORMAT_FEATHER:
+        return FeatherFormat(compression or 'zstd')
+    raise ValueError('unknown export format: {name}'.format(name=name))
+
+def get_partition_dir(base_dir, date):
+    return os.path.join(base_dir, 'date={date}'.format(date=date))
+
+def _get_dates(df):
+    index = df.index
+    if isinstance(index, pd.DatetimeIndex):
+        return index.date
+    return index
+
+def export_df(df, base_dir, name, export_format, partition_by_date = False):
+    '''
+    Writes the DataFrame indexed by datetime or date to base_dir.
+
+    :param partition_by_date: if True, the rows are written per date to base_dir/date=YYYY-MM-DD/name.ext,
+        otherwise all to base_dir/name.ext
+    :return: list of the paths written
+    '''
+    if not partition_by_date:
+        os.makedirs(base_dir, exist_ok=True)
+        path = os.path.join(base_dir, export_format.get_filename(name))
+        export_format.write(df, path)
+        return [path]
+
+    paths = []
+    for date, df_date in df.groupby(_get_dates(df), sort=True):
+        partition_dir = get_partition_dir(base_dir, date)
+        os.makedirs(partition_dir, exist_ok=True)
+        path = os.path.join(partition_dir, export_format.get_filename(name))
+        export_format.write(df_date, path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,71 @@
+import unittest, os, tempfile
+import pandas as pd
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Trade
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.export_format import get_export_format, export_df, FORMAT_CSV, FORMAT_PARQUET, FORMAT_FEATHER
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+def _new_aggregations_run(export_format = None, partition_by_date = False):
+    aggregations_run = DailyAggregationsRun(export_format=export_format, partition_by_date=partition_by_date)
+    one_day_seconds = 3600 * 24
+    aggregations_run.on_trade(Trade(0, 'SYM1', 100.0, 1.0))
+    aggregations_run.on_trade(Trade(60, 'SYM1', 110.0, 2.0))
+    aggregations_run.on_trade(Trade(one_day_seconds, 'SYM2', 120.0, 3.0))
+    return aggregations_run
+
+class TestExportFormat(unittest.TestCase):
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            get_export_format('xls')
+
+    def test_csv(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            aggregations_run = _new_aggregations_run()
+            df_minute = aggregations_run.aggregations.get_minute_df(print_log=False)
+            aggregations_run.on_daily_trade_end(base_dir)
+
+            self.assertEqual(['daily.csv', 'minute.csv'], sorted(os.listdir(base_dir)))
+            df = get_export_format(FORMAT_CSV).read(os.path.join(base_dir, 'minute.csv'))
+            self.assertEqual(['datetime'] + list(df_minute.columns), list(df.columns))
+            self.assertEqual(list(df_minute.close), list(df.close))
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_columnar_keeps_dtypes(self):
+        for format_name in [FORMAT_PARQUET, FORMAT_FEATHER]:
+            export_format = get_export_format(format_name)
+            with tempfile.TemporaryDirectory() as base_dir:
+                aggregations_run = _new_aggregations_run(export_format)
+                df_minute = aggregations_run.aggregations.get_minute_df(print_log=False)
+                aggregations_run.on_daily_trade_end(base_dir)
+
+                df = export_format.read(os.path.join(base_dir, export_format.get_filename('minute')))
+                # the datetime resolution may differ, the timezone is kept
+                pd.testing.assert_frame_equal(df_minute.reset_index(), df, check_dtype=False)
+                self.assertEqual('UTC', str(df.datetime.dt.tz))
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_partition_by_date(self):
+        export_format = get_export_format(FORMAT_PARQUET)
+        with tempfile.TemporaryDirectory() as base_dir:
+            aggregations_run = _new_aggregations_run(export_format, partition_by_date=True)
+            aggregations_run.on_daily_trade_end(base_dir)
+
+            self.assertEqual(['date=1970-01-01', 'date=1970-01-02'], sorted(os.listdir(base_dir)))
+            df = export_format.read(os.path.join(base_dir, 'date=1970-01-01', 'minute.parquet'))
+            self.assertEqual(['SYM1', 'SYM1'], list(df.symbol))
+            df = export_format.read(os.path.join(base_dir, 'date=1970-01-02', 'daily.parquet'))
+            self.assertEqual(['SYM2'], list(df.symbol))
+
+    def test_export_df_empty(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            df = pd.DataFrame({'close': []}, index=pd.DatetimeIndex([], name='datetime', tz='UTC'))
+            self.assertEqual([], export_df(df, base_dir, 'minute', get_export_format(), partition_by_date=True))
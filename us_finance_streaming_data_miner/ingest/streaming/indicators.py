@@ -0,0 +1,158 @@
+from abc import ABC, abstractmethod
+from collections import deque
+
+_MINUTES_PER_DAY = 24 * 60
+
+class Indicator(ABC):
+    '''
+    Indicator over the minute bars of a symbol, updated in O(1) per bar.
+    Both methods take (minute, open, high, low, close, volume).
+    '''
+    @abstractmethod
+    def on_bar(self, minute, open_, high, low, close_, volume):
+        '''
+        Called with each bar once its minute is over, it is an Aggregation bar listener.
+        '''
+
+    @abstractmethod
+    def get(self, minute, open_, high, low, close_, volume):
+        '''
+        Called with the bar still in progress, merged into the value without updating the state.
+        '''
+
+class RollingChange(Indicator):
+    '''
+    (close - prev_close) / prev_close where prev_close is the close of window minutes before.
+    0 while the bar of window minutes before is not known yet.
+    '''
+    def __init__(self, window):
+        self.window = window
+        self.closes = deque(maxlen=window)
+
+    def on_bar(self, minute, open_, high, low, close_, volume):
+        self.closes.append(close_)
+
+    def get(self, minute, open_, high, low, close_, volume):
+        if len(self.closes) < self.window:
+            return 0
+        prev_close = self.closes[0]
+        return (close_ - prev_close) / prev_close
+
+class RollingQuantity(Indicator):
+    '''
+    Sum of close * volume over the last window minutes, the one in progress included.
+    '''
+    def __init__(self, window):
+        self.window = window
+        self.quantities = deque()
+        self.sum = 0.0
+
+    def on_bar(self, minute, open_, high, low, close_, volume):
+        quantity = close_ * volume
+        self.quantities.append(quantity)
+        self.sum += quantity
+        if len(self.quantities) >= self.window:
+            self.sum -= self.quantities.popleft()
+
+    def get(self, minute, open_, high, low, close_, volume):
+        return self.sum + close_ * volume
+
+class _RollingExtreme(Indicator):
+    '''
+    Extreme over the last window minutes, the one in progress included, kept in a monotonic deque.
+    '''
+    def __init__(self, window):
+        self.window = window
+        self.candidates = deque() # (minute, value), the values monotonic from the extreme on
+
+    @abstractmethod
+    def _value_of(self, open_, high, low, close_):
+        '''
+        :return: the value of the bar the extreme is taken of.
+        '''
+
+    @abstractmethod
+    def _is_beyond(self, value, other):
+        '''
+        :return: True if value is more extreme than other.
+        '''
+
+    def on_bar(self, minute, open_, high, low, close_, volume):
+        value = self._value_of(open_, high, low, close_)
+        candidates = self.candidates
+        while candidates and not self._is_beyond(candidates[-1][1], value):
+            candidates.pop()
+        candidates.append((minute, value))
+        # the bar in progress is the next minute, and the window includes it
+        while candidates and candidates[0][0] <= minute + 1 - self.window:
+            candidates.popleft()
+
+    def get(self, minute, open_, high, low, close_, volume):
+        value = self._value_of(open_, high, low, close_)
+        candidates = self.candidates
+        if candidates and candidates[0][0] > minute - self.window and self._is_beyond(candidates[0][1], value):
+            return candidates[0][1]
+        return value
+
+class RollingMin(_RollingExtreme):
+    '''
+    Lowest low over the last window minutes, the one in progress included.
+    '''
+    def _value_of(self, open_, high, low, close_):
+        return low
+
+    def _is_beyond(self, value, other):
+        return value < other
+
+class RollingMax(_RollingExtreme):
+    '''
+    Highest high over the last window minutes, the one in progress included.
+    '''
+    def _value_of(self, open_, high, low, close_):
+        return high
+
+    def _is_beyond(self, value, other):
+        return value > other
+
+class Vwap(Indicator):
+    '''
+    Volume weighted average close since the first bar of the (utc) day, the one in progress included.
+    A bar of a later day starts the accumulation over, as DailyBar does, so the sessions are not mixed.
+    '''
+    def __init__(self):
+        self.day = None
+        self.quantity = 0.0
+        self.volume = 0.0
+
+    def on_bar(self, minute, open_, high, low, close_, volume):
+        day = minute // _MINUTES_PER_DAY
+        if day != self.day:
+            self.day = day
+            self.quantity, self.volume = 0.0, 0.0
+        self.quantity += close_ * volume
+        self.volume += volume
+
+    def get(self, minute, open_, high, low, close_, volume):
+        quantity, total_volume = close_ * volume, volume
+        if minute // _MINUTES_PER_DAY == self.day:
+            quantity += self.quantity
+            total_volume += self.volume
+        if not total_volume:
+            return close_
+        return quantity / total_volume
+
+class Ema(Indicator):
+    '''
+    Exponential moving average of close with alpha = 2 / (span + 1), the one in progress included.
+    '''
+    def __init__(self, span):
+        self.alpha = 2.0 / (span + 1)
+        self.ema = None
+
+    def on_bar(self, minute, open_, high, low, close_, volume):
+        self.ema = close_ if self.ema is None else self.ema + self.alpha * (close_ - self.ema)
+
+    def get(self, minute, open_, high, low, close_, volume):
+        if self.ema is None:
+            return close_
+        return self.ema + self.alpha * (close_ - self.ema)
@@ -0,0 +1,73 @@
+import unittest
+import numpy as np, pandas as pd
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Aggregation, Trade
+from us_finance_streaming_data_miner.ingest.streaming.indicators import RollingChange, RollingQuantity, RollingMin, RollingMax, Vwap, Ema
+
+_SYMBOL = 'DUMMY_SYMBOL'
+_MINUTES_PER_DAY = 24 * 60
+
+
+def _new_trades(minute_cnt):
+    rng = np.random.default_rng(0)
+    # trades every few minutes, leaving gaps that are filled with flat bars
+    minutes = np.sort(rng.choice(minute_cnt, size=minute_cnt // 2, replace=False))
+    return [Trade(int(m) * 60 + int(s), _SYMBOL, float(p), float(v)) for m, s, p, v in
+            zip(minutes, rng.integers(0, 60, size=len(minutes)), 100 + rng.normal(size=len(minutes)), rng.integers(1, 10, size=len(minutes)))]
+
+class TestIndicators(unittest.TestCase):
+    def _assert_matches_df(self, new_indicator, get_expected, replay_from = None):
+        '''
+        Checks the indicator against the value computed on the minute DataFrame after every trade.
+        '''
+        aggregation = Aggregation(_SYMBOL)
+        indicator = None
+        for i, trade in enumerate(_new_trades(200)):
+            aggregation.on_trade(trade)
+            if indicator is None and (replay_from is None or i >= replay_from):
+                indicator = new_indicator()
+                aggregation.add_bar_listener(indicator.on_bar)
+            if indicator is None:
+                continue
+            df = aggregation.get_minute_df(print_log=False)
+            value = indicator.get(*aggregation.bars.get_bar(aggregation.bars.slot_at(-1)))
+            self.assertAlmostEqual(get_expected(df), value, msg='after the trade {i}'.format(i=i))
+
+    def test_rolling_change(self):
+        def get_expected(df):
+            if len(df) <= 5:
+                return 0
+            return (df.close.values[-1] - df.close.values[-6]) / df.close.values[-6]
+        self._assert_matches_df(lambda: RollingChange(5), get_expected)
+
+    def test_rolling_quantity(self):
+        self._assert_matches_df(lambda: RollingQuantity(7), lambda df: (df.close * df.volume).values[-7:].sum())
+
+    def test_rolling_min_max(self):
+        self._assert_matches_df(lambda: RollingMin(4), lambda df: df.low.values[-4:].min())
+        self._assert_matches_df(lambda: RollingMax(4), lambda df: df.high.values[-4:].max())
+        self._assert_matches_df(lambda: RollingMax(1), lambda df: df.high.values[-1])
+
+    def test_vwap(self):
+        def get_expected(df):
+            if df.volume.sum() == 0:
+                return df.close.values[-1]
+            return (df.close * df.volume).sum() / df.volume.sum()
+        self._assert_matches_df(Vwap, get_expected)
+
+    def test_vwap_new_day(self):
+        vwap = Vwap()
+        vwap.on_bar(_MINUTES_PER_DAY - 2, 100.0, 100.0, 100.0, 100.0, 10.0)
+        vwap.on_bar(_MINUTES_PER_DAY - 1, 110.0, 110.0, 110.0, 110.0, 10.0)
+        self.assertEqual(105.0, vwap.get(_MINUTES_PER_DAY - 1, 110.0, 110.0, 110.0, 110.0, 0.0))
+        # the first bar of the next day, in progress then over
+        self.assertEqual(200.0, vwap.get(_MINUTES_PER_DAY, 200.0, 200.0, 200.0, 200.0, 1.0))
+        vwap.on_bar(_MINUTES_PER_DAY, 200.0, 200.0, 200.0, 200.0, 1.0)
+        self.assertEqual(250.0, vwap.get(_MINUTES_PER_DAY + 1, 300.0, 300.0, 300.0, 300.0, 1.0))
+
+    def test_ema(self):
+        self._assert_matches_df(lambda: Ema(10), lambda df: df.close.ewm(span=10, adjust=False).mean().values[-1])
+
+    def test_replay(self):
+        self._assert_matches_df(lambda: RollingQuantity(7), lambda df: (df.close * df.volume).values[-7:].sum(), replay_from=50)
+        self._assert_matches_df(lambda: RollingMin(4), lambda df: df.low.values[-4:].min(), replay_from=50)
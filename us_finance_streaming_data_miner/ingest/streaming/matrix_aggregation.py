@@ -0,0 +1,60 @@
+import pandas as pd, numpy as np
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Aggregations, Bar, bar_columns_to_minute_df
+from us_finance_streaming_data_miner.ingest.streaming.bar_buffer import BarMatrix
+
+
+class MatrixAggregations(Aggregations):
+    '''
+    Aggregations backend that keeps the bars of all the symbols in a single BarMatrix.
+
+    The per symbol Aggregation objects still serve the ingestion, writing into their row of the matrix,
+    while the cross-sectional reads are vectorized over the matrix.
+    '''
+    def __init__(self, capacity=300, initial_rows=64):
+        self.capacity = capacity
+        self.initial_rows = initial_rows
+        super(MatrixAggregations, self).__init__()
+        self.matrix = BarMatrix(capacity, initial_rows)
+
+    def clean(self):
+        super(MatrixAggregations, self).clean()
+        self.matrix = BarMatrix(self.capacity, self.initial_rows)
+
+    def _bind_row(self, aggregation):
+        '''
+        Makes the new aggregation store its bars in a new row of the matrix.
+        '''
+        aggregation._bar_with_times_max_length = self.capacity
+        aggregation.bars = self.matrix.add_row(aggregation.symbol)
+        return aggregation
+
+    def _new_aggregation(self, symbol):
+        return self._bind_row(super(MatrixAggregations, self)._new_aggregation(symbol))
+
+    def get_status_string(self):
+        sizes = self.matrix.get_sizes()
+        return 'size of aggregation_per_symbol: {l}, bars_avg: {bars_avg}'.format(
+            l = len(self.matrix),
+            bars_avg = sizes.mean() if len(sizes) else np.nan
+        )
+
+    def get_minute_bars(self, minute):
+        rows, values = self.matrix.get_minute_snapshot(minute)
+        return np.asarray(self.matrix.symbols, dtype=object)[rows], values
+
+    def get_minute_snapshot(self, minute):
+        '''
+        Gets the bars of all the symbols at the epoch minute.
+
+        :return: DataFrame indexed by symbol with open, high, low, close, volume columns.
+        '''
+        symbols, values = self.get_minute_bars(minute)
+        return pd.DataFrame(values, index=pd.Index(symbols, name='symbol'), columns=Bar.get_tuple_names()[1:])
+
+    def get_minute_df(self, print_log = True):
+        if print_log:
+            logging.info('Aggregations.get_minute_df for {l_s} symbols', l_s=len(self.matrix))
+        rows, minutes, values = self.matrix.to_columns()
+        symbols = np.asarray(self.matrix.symbols, dtype=object)[rows]
+        return bar_columns_to_minute_df(minutes, symbols, values).set_index('datetime')
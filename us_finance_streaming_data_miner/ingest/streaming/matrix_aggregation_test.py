@@ -0,0 +1,87 @@
+import unittest, datetime
+import pytz
+import numpy as np
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Trade
+from us_finance_streaming_data_miner.ingest.streaming.matrix_aggregation import MatrixAggregations
+
+class TestMatrixAggregations(unittest.TestCase):
+    def test_on_trade(self):
+        aggregations = MatrixAggregations(initial_rows=1)
+        one_minute_seconds = 60
+        symbol_1 = 'SYM1'
+        symbol_2 = 'SYM2'
+
+        aggregations.on_trade(Trade(0, symbol_1, 100.0, 1.0))
+        aggregations.on_trade(Trade(1, symbol_1, 110.0, 1.0))
+        # the matrix grows here
+        aggregations.on_trade(Trade(0, symbol_2, 120.0, 1.0))
+        aggregations.on_trade(Trade(one_minute_seconds, symbol_1, 120.0, 1.0))
+        aggregations.on_trade(Trade(one_minute_seconds + 1, symbol_1, 130.0, 1.0))
+
+        self.assertEqual(2, len(aggregations.matrix))
+        aggregation_1 = aggregations.aggregation_per_symbol[symbol_1]
+        self.assertEqual(2, len(aggregation_1.bar_with_times))
+        bar_1_t_0 = aggregation_1.bar_with_times[0]
+        self.assertEqual(100, bar_1_t_0.bar.open)
+        self.assertEqual(110, bar_1_t_0.bar.close)
+        self.assertEqual(2, bar_1_t_0.bar.volume)
+
+        self.assertEqual([2, 1], list(aggregations.matrix.get_sizes()))
+        self.assertIn('bars_avg: 1.5', aggregations.get_status_string())
+
+    def test_minute_snapshot(self):
+        aggregations = MatrixAggregations()
+        one_minute_seconds = 60
+        aggregations.on_trade(Trade(0, 'SYM1', 100.0, 1.0))
+        aggregations.on_trade(Trade(one_minute_seconds, 'SYM1', 110.0, 2.0))
+        aggregations.on_trade(Trade(one_minute_seconds, 'SYM2', 120.0, 3.0))
+
+        df = aggregations.get_minute_snapshot(0)
+        self.assertEqual(['SYM1'], list(df.index))
+
+        df = aggregations.get_minute_snapshot(1)
+        self.assertEqual(['SYM1', 'SYM2'], list(df.index))
+        self.assertEqual(110, df.loc['SYM1'].close)
+        self.assertEqual(2, df.loc['SYM1'].volume)
+        self.assertEqual(120, df.loc['SYM2'].close)
+        self.assertEqual(3, df.loc['SYM2'].volume)
+
+    def test_minute_df(self):
+        aggregations = MatrixAggregations(capacity=3)
+        one_minute_seconds = 60
+        for i in range(5):
+            aggregations.on_trade(Trade(one_minute_seconds * i, 'SYM1', 100.0 + i, 1.0))
+        aggregations.on_trade(Trade(0, 'SYM2', 120.0, 1.0))
+
+        df = aggregations.get_minute_df(print_log=False)
+        self.assertEqual(4, len(df))
+        self.assertEqual(['SYM1', 'SYM1', 'SYM1', 'SYM2'], list(df.symbol))
+        self.assertEqual([102, 103, 104, 120], list(df.close))
+        self.assertEqual(pytz.utc.localize(datetime.datetime.utcfromtimestamp(one_minute_seconds * 2)), df.index[0])
+        self.assertEqual(pytz.utc.localize(datetime.datetime.utcfromtimestamp(0)), df.index[3])
+
+    def test_clean(self):
+        aggregations = MatrixAggregations()
+        aggregations.on_trade(Trade(0, 'SYM1', 100.0, 1.0))
+        aggregations.clean()
+        self.assertEqual(0, len(aggregations.matrix))
+        self.assertEqual(0, len(aggregations.aggregation_per_symbol))
+        aggregations.on_trade(Trade(0, 'SYM1', 100.0, 1.0))
+        self.assertEqual(1, len(aggregations.matrix))
+
+    def test_window(self):
+        aggregations = MatrixAggregations(capacity=5)
+        one_minute_seconds = 60
+        for i in range(3):
+            aggregations.on_trade(Trade(one_minute_seconds * i, 'SYM1', 100.0 + i, 1.0))
+        aggregations.on_trade(Trade(one_minute_seconds * 2, 'SYM2', 120.0, 2.0))
+        aggregations.on_trade(Trade(one_minute_seconds * 3, 'SYM2', 130.0, 3.0))
+
+        closes, volumes = aggregations.matrix.get_window(3, 4)
+        # SYM1 has no trade at the minute 3, its last close is carried over with zero volume
+        np.testing.assert_array_equal([[100, 101, 102, 102], [np.nan, np.nan, 120, 130]], closes)
+        np.testing.assert_array_equal([[1, 1, 1, 0], [np.nan, np.nan, 2, 3]], volumes)
+
+        with self.assertRaises(ValueError):
+            aggregations.matrix.get_window(3, 6)
@@ -1,31 +1,57 @@
-import json, os
+import os
 from google.cloud import pubsub_v1
 from pytz import timezone
-import us_finance_streaming_data_miner.ingest.streaming.aggregation
-from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun, Aggregations
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun, Aggregations, Trade
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.decode import decode_events
+from us_finance_streaming_data_miner.ingest.streaming.batch_ingest import BatchIngest, get_flow_control, DEFAULT_MAX_MESSAGES, DEFAULT_MAX_BYTES
+from us_finance_streaming_data_miner.util.fake_pubsub import FakeSubscriberClient
+from us_finance_streaming_data_miner.util.minute_clock import MinuteClock
 from threading import Thread
 import us_finance_streaming_data_miner.util.logging as logging
 import us_finance_streaming_data_miner.util.symbols
 
 _cnt_T = 0
 _cnt_A = 0
-_cnt_MA = 0
+_cnt_AM = 0
 
-def run_loop(polygon_aggregations_run, subscription_id):
+def _decode_message(message):
+    return decode_events(message.data)
+
+def run_loop(polygon_aggregations_run, subscription_id, batched = False, max_messages = DEFAULT_MAX_MESSAGES, max_bytes = DEFAULT_MAX_BYTES, subscriber = None):
+    '''
+    Subscribes to the polygon stream.
+
+    :param batched: if True, the messages are applied in batches by a single worker and acked after being applied.
+    :param max_messages: flow control, the maximum number of messages leased at once
+    :param max_bytes: flow control, the maximum bytes of messages leased at once
+    :param subscriber: SubscriberClient to subscribe with, e.g. a FakeSubscriberClient replaying recorded messages.
+    '''
     project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
 
-    subscriber = pubsub_v1.SubscriberClient()
+    if subscriber is None:
+        subscriber = pubsub_v1.SubscriberClient()
     subscription_path = subscriber.subscription_path(
         project_id, subscription_id
     )
 
-    def callback(message):
-        msg_str = json.loads(message.data.decode('utf-8'))
-        message.ack()
-        on_message(polygon_aggregations_run, json.loads(msg_str)[0])
+    if batched:
+        batch_ingest = BatchIngest(_decode_message, lambda msg: on_message(polygon_aggregations_run, msg),
+            wait_applied=polygon_aggregations_run.wait_applied)
+        callback = batch_ingest.callback
+    else:
+        def callback(message):
+            msgs = _decode_message(message)
+            message.ack()
+            for msg in msgs:
+                # the message is acked already, a malformed event must not lose the rest of it
+                try:
+                    on_message(polygon_aggregations_run, msg)
+                except Exception as ex:
+                    logging.error('failed to apply the event {msg}: {ex}', msg=msg, ex=ex)
 
     streaming_pull_future = subscriber.subscribe(
-        subscription_path, callback=callback
+        subscription_path, callback=callback, flow_control=get_flow_control(max_messages, max_bytes)
     )
     print("Listening for messages on {}\n".format(subscription_path))
 
@@ -34,39 +60,40 @@ def run_loop(polygon_aggregations_run, subscription_id):
     except Exception as ex:  # noqa
         logging.error(ex)
         streaming_pull_future.cancel()
-
-def run_mock_loop(polygon_aggregations_run):
-    pass
+    if batched:
+        batch_ingest.stop()
+
+def run_mock_loop(polygon_aggregations_run, recorded_path = None, speed = None, batched = False):
+    '''
+    Runs run_loop on the messages recorded at recorded_path, replayed by a FakeSubscriberClient without GCP.
+    It returns once all the messages are replayed and acked.
+
+    :param speed: 1 to replay at the wall clock, higher to accelerate, None for as fast as possible.
+    :return: the FakeSubscriberClient, with the counts and the rate of the replay.
+    '''
+    if not recorded_path:
+        logging.info('no recorded messages to replay')
+        return None
+    subscriber = FakeSubscriberClient(recorded_path, speed)
+    run_loop(polygon_aggregations_run, 'mock', batched, subscriber=subscriber)
+    logging.info('replayed {acked_cnt} messages of {recorded_path}, {rate:.0f} messages per second',
+        acked_cnt=subscriber.acked_cnt, recorded_path=recorded_path, rate=subscriber.get_rate())
+    return subscriber
 
 def _on_status_message(polygon_aggregations_run, msg):
-    print("< (status) {msg}".format(msg=msg))
+    logging.info('< (status) {msg}', msg=msg)
 
 def _t_msg_to_trade(msg):
-    keys = ['sym', 'p', 's', 't']
-    for key in keys:
-        if key not in msg:
-            print('"{key}" field not present in the message: {msg}'.format(key=key, msg=msg))
-    symbol = msg['sym']
-    price = msg['p']
-    volume = msg['s']
-    timestamp_milli = int(msg['t'])
-    timestamp_second = timestamp_milli // 1000
-    trade = us_finance_streaming_data_miner.ingest.streaming.aggregation.Trade(timestamp_second, symbol, price, volume)
-    return trade
+    try:
+        return Trade(int(msg['t']) // 1000, msg['sym'], msg['p'], msg['s'])
+    except KeyError as ex:
+        raise Exception('"{key}" field not present in the message: {msg}'.format(key=ex.args[0], msg=msg))
 
 def _a_msg_to_trade(msg):
-    keys = ['sym', 'c', 'v', 's']
-    for key in keys:
-        if key not in msg:
-            raise Exception('"{key}" field not present in the message: {msg}'.format(key=key, msg=msg))
-
-    symbol = msg['sym']
-    price = msg['c']
-    volume = msg['v']
-    timestamp_milli = int(msg['s'])
-    timestamp_second = timestamp_milli // 1000
-    trade = us_finance_streaming_data_miner.ingest.streaming.aggregation.Trade(timestamp_second, symbol, price, volume)
-    return trade
+    try:
+        return Trade(int(msg['s']) // 1000, msg['sym'], msg['c'], msg['v'])
+    except KeyError as ex:
+        raise Exception('"{key}" field not present in the message: {msg}'.format(key=ex.args[0], msg=msg))
 
 def _on_T_message(polygon_aggregations_run, msg):
     global _cnt_T
@@ -75,52 +102,63 @@ def _on_T_message(polygon_aggregations_run, msg):
     polygon_aggregations_run.on_trade(trade)
 
 def _on_Q_message(polygon_aggregations_run, msg):
-    print("< (Q) {msg}".format(msg=msg))
+    logging.debug('< (Q) {msg}', msg=msg)
 
 def _on_A_message(polygon_aggregations_run, msg):
     global _cnt_A
     _cnt_A += 1
     if _cnt_A % 100 == 0:
-        print("< (A) {msg}".format(msg=msg))
+        logging.debug('< (A) {msg}', msg=msg)
     trade = _a_msg_to_trade(msg)
     polygon_aggregations_run.on_trade(trade)
 
 def _on_AM_message(polygon_aggregations_run, msg):
     global _cnt_AM
     _cnt_AM += 1
-    print("< (AM) {msg}".format(msg=msg))
+    logging.debug('< (AM) {msg}', msg=msg)
 
 def _on_undefined_message(polygon_aggregations_run, msg):
-    print("< (undefined) {msg}".format(msg=msg))
-    logging.error("< (undefined) {msg}".format(msg=msg))
+    logging.error('< (undefined) {msg}', msg=msg)
 
 def on_message(polygon_aggregations_run, msg):
     if not msg:
         logging.error('the message is not valid')
+        return
 
-    if 'ev' not in msg:
-        logging.error('"ev" field not present in the message: {msg}'.format(msg=msg))
-    ev = msg['ev']
-    if ev == 'status':
-        _on_status_message(polygon_aggregations_run, msg)
-    elif ev == 'T':
+    ev = msg.get('ev')
+    if ev == 'T':
         _on_T_message(polygon_aggregations_run, msg)
-    elif ev == 'Q':
-        _on_Q_message(polygon_aggregations_run, msg)
     elif ev == 'A':
         _on_A_message(polygon_aggregations_run, msg)
+    elif ev is None:
+        logging.error('"ev" field not present in the message: {msg}', msg=msg)
+    elif ev == 'status':
+        _on_status_message(polygon_aggregations_run, msg)
+    elif ev == 'Q':
+        _on_Q_message(polygon_aggregations_run, msg)
     elif ev == 'AM':
         _on_AM_message(polygon_aggregations_run, msg)
     else:
         _on_undefined_message(polygon_aggregations_run, msg)
 
 class PolygonAggregationsMockRun(AggregationsRun):
-    def __init__(self):
-        super(PolygonAggregationsMockRun, self).__init__()
-        Thread(target=run_mock_loop, args=(self,)).start()
-
-class PolygonAggregationsRun(AggregationsRun):
-    def __init__(self, aggregations = None, subscription_id = None):
-        super(PolygonAggregationsRun, self).__init__()
-        self.aggregations = aggregations if aggregations else Aggregations()
-        Thread(target=run_loop, args=(self, subscription_id,)).start()
+    def __init__(self, aggregations = None, recorded_path = None, speed = None, batched = False):
+        super(PolygonAggregationsMockRun, self).__init__(aggregations, single_writer = True)
+        Thread(target=run_mock_loop, args=(self, recorded_path, speed, batched,)).start()
+
+class PolygonAggregationsRun(DailyAggregationsRun):
+    def __init__(self, aggregations = None, subscription_id = None, batched = False, max_messages = DEFAULT_MAX_MESSAGES, max_bytes = DEFAULT_MAX_BYTES,
+                 export_format = None, partition_by_date = False, segment_writer = None, minute_clock = None):
+        '''
+
+        :param export_format: ExportFormat the minute and daily files are saved in at the end of the day, csv if not given.
+        :param partition_by_date: if True, the files are saved under base_dir/date=YYYY-MM-DD/.
+        :param segment_writer: SegmentWriter the minute bars are persisted to during the session, see DailyAggregationsRun.
+        :param minute_clock: MinuteClock the minutes are closed by, a started wall clock one if not given,
+            so the bars of the symbols without a next trade are emitted as soon as their minute closes.
+        '''
+        super(PolygonAggregationsRun, self).__init__(aggregations, single_writer = True, export_format = export_format,
+            partition_by_date = partition_by_date, segment_writer = segment_writer)
+        self.minute_clock = minute_clock if minute_clock else MinuteClock().start()
+        self.attach_minute_clock(self.minute_clock)
+        Thread(target=run_loop, args=(self, subscription_id, batched, max_messages, max_bytes,)).start()
@@ -0,0 +1,58 @@
+import unittest, json, os, tempfile
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.polygon_run import run_mock_loop
+import us_finance_streaming_data_miner.util.logging as logging
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class TestPolygonRun(unittest.TestCase):
+    def _write_recorded(self, path):
+        with open(path, 'w') as f:
+            for i in range(3):
+                events = [{'ev': 'T', 'sym': symbol, 'p': 10.0 + i, 's': 100, 't': (1577975400 + i * 60) * 1000} for symbol in ('AAPL', 'MSFT')]
+                # the polygon payloads are published double encoded
+                f.write(json.dumps({'data': json.dumps(json.dumps(events)), 'publish_time': i * 0.01}) + '\n')
+
+    def test_run_mock_loop(self):
+        for batched in (False, True):
+            with tempfile.TemporaryDirectory() as base_dir:
+                path = os.path.join(base_dir, 'requests.jsonl')
+                self._write_recorded(path)
+                run = AggregationsRun(single_writer=True)
+                subscriber = run_mock_loop(run, path, speed=10.0, batched=batched)
+                self.assertEqual(3, subscriber.acked_cnt)
+                df = run._read(run.aggregations.get_minute_df)
+                self.assertEqual(6, len(df))
+                self.assertEqual(['AAPL', 'MSFT'], sorted(df['symbol'].unique()))
+
+    def test_run_mock_loop_invalid_payload(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            path = os.path.join(base_dir, 'requests.jsonl')
+            self._write_recorded(path)
+            with open(path, 'a') as f:
+                f.write(json.dumps({'data': 'not json'}) + '\n')
+            run = AggregationsRun(single_writer=True)
+            subscriber = run_mock_loop(run, path)
+            self.assertEqual(3, subscriber.acked_cnt)
+            self.assertEqual(1, subscriber.dropped_cnt)
+
+    def test_run_mock_loop_malformed_event(self):
+        for batched in (False, True):
+            with tempfile.TemporaryDirectory() as base_dir:
+                path = os.path.join(base_dir, 'requests.jsonl')
+                events = [{'ev': 'T', 'sym': 'AAPL', 'p': 10.0, 's': 100, 't': 1577975400 * 1000},
+                    {'ev': 'T', 'sym': 'IBM', 's': 100, 't': 1577975400 * 1000},
+                    {'ev': 'T', 'sym': 'MSFT', 'p': 10.0, 's': 100, 't': 1577975400 * 1000}]
+                with open(path, 'w') as f:
+                    f.write(json.dumps({'data': json.dumps(json.dumps(events))}) + '\n')
+                run = AggregationsRun(single_writer=True)
+                subscriber = run_mock_loop(run, path, batched=batched)
+                self.assertEqual(1, subscriber.acked_cnt)
+                df = run._read(run.aggregations.get_minute_df)
+                # the events after the malformed one are applied
+                self.assertEqual(['AAPL', 'MSFT'], sorted(df['symbol'].unique()))
+
+    def test_run_mock_loop_without_recorded(self):
+        self.assertIsNone(run_mock_loop(AggregationsRun()))
@@ -0,0 +1,68 @@
+import argparse, json, os, tempfile, time
+import numpy as np
+
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.export_format import get_export_format, FORMAT_CSV, FORMAT_PARQUET, FORMAT_FEATHER
+from us_finance_streaming_data_miner.ingest.streaming.polygon_run import run_loop
+from us_finance_streaming_data_miner.util.fake_pubsub import FakeSubscriberClient
+import us_finance_streaming_data_miner.util.logging as logging
+
+_FIRST_TIMESTAMP_MILLI = 1577975400 * 1000 # 2020-01-02 09:30 US/Eastern
+
+
+def write_recorded_messages(path, payload_cnt, events_per_payload, symbol_cnt, minute_cnt):
+    '''
+    Records payload_cnt polygon trade payloads spread evenly over minute_cnt minutes of a session,
+    with the publish times of the messages following the trade times.
+    '''
+    rng = np.random.default_rng(0)
+    with open(path, 'w') as f:
+        for i in range(payload_cnt):
+            t = _FIRST_TIMESTAMP_MILLI + i * minute_cnt * 60000 // payload_cnt
+            events = [{'ev': 'T', 'sym': 'SYM{j}'.format(j=int(j)), 'p': round(float(p), 2), 's': 100, 't': t}
+                for j, p in zip(rng.integers(0, symbol_cnt, size=events_per_payload), 100 + rng.normal(size=events_per_payload))]
+            f.write(json.dumps({'data': json.dumps(json.dumps(events)), 'publish_time': t / 1000}) + '\n')
+
+def _time(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+def run(recorded_path, speed, batched, format_name):
+    '''
+    Replays the recorded messages through run_loop into a DailyAggregationsRun, then exports the day,
+    printing the messages per second of the ingestion and the end of day latency.
+    '''
+    subscriber = FakeSubscriberClient(recorded_path, speed)
+    polygon_run = DailyAggregationsRun(single_writer=True, export_format=get_export_format(format_name))
+    # run_loop returns once the messages are acked, the trades queued to the writer are drained by get_status_string
+    dt_ingest = _time(lambda: (run_loop(polygon_run, 'replay', batched, subscriber=subscriber), polygon_run.get_status_string()))
+    message_cnt = len(subscriber.messages)
+    print('ingest: {message_cnt} messages, {dt:.3f} seconds, {rate:.0f} messages per second'.format(
+        message_cnt=message_cnt, dt=dt_ingest, rate=message_cnt / dt_ingest))
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        dt_export = _time(lambda: polygon_run.on_daily_trade_end(base_dir))
+        size = sum(os.path.getsize(os.path.join(dir_path, filename)) for dir_path, _, filenames in os.walk(base_dir) for filename in filenames)
+    print('end of day export ({format_name}): {dt:.3f} seconds, {mb:.1f} MB'.format(
+        format_name=format_name, dt=dt_export, mb=size / 1024 / 1024))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--recorded", default=None, help="recorded messages to replay, generated if not given.")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed, 1 for the wall clock, as fast as possible if not given.")
+    parser.add_argument("-b", "--batched", action='store_true', help="ingest the messages in batches.")
+    parser.add_argument("-f", "--format", default=FORMAT_CSV, choices=[FORMAT_CSV, FORMAT_PARQUET, FORMAT_FEATHER], help="export format.")
+    parser.add_argument("-p", "--payloads", type=int, default=20000, help="number of payloads generated.")
+    parser.add_argument("-e", "--events", type=int, default=50, help="number of trade events per payload generated.")
+    parser.add_argument("-s", "--symbols", type=int, default=3500, help="number of symbols generated.")
+    parser.add_argument("-m", "--minutes", type=int, default=390, help="number of minutes generated.")
+    args = parser.parse_args()
+    logging.set_sink(logging.LocalSink())
+    if args.recorded:
+        run(args.recorded, args.speed, args.batched, args.format)
+    else:
+        with tempfile.TemporaryDirectory() as recorded_dir:
+            recorded_path = os.path.join(recorded_dir, 'requests.jsonl')
+            write_recorded_messages(recorded_path, args.payloads, args.events, args.symbols, args.minutes)
+            run(recorded_path, args.speed, args.batched, args.format)
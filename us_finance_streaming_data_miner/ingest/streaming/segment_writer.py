@@ -0,0 +1,174 @@
+import os, threading, time
+import numpy as np, pandas as pd
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import bar_columns_to_minute_df, BarWithTime
+from us_finance_streaming_data_miner.ingest.streaming.export_format import FeatherFormat
+
+_FLUSH_INTERVAL_SECONDS = 60.0
+_MAX_BUFFER_BARS = 100000
+_SEGMENT_PREFIX = 'segment-'
+_TMP_SUFFIX = '.tmp'
+
+
+def _fsync_path(path, flags = os.O_RDONLY):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class SegmentWriter:
+    '''
+    Persists the minute bars during the session, as soon as they are over, to append-only segment files.
+
+    on_bar is an Aggregations bar listener and only buffers the bar. The buffer is flushed to a new segment
+    every flush_interval_seconds, or earlier once max_buffer_bars are buffered, by the thread of start().
+    A segment is written to a temporary file, synced and renamed into place, so a crash leaves complete
+    segments only and loses at most the bars buffered since the last flush.
+    The segments left by a previous run are kept, and read_segments() gives all of them as the minute DataFrame.
+    '''
+    def __init__(self, segment_dir, export_format = None, flush_interval_seconds = _FLUSH_INTERVAL_SECONDS, max_buffer_bars = _MAX_BUFFER_BARS):
+        '''
+
+        :param export_format: ExportFormat of the segments, feather if not given.
+        '''
+        self.segment_dir = segment_dir
+        self.export_format = export_format if export_format else FeatherFormat()
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffer_bars = max_buffer_bars
+        self.flushed_bar_cnt = 0
+        self._bars = []
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        os.makedirs(segment_dir, exist_ok=True)
+        for filename in os.listdir(segment_dir):
+            if filename.endswith(_TMP_SUFFIX):
+                os.remove(os.path.join(segment_dir, filename))
+        paths = self.get_segment_paths()
+        self._next_seq = self._get_seq(paths[-1]) + 1 if paths else 0
+
+    def _get_seq(self, path):
+        return int(os.path.basename(path)[len(_SEGMENT_PREFIX):-len(self.export_format.extension) - 1])
+
+    def get_segment_paths(self):
+        '''
+        :return: the paths of the segments in the order they are written.
+        '''
+        suffix = '.' + self.export_format.extension
+        paths = [os.path.join(self.segment_dir, filename) for filename in os.listdir(self.segment_dir)
+            if filename.startswith(_SEGMENT_PREFIX) and filename.endswith(suffix)]
+        return sorted(paths, key=self._get_seq)
+
+    def get_next_seq(self):
+        '''
+        :return: the sequence number of the next segment, the segments before it have the bars flushed so far.
+        '''
+        return self._next_seq
+
+    def get_buffered_bar_cnt(self):
+        return len(self._bars)
+
+    def on_bar(self, symbol, minute, open_, high, low, close_, volume):
+        with self._buffer_lock:
+            self._bars.append((symbol, minute, open_, high, low, close_, volume))
+            buffered_cnt = len(self._bars)
+        if buffered_cnt >= self.max_buffer_bars:
+            self._flush_requested.set()
+
+    def flush(self):
+        '''
+        Writes the buffered bars to a new segment. The bars are buffered again if the write fails.
+
+        :return: the path of the segment, None if there is no bar to write.
+        '''
+        with self._flush_lock:
+            with self._buffer_lock:
+                bars, self._bars = self._bars, []
+            if not bars:
+                return None
+            try:
+                path = self._write_segment(bars)
+            except Exception:
+                with self._buffer_lock:
+                    self._bars = bars + self._bars
+                raise
+            self._next_seq += 1
+            self.flushed_bar_cnt += len(bars)
+            return path
+
+    def _write_segment(self, bars):
+        symbols, minutes, opens, highs, lows, closes, volumes = zip(*bars)
+        df = bar_columns_to_minute_df(
+            np.asarray(minutes, dtype=np.int64),
+            np.asarray(symbols, dtype=object),
+            np.asarray([opens, highs, lows, closes, volumes], dtype=np.float64)).set_index('datetime')
+        name = '{prefix}{seq:08d}'.format(prefix=_SEGMENT_PREFIX, seq=self._next_seq)
+        path = os.path.join(self.segment_dir, self.export_format.get_filename(name))
+        path_tmp = path + _TMP_SUFFIX
+        self.export_format.write(df, path_tmp)
+        _fsync_path(path_tmp)
+        os.replace(path_tmp, path)
+        if hasattr(os, 'O_DIRECTORY'):
+            _fsync_path(self.segment_dir, os.O_RDONLY | os.O_DIRECTORY)
+        return path
+
+    def read_segments(self, start_seq = 0):
+        '''
+        Reads the segments written so far into the minute DataFrame indexed by datetime, ordered by symbol then datetime.
+        A bar written more than once, e.g. replayed after a restart, is kept as last written.
+
+        :param start_seq: the sequence number of the first segment to read.
+        '''
+        paths = [path for path in self.get_segment_paths() if self._get_seq(path) >= start_seq]
+        if not paths:
+            return pd.DataFrame(columns=BarWithTime.get_minute_tuple_names()).set_index('datetime')
+        df = pd.concat([self.export_format.read(path) for path in paths], ignore_index=True)
+        df['datetime'] = pd.to_datetime(df['datetime'], utc=True)
+        df = df[~df.duplicated(['symbol', 'datetime'], keep='last')]
+        df = df.sort_values(['symbol', 'datetime'], kind='stable')
+        return df.set_index('datetime')
+
+    def remove_segments(self, min_age_seconds = None):
+        '''
+        Removes the segments once their bars are saved elsewhere, e.g. at the end of the day.
+
+        :param min_age_seconds: if given, only the segments written more than this ago are removed, e.g. of a previous session.
+        '''
+        with self._flush_lock:
+            for path in self.get_segment_paths():
+                if min_age_seconds is None or time.time() - os.path.getmtime(path) > min_age_seconds:
+                    logging.info('removing the segment {path}', path=path)
+                    os.remove(path)
+
+    def start(self):
+        '''
+        Starts the thread that flushes the buffer every flush_interval_seconds.
+        '''
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='segment_writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout = None):
+        '''
+        Stops the flush thread and flushes what is left in the buffer.
+        '''
+        self._stopped.set()
+        self._flush_requested.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self.flush_interval_seconds)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except Exception as ex:
+                logging.error('failed to flush the segment of {l} bars: {ex}', l=self.get_buffered_bar_cnt(), ex=ex)
@@ -0,0 +1,99 @@
+import unittest, os, tempfile
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Trade
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.export_format import get_export_format, FORMAT_CSV
+from us_finance_streaming_data_miner.ingest.streaming.segment_writer import SegmentWriter
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class _FailingFormat(type(get_export_format(FORMAT_CSV))):
+    def write(self, df, path):
+        raise IOError('disk full')
+
+class TestSegmentWriter(unittest.TestCase):
+    def test_flush(self):
+        with tempfile.TemporaryDirectory() as segment_dir:
+            segment_writer = SegmentWriter(segment_dir, get_export_format(FORMAT_CSV))
+            self.assertIsNone(segment_writer.flush())
+
+            segment_writer.on_bar('SYM1', 0, 100.0, 110.0, 90.0, 105.0, 1.0)
+            segment_writer.on_bar('SYM2', 0, 200.0, 200.0, 200.0, 200.0, 2.0)
+            path_0 = segment_writer.flush()
+            segment_writer.on_bar('SYM1', 1, 105.0, 105.0, 105.0, 105.0, 0.0)
+            path_1 = segment_writer.flush()
+
+            self.assertEqual([path_0, path_1], segment_writer.get_segment_paths())
+            self.assertEqual(3, segment_writer.flushed_bar_cnt)
+            self.assertEqual(0, segment_writer.get_buffered_bar_cnt())
+
+            df = segment_writer.read_segments()
+            self.assertEqual(['SYM1', 'SYM1', 'SYM2'], list(df.symbol))
+            self.assertEqual([105.0, 105.0, 200.0], list(df.close))
+            self.assertEqual([0, 60, 0], [int(t.timestamp()) for t in df.index])
+
+            segment_writer.remove_segments()
+            self.assertEqual(0, len(segment_writer.read_segments()))
+
+    def test_restart(self):
+        csv_format = get_export_format(FORMAT_CSV)
+        with tempfile.TemporaryDirectory() as segment_dir:
+            segment_writer = SegmentWriter(segment_dir, csv_format)
+            segment_writer.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+            segment_writer.flush()
+            # a segment being written when the process crashed
+            with open(os.path.join(segment_dir, 'segment-00000001.csv.tmp'), 'w') as f:
+                f.write('datetime,sym')
+
+            segment_writer = SegmentWriter(segment_dir, csv_format)
+            segment_writer.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 101.0, 2.0)
+            segment_writer.on_bar('SYM1', 1, 101.0, 101.0, 101.0, 101.0, 1.0)
+            segment_writer.flush()
+
+            self.assertEqual(['segment-00000000.csv', 'segment-00000001.csv'], sorted(os.listdir(segment_dir)))
+            df = segment_writer.read_segments()
+            # the bar written again after the restart is kept as last written
+            self.assertEqual([101.0, 101.0], list(df.close))
+            self.assertEqual([2.0, 1.0], list(df.volume))
+
+    def test_flush_failure(self):
+        with tempfile.TemporaryDirectory() as segment_dir:
+            segment_writer = SegmentWriter(segment_dir, _FailingFormat())
+            segment_writer.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+            with self.assertRaises(IOError):
+                segment_writer.flush()
+            self.assertEqual(1, segment_writer.get_buffered_bar_cnt())
+            self.assertEqual([], os.listdir(segment_dir))
+
+    def test_flush_thread(self):
+        with tempfile.TemporaryDirectory() as segment_dir:
+            segment_writer = SegmentWriter(segment_dir, get_export_format(FORMAT_CSV), flush_interval_seconds=60, max_buffer_bars=2).start()
+            segment_writer.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+            segment_writer.on_bar('SYM1', 1, 100.0, 100.0, 100.0, 100.0, 1.0)
+            segment_writer.on_bar('SYM1', 2, 100.0, 100.0, 100.0, 100.0, 1.0)
+            segment_writer.stop(timeout=10)
+            self.assertEqual(3, segment_writer.flushed_bar_cnt)
+            self.assertEqual(3, len(segment_writer.read_segments()))
+
+    def test_daily_trade_end(self):
+        csv_format = get_export_format(FORMAT_CSV)
+        with tempfile.TemporaryDirectory() as segment_dir, tempfile.TemporaryDirectory() as base_dir:
+            segment_writer = SegmentWriter(segment_dir, csv_format)
+            aggregations_run = DailyAggregationsRun(export_format=csv_format, segment_writer=segment_writer)
+            minutes = 400 # more than the retained bars
+            for minute in range(minutes):
+                aggregations_run.on_trade(Trade(minute * 60, 'SYM1', 100.0 + minute, 1.0))
+                if minute % 100 == 0:
+                    segment_writer.flush()
+            aggregations_run.on_trade(Trade(0, 'SYM2', 200.0, 1.0))
+            aggregations_run.on_daily_trade_end(base_dir)
+
+            df = csv_format.read(os.path.join(base_dir, 'minute.csv'))
+            self.assertEqual(minutes + 1, len(df))
+            self.assertEqual([100.0 + minute for minute in range(minutes)] + [200.0], list(df.close))
+            df_daily = csv_format.read(os.path.join(base_dir, 'daily.csv'))
+            self.assertEqual([100.0, 200.0], list(df_daily.open))
+            self.assertEqual([float(minutes), 1.0], list(df_daily.volume))
+            self.assertEqual([], segment_writer.get_segment_paths())
@@ -0,0 +1,247 @@
+import multiprocessing, os, queue, threading, time
+from google.cloud import pubsub_v1
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.batch_ingest import BatchIngest, get_flow_control, DEFAULT_MAX_MESSAGES, DEFAULT_MAX_BYTES
+from us_finance_streaming_data_miner.ingest.streaming.binance_run import on_message
+from us_finance_streaming_data_miner.ingest.streaming.decode import decode_events
+from us_finance_streaming_data_miner.ingest.streaming.sharding import ShardFilter
+
+_MAX_QUEUE_SIZE = 1000
+_CHECK_INTERVAL_SECONDS = 5.0
+_STATUS_TIMEOUT_SECONDS = 10.0
+_PUT_TIMEOUT_SECONDS = 1.0
+
+# commands sent to the shard workers
+_PAYLOADS = 'payloads'
+_EVENTS = 'events'
+_STATUS = 'status'
+_DAILY_TRADE_START = 'daily_trade_start'
+_DAILY_TRADE_END = 'daily_trade_end'
+
+
+def _get_symbol(msg):
+    symbol = msg.get('s')
+    if symbol is None and isinstance(msg.get('k'), dict):
+        symbol = msg['k'].get('s')
+    return symbol
+
+def _run_shard_worker(shard_id, shard_size, command_queue, status_queue):
+    '''
+    The main of a shard worker process, applying the commands of command_queue to its own AggregationsRun.
+    '''
+    aggregations_run = AggregationsRun()
+    shard_filter = ShardFilter(shard_id, shard_size)
+    while True:
+        command = command_queue.get()
+        if command is None:
+            break
+        kind, payload = command
+        try:
+            if kind == _PAYLOADS:
+                for data in payload:
+                    for msg in decode_events(data):
+                        on_message(aggregations_run, msg, shard_filter)
+            elif kind == _EVENTS:
+                for msg in payload:
+                    on_message(aggregations_run, msg, shard_filter)
+            elif kind == _STATUS:
+                status_queue.put((payload, shard_id, aggregations_run.get_status_string()))
+            elif kind == _DAILY_TRADE_START:
+                aggregations_run.on_daily_trade_start()
+            elif kind == _DAILY_TRADE_END:
+                aggregations_run.save_daily_df(payload)
+                aggregations_run.on_daily_trade_end(payload)
+        except Exception as ex:
+            logging.error('shard {shard_id} failed to run {kind}: {ex}', shard_id=shard_id, kind=kind, ex=ex)
+    logging.flush()
+
+class ShardSupervisor:
+    '''
+    Runs the shards of the binance stream as worker processes on one host.
+
+    The supervisor routes the messages by symbol with a ShardRouter and sends them to the workers in
+    one queue put per shard per batch. A message carrying its symbol as the routing attribute or the
+    ordering key is sent undecoded, so the decoding is spread over the workers as well.
+    A crashed worker is restarted with a new queue and empty aggregations, the commands queued to it are lost.
+    '''
+    def __init__(self, shard_size, max_queue_size = _MAX_QUEUE_SIZE, check_interval_seconds = _CHECK_INTERVAL_SECONDS, start_method = 'spawn',
+                 put_timeout_seconds = _PUT_TIMEOUT_SECONDS):
+        '''
+
+        :param start_method: the multiprocessing start method, spawn as the parent runs threads.
+        :param put_timeout_seconds: how long a put to a full queue waits before checking the worker again.
+        '''
+        self.shard_size = shard_size
+        self.max_queue_size = max_queue_size
+        self.check_interval_seconds = check_interval_seconds
+        self.put_timeout_seconds = put_timeout_seconds
+        self._context = multiprocessing.get_context(start_method)
+        self._shard_filter = ShardFilter(0, shard_size)
+        self.command_queues = [None] * shard_size
+        self.status_queues = [None] * shard_size
+        self.processes = [None] * shard_size
+        self.restart_cnt = 0
+        self._status_request_id = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        for shard_id in range(shard_size):
+            self._start_worker(shard_id)
+        self._monitor = threading.Thread(target=self._run_monitor, name='shard_supervisor_monitor', daemon=True)
+        self._monitor.start()
+
+    def _start_worker(self, shard_id):
+        # the queues are per worker and replaced on restart, as a worker killed while writing to a queue leaves its lock held.
+        command_queue, status_queue = self._context.Queue(self.max_queue_size), self._context.Queue()
+        process = self._context.Process(
+            target=_run_shard_worker, args=(shard_id, self.shard_size, command_queue, status_queue),
+            name='shard_worker_{shard_id}'.format(shard_id=shard_id), daemon=True)
+        process.start()
+        self.command_queues[shard_id] = command_queue
+        self.status_queues[shard_id] = status_queue
+        self.processes[shard_id] = process
+
+    def check_workers(self):
+        '''
+        Restarts the workers that exited.
+        '''
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            for shard_id, process in enumerate(self.processes):
+                if process.is_alive():
+                    continue
+                logging.error('shard worker {shard_id} exited with {exitcode}, restarting', shard_id=shard_id, exitcode=process.exitcode)
+                self._start_worker(shard_id)
+                self.restart_cnt += 1
+
+    def _run_monitor(self):
+        while not self._stopped.wait(self.check_interval_seconds):
+            self.check_workers()
+
+    def _put(self, shard_id, command):
+        '''
+        Puts the command to the queue of the shard, waiting while it is full. The queue is looked up again after each
+        timeout, so a worker that died with a full queue is restarted and gets the command on its new queue.
+        '''
+        while True:
+            try:
+                self.command_queues[shard_id].put(command, timeout=self.put_timeout_seconds)
+                return
+            except queue.Full:
+                pass
+            if self.processes[shard_id].is_alive():
+                continue
+            if self._stopped.is_set():
+                logging.error('dropping {command} to the stopped shard worker {shard_id}', command=command and command[0], shard_id=shard_id)
+                return
+            self.check_workers()
+
+    def _broadcast(self, command):
+        for shard_id in range(self.shard_size):
+            self._put(shard_id, command)
+
+    def route_messages(self, messages):
+        '''
+        Sends the Pub/Sub messages to the workers of their symbols.
+        '''
+        payloads_per_shard = [[] for _ in range(self.shard_size)]
+        events_per_shard = [[] for _ in range(self.shard_size)]
+        router = self._shard_filter.router
+        for message in messages:
+            routing_key = self._shard_filter.get_routing_key(message)
+            if routing_key is not None:
+                payloads_per_shard[router.get_shard(routing_key)].append(message.data)
+                continue
+            try:
+                msgs = decode_events(message.data)
+            except Exception as ex:
+                logging.error('failed to decode the message {data}: {ex}', data=message.data, ex=ex)
+                continue
+            for msg in msgs:
+                symbol = _get_symbol(msg)
+                events_per_shard[router.get_shard(symbol) if symbol else 0].append(msg)
+
+        for shard_id in range(self.shard_size):
+            if payloads_per_shard[shard_id]:
+                self._put(shard_id, (_PAYLOADS, payloads_per_shard[shard_id]))
+            if events_per_shard[shard_id]:
+                self._put(shard_id, (_EVENTS, events_per_shard[shard_id]))
+
+    def on_daily_trade_start(self):
+        self._broadcast((_DAILY_TRADE_START, None))
+
+    def on_daily_trade_end(self, base_dir='data'):
+        self._broadcast((_DAILY_TRADE_END, base_dir))
+
+    def get_status_string(self, timeout = _STATUS_TIMEOUT_SECONDS):
+        '''
+        Gets the status strings of the workers, merged in the order of the shards.
+        A worker that does not answer within the timeout is reported as not responding.
+        '''
+        self._status_request_id += 1
+        request_id = self._status_request_id
+        self._broadcast((_STATUS, request_id))
+
+        status_per_shard = {}
+        deadline = time.monotonic() + timeout
+        for shard_id, status_queue in enumerate(self.status_queues):
+            while True:
+                try:
+                    response_id, _, status = status_queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if response_id == request_id:
+                    status_per_shard[shard_id] = status
+                    break
+
+        return '\n'.join('shard {shard_id}: {status}'.format(
+            shard_id=shard_id, status=status_per_shard.get(shard_id, 'not responding'))
+            for shard_id in range(self.shard_size))
+
+    def stop(self, timeout = None):
+        '''
+        Lets the workers apply the commands queued so far and stops them.
+        '''
+        with self._lock:
+            self._stopped.set()
+        self._broadcast(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+class _RoutingIngest(BatchIngest):
+    def __init__(self, supervisor, **kwargs):
+        super(_RoutingIngest, self).__init__(None, None, **kwargs)
+        self.supervisor = supervisor
+
+    def apply_batch(self, messages):
+        self.supervisor.route_messages(messages)
+        for message in messages:
+            message.ack()
+        self.processed_cnt += len(messages)
+
+def run_loop(supervisor, subscription_id, max_messages = DEFAULT_MAX_MESSAGES, max_bytes = DEFAULT_MAX_BYTES):
+    '''
+    Subscribes to the binance stream, routing the messages to the workers of the supervisor in batches.
+    The messages are acked once they are queued to the workers.
+    '''
+    project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
+
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(
+        project_id, subscription_id
+    )
+
+    routing_ingest = _RoutingIngest(supervisor)
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path, callback=routing_ingest.callback, flow_control=get_flow_control(max_messages, max_bytes)
+    )
+    print("Listening for messages on {}\n".format(subscription_path))
+
+    try:
+        streaming_pull_future.result()
+    except Exception as ex:  # noqa
+        logging.error(ex)
+        streaming_pull_future.cancel()
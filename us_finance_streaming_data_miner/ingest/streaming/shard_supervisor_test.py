@@ -0,0 +1,59 @@
+import unittest, json, threading
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.shard_supervisor import ShardSupervisor
+
+_SYMBOLS = ['SYM{i}'.format(i=i) for i in range(10)]
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class _Message:
+    def __init__(self, data, attributes = None):
+        self.data, self.attributes, self.ordering_key = data, attributes or {}, ''
+
+def _kline_message(symbol, with_attribute):
+    msg = {'e': 'kline', 's': symbol, 'k': {'s': symbol, 't': 1577975400000, 'o': '1.0', 'h': '2.0', 'l': '0.5', 'c': '1.5', 'v': '10.0'}}
+    return _Message(json.dumps(msg).encode('utf-8'), {'symbol': symbol} if with_attribute else None)
+
+def _get_symbol_cnts(status_string):
+    return [int(line.split('size of aggregation_per_symbol: ')[1].split(',')[0]) for line in status_string.split('\n')]
+
+class TestShardSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.supervisor = ShardSupervisor(2, check_interval_seconds=3600)
+
+    def tearDown(self):
+        self.supervisor.stop(10)
+
+    def test_route_messages(self):
+        self.supervisor.route_messages([_kline_message(symbol, i % 2 == 0) for i, symbol in enumerate(_SYMBOLS)])
+        symbol_cnts = _get_symbol_cnts(self.supervisor.get_status_string())
+        self.assertEqual(2, len(symbol_cnts))
+        self.assertEqual(len(_SYMBOLS), sum(symbol_cnts))
+
+    def test_restart(self):
+        self.supervisor.route_messages([_kline_message(symbol, True) for symbol in _SYMBOLS])
+        self.supervisor.get_status_string()
+        self.supervisor.processes[0].kill()
+        self.supervisor.processes[0].join(10)
+        self.supervisor.check_workers()
+
+        self.assertEqual(1, self.supervisor.restart_cnt)
+        self.assertTrue(all(process.is_alive() for process in self.supervisor.processes))
+        self.assertEqual(0, _get_symbol_cnts(self.supervisor.get_status_string())[0])
+
+    def test_put_to_dead_worker_with_full_queue(self):
+        supervisor = ShardSupervisor(1, max_queue_size=1, check_interval_seconds=3600, put_timeout_seconds=0.1)
+        try:
+            supervisor.processes[0].kill()
+            supervisor.processes[0].join(10)
+            # the first command fills the queue of the dead worker, the second waits on it
+            thread = threading.Thread(target=lambda: [supervisor.on_daily_trade_start() for _ in range(2)])
+            thread.start()
+            thread.join(30)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(1, supervisor.restart_cnt)
+            self.assertEqual([0], _get_symbol_cnts(supervisor.get_status_string()))
+        finally:
+            supervisor.stop(10)
@@ -0,0 +1,73 @@
+import bisect, zlib
+
+_VIRTUAL_NODES = 64
+ROUTING_ATTRIBUTE = 'symbol'
+
+
+def stable_hash(key):
+    '''
+    A hash of the str key that is stable across processes and hosts, unlike the builtin hash().
+    '''
+    return zlib.crc32(key.encode('utf-8'))
+
+class ShardRouter:
+    '''
+    Assigns the symbols to the shards on a consistent hash ring.
+
+    Each shard owns virtual_nodes points on the ring and a symbol goes to the shard of the first point
+    at or after its hash, so changing the shard_size moves only about 1/shard_size of the symbols.
+    The assignments are cached as the set of symbols is small and keeps recurring.
+    '''
+    def __init__(self, shard_size = 1, virtual_nodes = _VIRTUAL_NODES):
+        self.shard_size = shard_size
+        ring = sorted(
+            (stable_hash('{shard_id}-{node}'.format(shard_id=shard_id, node=node)), shard_id)
+            for shard_id in range(shard_size) for node in range(virtual_nodes))
+        self._ring_hashes = [h for h, _ in ring]
+        self._ring_shards = [shard_id for _, shard_id in ring]
+        self._shard_per_symbol = {}
+
+    def get_shard(self, symbol):
+        shard_id = self._shard_per_symbol.get(symbol)
+        if shard_id is None:
+            if self.shard_size == 1:
+                shard_id = 0
+            else:
+                i = bisect.bisect_left(self._ring_hashes, stable_hash(symbol)) % len(self._ring_hashes)
+                shard_id = self._ring_shards[i]
+            self._shard_per_symbol[symbol] = shard_id
+        return shard_id
+
+class ShardFilter:
+    '''
+    Keeps the messages of the symbols assigned to shard_id.
+
+    The routing key of a Pub/Sub message is read from its routing_attribute attribute, or else its
+    ordering key, so that the messages of the other shards can be dropped before their body is decoded.
+    '''
+    def __init__(self, shard_id = 0, shard_size = 1, routing_attribute = ROUTING_ATTRIBUTE, router = None):
+        if not 0 <= shard_id < shard_size:
+            raise ValueError('shard_id {shard_id} is not in [0, {shard_size})'.format(shard_id=shard_id, shard_size=shard_size))
+        self.shard_id = shard_id
+        self.router = router or ShardRouter(shard_size)
+        self.routing_attribute = routing_attribute
+
+    def accepts_symbol(self, symbol):
+        return self.router.get_shard(symbol) == self.shard_id
+
+    def get_routing_key(self, message):
+        '''
+        :return: the symbol the message is routed by, None if the message does not carry one.
+        '''
+        attributes = getattr(message, 'attributes', None)
+        if attributes and self.routing_attribute in attributes:
+            return attributes[self.routing_attribute]
+        return getattr(message, 'ordering_key', None) or None
+
+    def accepts_message(self, message):
+        '''
+        :return: False if the message is routed to another shard, True if it is routed to this shard
+        or has no routing key, in which case the decoded events need to be filtered by accepts_symbol.
+        '''
+        routing_key = self.get_routing_key(message)
+        return routing_key is None or self.accepts_symbol(routing_key)
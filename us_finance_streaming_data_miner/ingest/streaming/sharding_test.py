@@ -0,0 +1,72 @@
+import unittest, json
+from collections import Counter
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import AggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.binance_run import on_message, _decode_shard_message
+from us_finance_streaming_data_miner.ingest.streaming.sharding import ShardRouter, ShardFilter, stable_hash
+
+_SYMBOLS = ['SYM{i}'.format(i=i) for i in range(2000)]
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class _Message:
+    def __init__(self, data, attributes = None, ordering_key = ''):
+        self.data, self.attributes, self.ordering_key = data, attributes or {}, ordering_key
+
+def _kline_msg(symbol):
+    return {'e': 'kline', 's': symbol, 'k': {'s': symbol, 't': 1577975400000, 'o': '1.0', 'h': '2.0', 'l': '0.5', 'c': '1.5', 'v': '10.0'}}
+
+class TestShardRouter(unittest.TestCase):
+    def test_stable_hash(self):
+        self.assertEqual(stable_hash('BTCUSDT'), stable_hash('BTCUSDT'))
+        self.assertNotEqual(stable_hash('BTCUSDT'), stable_hash('ETHUSDT'))
+
+    def test_single_shard(self):
+        router = ShardRouter(1)
+        self.assertTrue(all(router.get_shard(symbol) == 0 for symbol in _SYMBOLS))
+
+    def test_balance(self):
+        router = ShardRouter(4)
+        cnts = Counter(router.get_shard(symbol) for symbol in _SYMBOLS)
+        self.assertEqual([0, 1, 2, 3], sorted(cnts))
+        self.assertTrue(all(cnt > len(_SYMBOLS) / 4 / 2 for cnt in cnts.values()))
+
+    def test_consistent(self):
+        router, grown_router = ShardRouter(4), ShardRouter(5)
+        moved = [symbol for symbol in _SYMBOLS if router.get_shard(symbol) != grown_router.get_shard(symbol)]
+        # about 1/5 of the symbols move to the new shard, and only to it
+        self.assertLess(len(moved), len(_SYMBOLS) * 0.35)
+        self.assertTrue(all(grown_router.get_shard(symbol) == 4 for symbol in moved))
+
+class TestShardFilter(unittest.TestCase):
+    def test_invalid_shard_id(self):
+        with self.assertRaises(ValueError):
+            ShardFilter(2, 2)
+
+    def test_accepts_message(self):
+        shard_filters = [ShardFilter(shard_id, 3) for shard_id in range(3)]
+        for symbol in _SYMBOLS[:50]:
+            by_attribute = _Message(b'', attributes={'symbol': symbol})
+            by_ordering_key = _Message(b'', ordering_key=symbol)
+            self.assertEqual(1, sum(f.accepts_message(by_attribute) for f in shard_filters))
+            self.assertEqual(1, sum(f.accepts_message(by_ordering_key) for f in shard_filters))
+        self.assertTrue(all(f.accepts_message(_Message(b'')) for f in shard_filters))
+
+    def test_skips_decode(self):
+        shard_filter = ShardFilter(0, 2)
+        other_symbol = next(symbol for symbol in _SYMBOLS if not shard_filter.accepts_symbol(symbol))
+        self.assertEqual([], _decode_shard_message(_Message(b'not a json', attributes={'symbol': other_symbol}), shard_filter))
+
+    def test_on_message(self):
+        shard_filters = [ShardFilter(shard_id, 2) for shard_id in range(2)]
+        runs = [AggregationsRun() for _ in shard_filters]
+        for symbol in _SYMBOLS[:20]:
+            msg = _decode_shard_message(_Message(json.dumps(_kline_msg(symbol)).encode('utf-8')), shard_filters[0])[0]
+            for run, shard_filter in zip(runs, shard_filters):
+                on_message(run, msg, shard_filter)
+
+        symbols_per_run = [set(run.aggregations.aggregation_per_symbol) for run in runs]
+        self.assertEqual(set(_SYMBOLS[:20]), symbols_per_run[0] | symbols_per_run[1])
+        self.assertFalse(symbols_per_run[0] & symbols_per_run[1])
@@ -0,0 +1,122 @@
+import json, os, shutil, time
+import numpy as np
+import us_finance_streaming_data_miner.util.logging as logging
+
+_SNAPSHOT_PREFIX = 'snapshot-'
+_TMP_SUFFIX = '.tmp'
+_MINUTES_FILENAME = 'minutes.npy'
+_VALUES_FILENAME = 'values.npy'
+_STATE_FILENAME = 'state.json'
+_MAX_AGE_SECONDS = 6 * 3600
+
+
+def _fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+def _get_snapshot_dirs(snapshot_dir):
+    if not os.path.isdir(snapshot_dir):
+        return []
+    return sorted(os.path.join(snapshot_dir, filename) for filename in os.listdir(snapshot_dir)
+        if filename.startswith(_SNAPSHOT_PREFIX) and not filename.endswith(_TMP_SUFFIX))
+
+def copy_snapshot_state(aggregations):
+    '''
+    Copies the bars and the state of all the aggregations, cheap enough to be run on the writer
+    while write_snapshot stacks, serializes and syncs the copy on another thread.
+
+    :return: (symbols, minutes, values, states) with the copied bars arrays per symbol.
+    '''
+    symbols, minutes, values, states = [], [], [], []
+    for symbol, aggregation in aggregations.aggregation_per_symbol.items():
+        symbols.append(symbol)
+        minutes.append(aggregation.bars.minutes.copy())
+        values.append(aggregation.bars.values.copy())
+        states.append(aggregation.get_state())
+    return symbols, minutes, values, states
+
+def save_snapshot(aggregations, snapshot_dir, segment_seq = 0):
+    '''
+    Saves the bars and the state of all the aggregations, see write_snapshot.
+    '''
+    return write_snapshot(copy_snapshot_state(aggregations), snapshot_dir, segment_seq)
+
+def write_snapshot(snapshot_state, snapshot_dir, segment_seq = 0):
+    '''
+    Saves the state given by copy_snapshot_state as snapshot_dir/snapshot-<time>/,
+    the bars as raw npy arrays to be memory mapped when loaded. The older snapshots are removed.
+
+    The snapshot is written to a temporary directory and renamed into place, so a crash leaves the previous one.
+
+    :param segment_seq: the sequence number of the first segment written after the snapshot, from where the bars are replayed.
+    :return: the path of the snapshot.
+    '''
+    symbols, minutes, values, states = snapshot_state
+    saved_seconds = time.time()
+    path = os.path.join(snapshot_dir, '{prefix}{ms:015d}'.format(prefix=_SNAPSHOT_PREFIX, ms=int(saved_seconds * 1000)))
+    path_tmp = path + _TMP_SUFFIX
+    shutil.rmtree(path_tmp, ignore_errors=True)
+    os.makedirs(path_tmp)
+    if symbols:
+        np.save(os.path.join(path_tmp, _MINUTES_FILENAME), np.stack(minutes))
+        np.save(os.path.join(path_tmp, _VALUES_FILENAME), np.stack(values))
+    with open(os.path.join(path_tmp, _STATE_FILENAME), 'w') as f:
+        json.dump({'saved_seconds': saved_seconds, 'segment_seq': segment_seq, 'symbols': symbols, 'states': states}, f)
+    for filename in os.listdir(path_tmp):
+        _fsync_file(os.path.join(path_tmp, filename))
+    os.replace(path_tmp, path)
+
+    for snapshot_path in _get_snapshot_dirs(snapshot_dir):
+        if snapshot_path != path:
+            shutil.rmtree(snapshot_path, ignore_errors=True)
+    return path
+
+def load_snapshot(aggregations, snapshot_dir, max_age_seconds = _MAX_AGE_SECONDS):
+    '''
+    Restores the aggregations from the latest snapshot in snapshot_dir. The bars arrays are memory mapped,
+    so only the rows are read, straight into the buffers of the aggregations.
+
+    :param max_age_seconds: a snapshot older than this, e.g. of a previous day, is ignored.
+    :return: the segment_seq of the snapshot to replay the bars from, None if no snapshot is restored.
+    '''
+    snapshot_dirs = _get_snapshot_dirs(snapshot_dir)
+    if not snapshot_dirs:
+        return None
+    path = snapshot_dirs[-1]
+    with open(os.path.join(path, _STATE_FILENAME), 'r') as f:
+        snapshot_state = json.load(f)
+    age_seconds = time.time() - snapshot_state['saved_seconds']
+    if max_age_seconds is not None and age_seconds > max_age_seconds:
+        logging.info('ignoring the snapshot {path} saved {age} seconds ago', path=path, age=int(age_seconds))
+        return None
+
+    symbols = snapshot_state['symbols']
+    if symbols:
+        minutes = np.load(os.path.join(path, _MINUTES_FILENAME), mmap_mode='r')
+        values = np.load(os.path.join(path, _VALUES_FILENAME), mmap_mode='r')
+    for row, (symbol, state) in enumerate(zip(symbols, snapshot_state['states'])):
+        aggregations._get_aggregation(symbol).restore(minutes[row], values[row], state)
+    return snapshot_state['segment_seq']
+
+def remove_snapshots(snapshot_dir):
+    for path in _get_snapshot_dirs(snapshot_dir):
+        shutil.rmtree(path, ignore_errors=True)
+
+def recover(aggregations, snapshot_dir, segment_writer = None, max_age_seconds = _MAX_AGE_SECONDS):
+    '''
+    Restores the aggregations from the latest snapshot and replays the bars flushed to the segments after it.
+    Without a snapshot of the session, the segments older than max_age_seconds are of a previous session,
+    e.g. left by a crash, and are removed before all the segments are replayed.
+
+    :return: the number of the bars replayed.
+    '''
+    t_1 = time.time()
+    segment_seq = load_snapshot(aggregations, snapshot_dir, max_age_seconds)
+    replayed_cnt = 0
+    if segment_writer:
+        if segment_seq is None and max_age_seconds is not None:
+            segment_writer.remove_segments(max_age_seconds)
+        replayed_cnt = aggregations.replay_minute_df(segment_writer.read_segments(segment_seq or 0))
+    logging.info('recovered {l_s} symbols with {replayed_cnt} bars replayed in {s:.3f} seconds',
+        l_s=len(aggregations.aggregation_per_symbol), replayed_cnt=replayed_cnt, s=time.time() - t_1)
+    return replayed_cnt
@@ -0,0 +1,42 @@
+import argparse, tempfile, time
+
+from us_finance_streaming_data_miner.ingest.streaming.aggregation_benchmark import new_daily_aggregations
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregations
+from us_finance_streaming_data_miner.ingest.streaming.segment_writer import SegmentWriter
+from us_finance_streaming_data_miner.ingest.streaming.snapshot import copy_snapshot_state, write_snapshot, recover
+
+
+def _time(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+def run(symbol_cnt, tail_minutes):
+    '''
+    Snapshots the aggregations of symbol_cnt symbols with full buffers and recovers them with
+    tail_minutes minutes of bars of all the symbols replayed from the segments, printing the times.
+    '''
+    aggregations = new_daily_aggregations(symbol_cnt, 300)
+    with tempfile.TemporaryDirectory() as snapshot_dir, tempfile.TemporaryDirectory() as segment_dir:
+        segment_writer = SegmentWriter(segment_dir)
+        copied = []
+        # the copy is run on the writer, stalling the ingestion, the write on the snapshot thread
+        dt_copy = _time(lambda: copied.append(copy_snapshot_state(aggregations)))
+        dt_write = _time(lambda: write_snapshot(copied[0], snapshot_dir, segment_writer.get_next_seq()))
+
+        for symbol, aggregation in aggregations.aggregation_per_symbol.items():
+            close_ = aggregation.bars.get_last_close()
+            for minute in range(aggregation.bars.last_minute + 1, aggregation.bars.last_minute + 1 + tail_minutes):
+                segment_writer.on_bar(symbol, minute, close_, close_ + 1, close_ - 1, close_, 10.0)
+        segment_writer.flush()
+
+        dt_recover = _time(lambda: recover(DailyAggregations(), snapshot_dir, segment_writer))
+    print('{symbol_cnt} symbols: copy {dt_copy:.3f} seconds, write {dt_write:.3f} seconds, recover with {tail_minutes} minutes replayed {dt_recover:.3f} seconds'.format(
+        symbol_cnt=symbol_cnt, dt_copy=dt_copy, dt_write=dt_write, tail_minutes=tail_minutes, dt_recover=dt_recover))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--symbols", type=int, default=3500, help="number of symbols.")
+    parser.add_argument("-t", "--tail_minutes", type=int, default=10, help="minutes of bars replayed after the snapshot.")
+    args = parser.parse_args()
+    run(args.symbols, args.tail_minutes)
@@ -0,0 +1,134 @@
+import unittest, os, tempfile, time
+import pandas as pd
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Aggregations, Trade
+from us_finance_streaming_data_miner.ingest.streaming.matrix_aggregation import MatrixAggregations
+from us_finance_streaming_data_miner.ingest.streaming.daily_aggregation import DailyAggregationsRun
+from us_finance_streaming_data_miner.ingest.streaming.export_format import get_export_format, FORMAT_CSV
+from us_finance_streaming_data_miner.ingest.streaming.segment_writer import SegmentWriter
+from us_finance_streaming_data_miner.ingest.streaming.snapshot import save_snapshot, load_snapshot, remove_snapshots, copy_snapshot_state, write_snapshot
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+def _on_trades(aggregations, minutes, symbol = 'SYM1'):
+    for minute in minutes:
+        aggregations.on_trade(Trade(minute * 60, symbol, 100.0 + minute, 1.0))
+
+class TestSnapshot(unittest.TestCase):
+    def test_save_load(self):
+        for new_aggregations in [Aggregations, MatrixAggregations]:
+            with tempfile.TemporaryDirectory() as snapshot_dir:
+                aggregations = new_aggregations()
+                _on_trades(aggregations, range(400))
+                _on_trades(aggregations, [0, 3], symbol='SYM2')
+                save_snapshot(aggregations, snapshot_dir, segment_seq=7)
+
+                recovered = new_aggregations()
+                bars = []
+                recovered.add_bar_listener(lambda *bar: bars.append(bar))
+                self.assertEqual(7, load_snapshot(recovered, snapshot_dir))
+                pd.testing.assert_frame_equal(aggregations.get_minute_df(print_log=False), recovered.get_minute_df(print_log=False))
+                pd.testing.assert_frame_equal(aggregations.get_daily_df(print_log=False), recovered.get_daily_df(print_log=False))
+
+                # only the bars over after the snapshot are notified
+                _on_trades(recovered, [400])
+                self.assertEqual([('SYM1', 399, 499.0, 499.0, 499.0, 499.0, 1.0)], bars)
+
+    def test_write_copied_state(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            aggregations = Aggregations()
+            _on_trades(aggregations, range(10))
+            df = aggregations.get_minute_df(print_log=False)
+            snapshot_state = copy_snapshot_state(aggregations)
+            # the writer goes on while the copy is written
+            _on_trades(aggregations, range(10, 20))
+            write_snapshot(snapshot_state, snapshot_dir, segment_seq=3)
+
+            recovered = Aggregations()
+            self.assertEqual(3, load_snapshot(recovered, snapshot_dir))
+            pd.testing.assert_frame_equal(df, recovered.get_minute_df(print_log=False))
+
+    def test_latest_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            aggregations = Aggregations()
+            _on_trades(aggregations, [0])
+            save_snapshot(aggregations, snapshot_dir, segment_seq=1)
+            _on_trades(aggregations, [1])
+            path = save_snapshot(aggregations, snapshot_dir, segment_seq=2)
+            # a snapshot being written when the process crashed
+            os.makedirs(os.path.join(snapshot_dir, 'snapshot-999999999999999.tmp'))
+
+            self.assertEqual(2, len(os.listdir(snapshot_dir)))
+            recovered = Aggregations()
+            self.assertEqual(2, load_snapshot(recovered, snapshot_dir))
+            self.assertEqual(2, len(recovered.get_minute_df(print_log=False)))
+            self.assertTrue(os.path.isdir(path))
+
+    def test_no_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            self.assertIsNone(load_snapshot(Aggregations(), os.path.join(snapshot_dir, 'missing')))
+
+            aggregations = Aggregations()
+            _on_trades(aggregations, [0])
+            save_snapshot(aggregations, snapshot_dir)
+            # a snapshot of a previous day is ignored
+            self.assertIsNone(load_snapshot(Aggregations(), snapshot_dir, max_age_seconds=-1))
+            remove_snapshots(snapshot_dir)
+            self.assertIsNone(load_snapshot(Aggregations(), snapshot_dir))
+
+    def test_recover(self):
+        csv_format = get_export_format(FORMAT_CSV)
+        with tempfile.TemporaryDirectory() as segment_dir, tempfile.TemporaryDirectory() as snapshot_dir:
+            aggregations_run = DailyAggregationsRun(export_format=csv_format, segment_writer=SegmentWriter(segment_dir, csv_format))
+            _on_trades(aggregations_run, range(200))
+            _on_trades(aggregations_run, [0], symbol='SYM2')
+            aggregations_run.save_snapshot(snapshot_dir)
+            _on_trades(aggregations_run, range(200, 350))
+            aggregations_run.segment_writer.flush()
+            # the process crashes with the bar of the minute 349 in progress
+
+            recovered_run = DailyAggregationsRun(export_format=csv_format, segment_writer=SegmentWriter(segment_dir, csv_format))
+            self.assertEqual(150, recovered_run.recover(snapshot_dir))
+
+            df = aggregations_run.aggregations.get_minute_df(print_log=False)
+            df_recovered = recovered_run.aggregations.get_minute_df(print_log=False)
+            self.assertEqual(['SYM1', 'SYM2'], sorted(set(df_recovered.symbol)))
+            # the bars up to the one before the bar in progress, the recovered run retaining one more bar before
+            pd.testing.assert_frame_equal(df[df.symbol == 'SYM1'].iloc[:-1], df_recovered[df_recovered.symbol == 'SYM1'].iloc[1:])
+            df_daily = recovered_run.aggregations.get_daily_df(print_log=False)
+            self.assertEqual([100.0, 100.0], list(df_daily.open))
+            self.assertEqual([349.0, 1.0], list(df_daily.volume))
+
+    def test_recover_without_snapshot_ignores_previous_session(self):
+        csv_format = get_export_format(FORMAT_CSV)
+        with tempfile.TemporaryDirectory() as segment_dir, tempfile.TemporaryDirectory() as snapshot_dir:
+            # the segments left by a crash of a previous day
+            aggregations_run = DailyAggregationsRun(export_format=csv_format, segment_writer=SegmentWriter(segment_dir, csv_format))
+            _on_trades(aggregations_run, range(10), symbol='SYM0')
+            previous_path = aggregations_run.segment_writer.flush()
+            day_ago = time.time() - 24 * 3600
+            os.utime(previous_path, (day_ago, day_ago))
+
+            # the session crashes before its first snapshot
+            aggregations_run = DailyAggregationsRun(export_format=csv_format, segment_writer=SegmentWriter(segment_dir, csv_format))
+            _on_trades(aggregations_run, range(1000, 1005))
+            aggregations_run.segment_writer.flush()
+
+            recovered_run = DailyAggregationsRun(export_format=csv_format, segment_writer=SegmentWriter(segment_dir, csv_format))
+            self.assertEqual(4, recovered_run.recover(snapshot_dir))
+            self.assertEqual(['SYM1'], sorted(set(recovered_run.aggregations.get_minute_df(print_log=False).symbol)))
+            self.assertFalse(os.path.exists(previous_path))
+
+    def test_no_snapshot_after_daily_trade_end(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            snapshot_dir = os.path.join(base_dir, 'snapshots')
+            aggregations_run = DailyAggregationsRun(single_writer=True, export_format=get_export_format(FORMAT_CSV))
+            _on_trades(aggregations_run, [0, 1])
+            self.assertIsNotNone(aggregations_run.save_snapshot(snapshot_dir))
+            aggregations_run.on_daily_trade_end(base_dir)
+            remove_snapshots(snapshot_dir)
+            # a snapshot of the cleaned aggregations would be recovered as an empty session
+            self.assertIsNone(aggregations_run.save_snapshot(snapshot_dir))
+            self.assertIsNone(load_snapshot(Aggregations(), snapshot_dir))
@@ -1,7 +1,12 @@
-import datetime, threading, time
+import datetime
+import numpy as np, pandas as pd
 import us_finance_streaming_data_miner.util.logging as util_logging
-from us_finance_streaming_data_miner.ingest.streaming.aggregation import Aggregation, Aggregations
+from us_finance_streaming_data_miner.ingest.streaming.aggregation import Aggregation
+from us_finance_streaming_data_miner.ingest.streaming.bar_buffer import OPEN, HIGH, LOW, CLOSE, VOLUME
+from us_finance_streaming_data_miner.ingest.streaming.matrix_aggregation import MatrixAggregations
+from us_finance_streaming_data_miner.ingest.streaming.indicators import RollingChange, RollingQuantity, RollingMin, RollingMax, Vwap, Ema
 import us_finance_streaming_data_miner.util.current_time as current_time
+from us_finance_streaming_data_miner.util.minute_clock import MinuteClock
 from enum import Enum
 
 class MARKET_SIGNAL_MODE(Enum):
@@ -32,11 +37,57 @@ class TRADING_ACTION(Enum):
     ENTER_SHORT = 4
     EXIT_SHORT = 5
 
+class SignalInputs:
+    '''
+    The inputs of a BatchSignalStrategy, aligned NumPy matrices with a row per symbol and a column per minute.
+    See BarMatrix.get_window for how the minutes without a bar are filled.
+    '''
+    def __init__(self, end_minute, symbols, closes, volumes):
+        '''
+
+        :param end_minute: the epoch minute of the last column
+        :param symbols: list of the symbols of the rows
+        :param closes: float array of shape (len(symbols), window)
+        :param volumes: float array of shape (len(symbols), window)
+        '''
+        self.end_minute = end_minute
+        self.symbols = symbols
+        self.closes = closes
+        self.volumes = volumes
+        self.quantities = closes * volumes
+        # returns[:, j] is the change from the column j to j + 1
+        self.returns = closes[:, 1:] / closes[:, :-1] - 1
+
+class BatchSignalStrategy:
+    '''
+    Decides the market signals of all the symbols at once.
+    This class is supposed to be extended, overriding get_market_signals with vectorized NumPy operations.
+    '''
+    def __init__(self, window_minutes = 10):
+        self.window_minutes = window_minutes
+
+    def get_market_signals(self, signal_inputs):
+        '''
+        :param signal_inputs: SignalInputs over the last window_minutes minutes
+        :return: int array of MARKET_SIGNAL_MODE values, one per symbol
+        '''
+        return np.full(len(signal_inputs.symbols), MARKET_SIGNAL_MODE.NO_SIGNAL.value)
+
+_VALUE_ROW_PER_COLUMN = {'open': OPEN, 'high': HIGH, 'low': LOW, 'close': CLOSE, 'volume': VOLUME}
+
+def _to_datetime_index(minutes):
+    return pd.DatetimeIndex(pd.to_datetime(minutes * 60, unit='s', utc=True), name='datetime')
+
 class TradeSignal(Aggregation):
-    def __init__(self, positionsize, symbol):
+    def __init__(self, positionsize, symbol, minute_clock = None):
+        '''
+
+        :param minute_clock: MinuteClock whose current minute is read on ingest instead of the system clock.
+        '''
         super(TradeSignal, self).__init__(symbol)
         self.current_time = current_time.CurrentTime()
-        self.last_ingest_epoch_seconds = 0
+        self.minute_clock = minute_clock
+        self.last_ingest_minute = 0
         self.positionsize = positionsize
         self.position_mode = POSITION_MODE.NO_POSITION
         self.prev_position_mode = POSITION_MODE.NO_POSITION
@@ -49,13 +100,13 @@ class TradeSignal(Aggregation):
         self.short_enter_price = 0
         self.epoch_seconds_short_position_start = 0
 
-    def _is_trade_on_new_minute(self):
-        epoch_seconds = self.current_time.get_current_epoch_seconds()
-        return epoch_seconds // 60 - self.last_ingest_epoch_seconds // 60 > 0
+        self.indicators = {}
+        self.market_signal = MARKET_SIGNAL_MODE.NO_SIGNAL
 
-    def _update_last_ingest_epoch_seconds(self):
-        epoch_seconds = self.current_time.get_current_epoch_seconds()
-        self.last_ingest_epoch_seconds = epoch_seconds
+    def _get_current_minute(self):
+        if self.minute_clock:
+            return self.minute_clock.current_minute
+        return self.current_time.get_current_epoch_seconds() // 60
 
     def on_trade(self, trade):
         super(TradeSignal, self).on_trade(trade)
@@ -81,10 +132,11 @@ class TradeSignal(Aggregation):
 
         :return:
         '''
-        if self._is_trade_on_new_minute():
+        minute = self._get_current_minute()
+        if minute > self.last_ingest_minute:
             self.update_position_mode_on_ingest()
 
-        self._update_last_ingest_epoch_seconds()
+        self.last_ingest_minute = minute
 
     def _update_position_mode(self, position_mode):
         self.prev_position_mode = self.position_mode
@@ -134,36 +186,63 @@ class TradeSignal(Aggregation):
             self.long_enter_price = target_price
             self.epoch_seconds_long_position_start = epoch_seconds
 
+    def get_indicator(self, indicator_class, *args):
+        '''
+        Gets the indicator of the class and the args, creating it on the first call.
+        A new indicator is fed the bars retained so far, so the windows up to the retention are exact from the start.
+        '''
+        key = (indicator_class,) + args
+        indicator = self.indicators.get(key)
+        if indicator is None:
+            indicator = indicator_class(*args)
+            self.add_bar_listener(indicator.on_bar)
+            self.indicators[key] = indicator
+        return indicator
+
+    def get_indicator_value(self, indicator_class, *args):
+        '''
+        Gets the value of the indicator with the bar in progress included, None if there is no bar yet.
+        '''
+        if not len(self.bars):
+            return None
+        return self.get_indicator(indicator_class, *args).get(*self.bars.get_bar(self.bars.slot_at(-1)))
+
+    def _get_last_columns(self, bar_cnt):
+        '''
+        :return: (minutes, values) of the last bar_cnt bars, copied from the bars arrays at once.
+        '''
+        return self.bars.to_columns(max(len(self.bars) - bar_cnt, 0))
+
     def get_change_df(self, column_name, change_window_minutes, query_range_minutes):
         '''
-        Gets the (cur_val - prev_cal) / prev_cal.
+        Gets the (cur_val - prev_cal) / prev_cal, computed on the bars arrays. 0 for a minute whose prev is not retained.
 
         :param change_window_minutes: the minutes timestamp difference between current and prev
         :param query_range_minutes: e.g. if this is 10 minutes, it gets the change up down to past 10 minutes from now.
         :return:
         '''
-        ag = Aggregation(self.symbol)
-        ag.bar_with_times = self.bar_with_times[-(query_range_minutes + change_window_minutes):]
-        df_ag = ag.get_minute_df(print_log=False).set_index('datetime')[[column_name]]
-        if len(df_ag) == 0:
+        minutes, values = self._get_last_columns(query_range_minutes + change_window_minutes)
+        if len(minutes) == 0:
             return 0
-        first_val = df_ag.iloc[0][column_name]
-        df_ag_change = (df_ag.diff(change_window_minutes).fillna(0) / df_ag.shift(change_window_minutes).fillna(first_val)).iloc[-query_range_minutes:]
-        return df_ag_change
+        values = values[_VALUE_ROW_PER_COLUMN[column_name]]
+        change = np.zeros(len(values))
+        if 0 < change_window_minutes < len(values):
+            prev_values = values[:-change_window_minutes]
+            change[change_window_minutes:] = (values[change_window_minutes:] - prev_values) / prev_values
+        return pd.DataFrame({column_name: change[-query_range_minutes:]}, index=_to_datetime_index(minutes[-query_range_minutes:]))
 
     def _get_change(self, change_window_minutes = 10, query_range_minutes = 1):
         '''
         return the change that is used to decide the trading signal.
+        It is the latest value of get_change_df, which does not depend on the query range,
+        so it is read from the incremental RollingChange for any query_range_minutes.
 
         :param change_window_minutes: the minutes timestamp difference between current and prev
         :param query_range_minutes: e.g. if this is 10 minutes, it gets the change up down to past 10 minutes from now.
-        :return: a value of numpy.float64 type
+        :return: a value of float type
         '''
-        df_change = self.get_change_df('close', change_window_minutes, query_range_minutes)
-        if len(df_change) == 0:
-            return False
-        change = df_change.close.values[-1]
-        return change
+        change = self.get_indicator_value(RollingChange, change_window_minutes)
+        return False if change is None else change
 
     def get_value_df(self, column_names, query_range_minutes):
         '''
@@ -173,11 +252,9 @@ class TradeSignal(Aggregation):
         :param query_range_minutes: e.g. if this is 10 minutes, it gets the change up down to past 10 minutes from now.
         :return:
         '''
-        ag = Aggregation(self.symbol)
-        ag.bar_with_times = self.bar_with_times[-(query_range_minutes):]
-        df_ag = ag.get_minute_df(print_log=False).set_index('datetime')[column_names]
-        df_ag_change = df_ag.iloc[-query_range_minutes:]
-        return df_ag_change
+        minutes, values = self._get_last_columns(query_range_minutes)
+        return pd.DataFrame({column_name: values[_VALUE_ROW_PER_COLUMN[column_name]] for column_name in column_names},
+            index=_to_datetime_index(minutes), columns=column_names)
 
     def get_quantity_df(self, query_range_minutes):
         '''
@@ -194,11 +271,23 @@ class TradeSignal(Aggregation):
         '''
         Gets the accumulative quantity (close * volume) value.
 
-        :param numpy.float64 value.
-        :return:
+        :param query_range_minutes: e.g. if this is 10 minutes, it sums up the quantity of past 10 minutes up to now.
+        :return: a value of float type
         '''
-        df = self.get_quantity_df(query_range_minutes)
-        return df.quantity.sum()
+        quantity = self.get_indicator_value(RollingQuantity, query_range_minutes)
+        return 0 if quantity is None else quantity
+
+    def get_rolling_min(self, window_minutes):
+        return self.get_indicator_value(RollingMin, window_minutes)
+
+    def get_rolling_max(self, window_minutes):
+        return self.get_indicator_value(RollingMax, window_minutes)
+
+    def get_vwap(self):
+        return self.get_indicator_value(Vwap)
+
+    def get_ema(self, span_minutes):
+        return self.get_indicator_value(Ema, span_minutes)
 
     def _get_close_price(self):
         '''
@@ -214,9 +303,16 @@ class TradeSignal(Aggregation):
     def get_market_signal(self):
         '''
         Gets if the signal is positive for entering in a position.
-        :return:
+        :return: the signal set by the last batch evaluation of TradeSignals, NO_SIGNAL if there is none.
         '''
-        return MARKET_SIGNAL_MODE.NO_SIGNAL
+        return self.market_signal
+
+    def on_market_signal(self, market_signal):
+        '''
+        Called when the batch evaluation of TradeSignals changes the market signal.
+        '''
+        self.market_signal = market_signal
+        self._update_position_mode_on_market_signal(market_signal, self.get_short_term_market_signal())
 
     def get_short_term_market_signal(self):
         return SHORT_TERM_MARKET_SIGNAL_MODE.NO_SIGNAL
@@ -248,36 +344,79 @@ class TradeSignal(Aggregation):
     def enter_short_position(self):
         self._on_short_position_enter()
 
-class TradeSignals(Aggregations):
-    def __init__(self, dry_run, positionsize, a_current_time = None):
+class TradeSignals(MatrixAggregations):
+    def __init__(self, dry_run, positionsize, a_current_time = None, writer = None, strategy = None, event_time = False):
+        '''
+
+        :param writer: SingleWriter that mutates the signals (e.g. AggregationsRun.writer), on_new_minute is then run through it.
+        :param strategy: BatchSignalStrategy, evaluated over all the symbols on each new minute if given.
+        :param event_time: if True, the minutes are advanced by the timestamps of the ingested trades and bars,
+            otherwise by the wall clock of a_current_time.
+        '''
         super(TradeSignals, self).__init__()
-        self.last_tick_epoch_second = 0
+        self.writer = writer
+        self.strategy = strategy
+        self.market_signals = np.zeros(0, dtype=np.int64)
         self.current_time = a_current_time if a_current_time else current_time.CurrentTime()
-        self.tick_minute_sleep_duration_seconds = 10
         self.positionsize = positionsize
-        threading.Thread(target=self._tick_minute).start()
+        self.event_time = event_time
+        self.minute_clock = MinuteClock(self.current_time)
+        self.minute_clock.add_callback(self._on_minute_clock)
+        if not event_time:
+            self.minute_clock.start()
 
-    def _is_tick_new_minute(self):
-        epoch_seconds = self.current_time.get_current_epoch_seconds()
-        return epoch_seconds // 60 - self.last_tick_epoch_second // 60 > 0
+    def stop(self):
+        self.minute_clock.stop()
 
-    def _tick_minute(self):
-        while True:
-            if self._is_tick_new_minute():
-                self.on_new_minute()
-                self.last_tick_epoch_second = self.current_time.get_current_epoch_seconds()
-            time.sleep(self.tick_minute_sleep_duration_seconds)
+    def _on_minute_clock(self, minute):
+        if self.writer:
+            self.writer.submit(self.on_new_minute)
+        else:
+            self.on_new_minute()
+
+    def on_trade(self, trade):
+        if self.event_time:
+            self.minute_clock.advance_to(trade.timestamp_seconds)
+        super(TradeSignals, self).on_trade(trade)
 
     def on_bar_with_time(self, bar_with_time):
-        if bar_with_time.bar.symbol not in self.aggregation_per_symbol:
-            self.aggregation_per_symbol[bar_with_time.bar.symbol] = TradeSignal(self.positionsize, bar_with_time.bar.symbol)
+        if self.event_time:
+            self.minute_clock.advance_to(bar_with_time.epoch_minute * 60)
         super(TradeSignals, self).on_bar_with_time(bar_with_time)
 
-    def on_trade(self, trade):
-        if trade.symbol not in self.aggregation_per_symbol:
-            self.aggregation_per_symbol[trade.symbol] = TradeSignal(self.positionsize, trade.symbol)
-        super(TradeSignals, self).on_trade(trade)
+    def clean(self):
+        super(TradeSignals, self).clean()
+        self.market_signals = np.zeros(0, dtype=np.int64)
+
+    def _new_aggregation(self, symbol):
+        return self._bind_row(TradeSignal(self.positionsize, symbol, self.minute_clock))
+
+    def get_signal_inputs(self, end_minute, window_minutes):
+        closes, volumes = self.matrix.get_window(end_minute, window_minutes)
+        return SignalInputs(end_minute, self.matrix.symbols, closes, volumes)
+
+    def evaluate_market_signals(self, end_minute = None):
+        '''
+        Evaluates the strategy over all the symbols in one pass, and notifies the TradeSignals whose signal changed.
+
+        :param end_minute: the epoch minute to evaluate at, the last complete minute if not given.
+        :return: int array of MARKET_SIGNAL_MODE values in the order of self.matrix.symbols
+        '''
+        if end_minute is None:
+            end_minute = self.minute_clock.current_minute - 1
+        signal_inputs = self.get_signal_inputs(end_minute, self.strategy.window_minutes)
+        market_signals = np.asarray(self.strategy.get_market_signals(signal_inputs), dtype=np.int64)
+
+        prev_market_signals = np.full(len(market_signals), MARKET_SIGNAL_MODE.NO_SIGNAL.value)
+        prev_market_signals[:len(self.market_signals)] = self.market_signals
+        aggregations = list(self.aggregation_per_symbol.values())
+        for row in np.flatnonzero(market_signals != prev_market_signals):
+            aggregations[row].on_market_signal(MARKET_SIGNAL_MODE(int(market_signals[row])))
+        self.market_signals = market_signals
+        return market_signals
 
     def on_new_minute(self):
+        if self.strategy:
+            self.evaluate_market_signals()
         for _, aggregation in self.aggregation_per_symbol.items():
             aggregation.on_new_minute()
@@ -4,7 +4,7 @@ import numpy as np
 import pytz
 
 from us_finance_streaming_data_miner.ingest.streaming.aggregation import Trade
-from us_finance_streaming_data_miner.ingest.streaming.trade_signal import TradeSignal
+from us_finance_streaming_data_miner.ingest.streaming.trade_signal import TradeSignal, TradeSignals, BatchSignalStrategy, MARKET_SIGNAL_MODE
 from us_finance_streaming_data_miner.util.current_time import MockCurrentTime
 
 
@@ -98,3 +98,69 @@ class TestAggregation(unittest.TestCase):
         self.assertEqual(320.0, cq)
 
 
+
+    def test_get_change(self):
+        symbol = 'DUMMY_SYMBOL'
+        signal = TradeSignal(100, symbol)
+        for minute, price in enumerate([100.0, 110.0, 120.0, 130.0, 140.0]):
+            signal.on_trade(Trade(minute * 60, symbol, price, 1.0))
+            self.assertAlmostEqual(signal.get_change_df('close', 2, 1).close.values[-1], signal._get_change(2, 1))
+            self.assertAlmostEqual(signal.get_change_df('close', 2, 5).close.values[-1], signal._get_change(2, 5))
+
+        self.assertEqual((140.0-120)/120, signal._get_change(2, 1))
+        self.assertEqual(0, signal._get_change(10, 1))
+
+    def test_get_indicators(self):
+        symbol = 'DUMMY_SYMBOL'
+        signal = TradeSignal(100, symbol)
+        self.assertIsNone(signal.get_vwap())
+        signal.on_trade(Trade(0 * 60, symbol, 100.0, 1.0))
+        signal.on_trade(Trade(1 * 60, symbol, 110.0, 3.0))
+        signal.on_trade(Trade(1 * 60 + 30, symbol, 90.0, 1.0))
+
+        self.assertEqual(90.0, signal.get_rolling_min(2))
+        self.assertEqual(110.0, signal.get_rolling_max(2))
+        self.assertEqual((100.0 + 90.0 * 4) / 5, signal.get_vwap())
+        self.assertEqual(100.0 + (90.0 - 100.0) * 2 / 3, signal.get_ema(2))
+
+
+class _MomentumStrategy(BatchSignalStrategy):
+    def get_market_signals(self, signal_inputs):
+        change = np.nan_to_num(signal_inputs.closes[:, -1] / signal_inputs.closes[:, 0] - 1)
+        return np.where(change > 0.05, MARKET_SIGNAL_MODE.LONG_SIGNAL.value,
+                        np.where(change < -0.05, MARKET_SIGNAL_MODE.SHORT_SIGNAL.value, MARKET_SIGNAL_MODE.NO_SIGNAL.value))
+
+class TestTradeSignals(unittest.TestCase):
+    def test_evaluate_market_signals(self):
+        signals = TradeSignals(True, 100, a_current_time=MockCurrentTime(0), strategy=_MomentumStrategy(3))
+        for minute, (price_up, price_down, price_flat) in enumerate([(100.0, 100.0, 100.0), (105.0, 95.0, 101.0), (110.0, 90.0, 100.0)]):
+            signals.on_trade(Trade(minute * 60, 'UP', price_up, 1.0))
+            signals.on_trade(Trade(minute * 60, 'DOWN', price_down, 1.0))
+            signals.on_trade(Trade(minute * 60, 'FLAT', price_flat, 1.0))
+
+        received = []
+        signals.aggregation_per_symbol['UP'].on_market_signal = received.append
+        market_signals = signals.evaluate_market_signals(2)
+        self.assertEqual(
+            [MARKET_SIGNAL_MODE.LONG_SIGNAL.value, MARKET_SIGNAL_MODE.SHORT_SIGNAL.value, MARKET_SIGNAL_MODE.NO_SIGNAL.value],
+            list(market_signals))
+        self.assertEqual([MARKET_SIGNAL_MODE.LONG_SIGNAL], received)
+        self.assertEqual(MARKET_SIGNAL_MODE.SHORT_SIGNAL, signals.aggregation_per_symbol['DOWN'].get_market_signal())
+
+        # only the changed signals are notified
+        signals.evaluate_market_signals(2)
+        self.assertEqual(1, len(received))
+        signals.stop()
+
+    def test_event_time(self):
+        signals = TradeSignals(True, 100, a_current_time=MockCurrentTime(0), strategy=_MomentumStrategy(2), event_time=True)
+        new_minutes = []
+        signals.on_new_minute = lambda: new_minutes.append(signals.minute_clock.current_minute)
+        signals.on_trade(Trade(0, 'UP', 100.0, 1.0))
+        signals.on_trade(Trade(30, 'UP', 100.0, 1.0))
+        signals.on_trade(Trade(60, 'UP', 110.0, 1.0))
+        signals.on_trade(Trade(200, 'UP', 120.0, 1.0))
+        # a late trade does not move the clock back
+        signals.on_trade(Trade(150, 'UP', 120.0, 1.0))
+        self.assertEqual([1, 2, 3], new_minutes)
+        self.assertEqual(3, signals.aggregation_per_symbol['UP']._get_current_minute())
@@ -1,12 +1,41 @@
-import os
+import json, os, threading, zlib
 from google.cloud import pubsub_v1
+from us_finance_streaming_data_miner.ingest.streaming.sharding import ShardRouter
+import us_finance_streaming_data_miner.util.logging as logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+KIND_BARS = 'bars'
+KIND_SIGNALS = 'signals'
+ENCODING_ZLIB = 'zlib'
+# the attribute the consumers route the messages by, as sharding.ROUTING_ATTRIBUTE
+_SYMBOL_ATTRIBUTE = 'symbol'
+_SHARD_ATTRIBUTE = 'shard'
+_SEQUENCE_ATTRIBUTE = 'seq'
+
+_MAX_EVENTS_PER_MESSAGE = 500
+_MAX_LATENCY_SECONDS = 1.0
+_MAX_OUTSTANDING = 1000
+_MAX_OUTSTANDING_WAIT_SECONDS = 10.0
+_SHARD_SIZE = 16
+_ZLIB_LEVEL = 1
 
 _publisher = None
+_topic_name = None
 
 def _get_topic_name():
+    global _topic_name
+    if _topic_name is None:
+        _topic_name = get_topic_name(os.getenv('FINANCE_STREAM_PUBSUB_ID'))
+    return _topic_name
+
+def get_topic_name(topic, project_id = None):
     return 'projects/{project_id}/topics/{topic}'.format(
-        project_id=os.getenv('GOOGLE_CLOUD_PROJECT'),
-        topic=os.getenv('FINANCE_STREAM_PUBSUB_ID'),
+        project_id=project_id or os.getenv('GOOGLE_CLOUD_PROJECT'),
+        topic=topic,
     )
 
 def _get_publisher():
@@ -18,3 +47,214 @@ def _get_publisher():
 def publish(msg_str):
     publisher = _get_publisher()
     publisher.publish(_get_topic_name(), msg_str.encode())
+
+def new_publisher_client(max_messages = 100, max_bytes = 1024 * 1024, max_latency_seconds = 0.05, enable_message_ordering = True):
+    '''
+    Creates a PublisherClient that batches the messages into publish requests by the thresholds.
+    It runs against the Pub/Sub emulator if PUBSUB_EMULATOR_HOST is set.
+    '''
+    return pubsub_v1.PublisherClient(
+        batch_settings=pubsub_v1.types.BatchSettings(max_messages=max_messages, max_bytes=max_bytes, max_latency=max_latency_seconds),
+        publisher_options=pubsub_v1.types.PublisherOptions(enable_message_ordering=enable_message_ordering))
+
+def _dumps(obj):
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def encode_events(events, compress = False):
+    '''
+    :return: (data, attributes) of the message carrying the events.
+    '''
+    data = _dumps(events)
+    if compress:
+        return zlib.compress(data, _ZLIB_LEVEL), {'encoding': ENCODING_ZLIB}
+    return data, {}
+
+def decode_events(data, attributes = None):
+    '''
+    Decodes the events of a message published by BatchPublisher.
+
+    :return: list of the events, [symbol, minute, open, high, low, close, volume] for the bars
+        and [symbol, minute, signal] for the signals.
+    '''
+    if attributes and attributes.get('encoding') == ENCODING_ZLIB:
+        data = zlib.decompress(data)
+    return orjson.loads(data) if orjson else json.loads(data)
+
+class BatchPublisher:
+    '''
+    Publishes the bars and the signals, many events per message.
+
+    The symbols are assigned to shard_size shards by a ShardRouter and the events are grouped per kind and shard,
+    so a message carries the bars of many symbols of a minute. The messages are published with the shard as the
+    ordering key and the shard attribute, so a symbol is kept in order and the consumers can shard by it; the symbol
+    attribute is set only if all the events of the message are of one symbol. Without ordering, the events of all the
+    symbols are grouped together. A group is published once it has max_events_per_message events, or by the
+    thread of start() every max_latency_seconds. The client batches the messages further into publish requests.
+    The groups are taken and published under a single lock, so the messages of an ordering key reach the client
+    in the order of their events whichever thread publishes them.
+
+    At most max_outstanding messages are in flight, publishing blocks until the earlier ones are done,
+    which pushes back on the caller. As the caller is the writer of the aggregations, it blocks for at most
+    max_outstanding_wait_seconds, after which the message is dropped and counted in dropped_message_cnt.
+    The delivery is therefore lossy: the messages of an ordering key carry the seq attribute, numbered from 0
+    whether published or not, so the consumers can tell the gap of a dropped or failed message.
+    '''
+    def __init__(self, client, topic_name, max_events_per_message = _MAX_EVENTS_PER_MESSAGE, max_latency_seconds = _MAX_LATENCY_SECONDS,
+                 compress = False, ordering = True, max_outstanding = _MAX_OUTSTANDING,
+                 max_outstanding_wait_seconds = _MAX_OUTSTANDING_WAIT_SECONDS, shard_size = _SHARD_SIZE):
+        '''
+
+        :param client: pubsub_v1.PublisherClient, with enable_message_ordering if ordering, or a fake of it.
+        :param compress: if True, the payloads are compressed with zlib, told by the encoding attribute.
+        :param max_outstanding_wait_seconds: how long publishing waits for an outstanding message to be done, None to wait forever.
+        :param shard_size: number of the ordering keys the symbols are spread over.
+        '''
+        self.client = client
+        self.topic_name = topic_name
+        self.max_events_per_message = max_events_per_message
+        self.max_latency_seconds = max_latency_seconds
+        self.compress = compress
+        self.ordering = ordering
+        self.max_outstanding = max_outstanding
+        self.max_outstanding_wait_seconds = max_outstanding_wait_seconds
+        self.router = ShardRouter(shard_size)
+        self.published_message_cnt = 0
+        self.published_event_cnt = 0
+        self.failed_message_cnt = 0
+        self.dropped_message_cnt = 0
+        self.dropped_event_cnt = 0
+        self._events_per_group = {}
+        self._lock = threading.Lock()
+        # held from taking a group through handing it to the client, to keep the order of an ordering key
+        self._publish_lock = threading.Lock()
+        self._seq_per_ordering_key = {}
+        self._outstanding_cnt = 0
+        self._outstanding_condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _add(self, kind, symbol, event):
+        key = (kind, self.router.get_shard(symbol) if self.ordering else None)
+        with self._lock:
+            events = self._events_per_group.get(key)
+            if events is None:
+                events = []
+                self._events_per_group[key] = events
+            events.append(event)
+            if len(events) < self.max_events_per_message:
+                return
+        with self._publish_lock:
+            with self._lock:
+                # None if flush took the group meanwhile, then already published in order
+                events = self._events_per_group.pop(key, None)
+            if events:
+                self._publish(key, events)
+
+    def on_bar(self, symbol, minute, open_, high, low, close_, volume):
+        '''
+        An Aggregations bar listener.
+        '''
+        self._add(KIND_BARS, symbol, [symbol, minute, open_, high, low, close_, volume])
+
+    def on_signal(self, symbol, minute, signal):
+        self._add(KIND_SIGNALS, symbol, [symbol, minute, signal])
+
+    def _publish(self, key, events):
+        '''
+        Publishes the events of a group, called with the _publish_lock held.
+        '''
+        kind, shard_id = key
+        data, attributes = encode_events(events, self.compress)
+        attributes['kind'] = kind
+        ordering_key = ''
+        if shard_id is not None:
+            ordering_key = 'shard-{shard_id}'.format(shard_id=shard_id)
+            attributes[_SHARD_ATTRIBUTE] = str(shard_id)
+            seq = self._seq_per_ordering_key.get(ordering_key, 0)
+            self._seq_per_ordering_key[ordering_key] = seq + 1
+            attributes[_SEQUENCE_ATTRIBUTE] = str(seq)
+            symbols = set(event[0] for event in events)
+            if len(symbols) == 1:
+                attributes[_SYMBOL_ATTRIBUTE] = symbols.pop()
+
+        with self._outstanding_condition:
+            if not self._outstanding_condition.wait_for(lambda: self._outstanding_cnt < self.max_outstanding, self.max_outstanding_wait_seconds):
+                self.dropped_message_cnt += 1
+                self.dropped_event_cnt += len(events)
+                logging.error('dropped {event_cnt} events of {ordering_key} as {outstanding_cnt} messages are outstanding',
+                    event_cnt=len(events), ordering_key=ordering_key, outstanding_cnt=self._outstanding_cnt)
+                return
+            self._outstanding_cnt += 1
+        try:
+            future = self.client.publish(self.topic_name, data, ordering_key=ordering_key, **attributes)
+        except Exception:
+            self._on_publish_done(ordering_key, len(events), None)
+            raise
+        future.add_done_callback(lambda f: self._on_publish_done(ordering_key, len(events), f))
+
+    def _on_publish_done(self, ordering_key, event_cnt, future):
+        ex = future.exception() if future else None
+        with self._outstanding_condition:
+            self._outstanding_cnt -= 1
+            if future and not ex:
+                self.published_message_cnt += 1
+                self.published_event_cnt += event_cnt
+            else:
+                self.failed_message_cnt += 1
+            self._outstanding_condition.notify_all()
+        if ex:
+            logging.error('failed to publish {event_cnt} events of {ordering_key}: {ex}', event_cnt=event_cnt, ordering_key=ordering_key, ex=ex)
+            if ordering_key:
+                # a failure pauses the publishing of the ordering key
+                self.client.resume_publish(self.topic_name, ordering_key)
+
+    def get_outstanding_cnt(self):
+        return self._outstanding_cnt
+
+    def flush(self):
+        '''
+        Publishes all the events grouped so far.
+        '''
+        with self._publish_lock:
+            with self._lock:
+                events_per_group, self._events_per_group = self._events_per_group, {}
+            for key, events in events_per_group.items():
+                self._publish(key, events)
+
+    def wait(self, timeout = None):
+        '''
+        Waits until the messages published so far are done.
+
+        :return: True if none is outstanding.
+        '''
+        with self._outstanding_condition:
+            return self._outstanding_condition.wait_for(lambda: self._outstanding_cnt == 0, timeout)
+
+    def start(self):
+        '''
+        Starts the thread that publishes the grouped events every max_latency_seconds.
+        '''
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='batch_publisher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout = None):
+        '''
+        Stops the thread, publishes what is left and waits for it to be done.
+        '''
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        return self.wait(timeout)
+
+    def _run(self):
+        while not self._stopped.wait(self.max_latency_seconds):
+            try:
+                self.flush()
+            except Exception as ex:
+                logging.error('failed to publish: {ex}', ex=ex)
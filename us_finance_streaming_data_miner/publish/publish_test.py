@@ -0,0 +1,183 @@
+import unittest, threading
+from concurrent.futures import Future
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.publish.publish import BatchPublisher, decode_events, KIND_BARS, KIND_SIGNALS, ENCODING_ZLIB
+from us_finance_streaming_data_miner.util.fake_pubsub import FakePublisherClient
+
+_TOPIC = 'projects/test/topics/bars'
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class _PendingPublisherClient:
+    '''
+    Publisher client whose futures are done only when resolved by the test.
+    '''
+    def __init__(self):
+        self.futures = []
+        self.attributes = []
+
+    def publish(self, topic, data, ordering_key = '', **attributes):
+        future = Future()
+        self.futures.append(future)
+        self.attributes.append(attributes)
+        return future
+
+class _BlockingPublisherClient(FakePublisherClient):
+    '''
+    Publisher client whose first publish blocks until released by the test.
+    '''
+    def __init__(self):
+        super(_BlockingPublisherClient, self).__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def publish(self, topic, data, ordering_key = '', **attributes):
+        if not self.entered.is_set():
+            self.entered.set()
+            self.release.wait(10)
+        return super(_BlockingPublisherClient, self).publish(topic, data, ordering_key, **attributes)
+
+class TestBatchPublisher(unittest.TestCase):
+    def test_group_by_shard(self):
+        client = FakePublisherClient()
+        publisher = BatchPublisher(client, _TOPIC, max_events_per_message=2, shard_size=1)
+        publisher.on_bar('SYM1', 0, 100.0, 110.0, 90.0, 105.0, 1.0)
+        publisher.on_bar('SYM2', 0, 200.0, 200.0, 200.0, 200.0, 2.0)
+        publisher.on_bar('SYM1', 1, 105.0, 105.0, 105.0, 105.0, 0.0)
+        self.assertEqual(1, len(client.messages))
+        message = client.messages[0]
+        self.assertEqual('shard-0', message.ordering_key)
+        self.assertEqual({'kind': KIND_BARS, 'shard': '0', 'seq': '0'}, message.attributes)
+        self.assertEqual([['SYM1', 0, 100.0, 110.0, 90.0, 105.0, 1.0], ['SYM2', 0, 200.0, 200.0, 200.0, 200.0, 2.0]],
+            decode_events(message.data, message.attributes))
+
+        publisher.on_signal('SYM1', 1, 1)
+        publisher.flush()
+        self.assertEqual(3, len(client.messages))
+        self.assertEqual([{'kind': KIND_BARS, 'shard': '0', 'seq': '1', 'symbol': 'SYM1'}, {'kind': KIND_SIGNALS, 'shard': '0', 'seq': '2', 'symbol': 'SYM1'}],
+            [m.attributes for m in client.messages[1:]])
+        self.assertEqual([['SYM1', 1, 1]], decode_events(client.messages[2].data))
+        self.assertEqual(3, publisher.published_message_cnt)
+        self.assertEqual(4, publisher.published_event_cnt)
+
+    def test_group_many_symbols(self):
+        client = FakePublisherClient()
+        publisher = BatchPublisher(client, _TOPIC, shard_size=4)
+        for i in range(100):
+            publisher.on_bar('SYM{i}'.format(i=i), 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+        publisher.flush()
+
+        # a message per shard, each symbol always in the same one
+        self.assertEqual(4, len(client.messages))
+        self.assertEqual(100, publisher.published_event_cnt)
+        for message in client.messages:
+            shard_id = int(message.attributes['shard'])
+            self.assertEqual('shard-{shard_id}'.format(shard_id=shard_id), message.ordering_key)
+            for event in decode_events(message.data):
+                self.assertEqual(shard_id, publisher.router.get_shard(event[0]))
+
+    def test_no_ordering_compressed(self):
+        client = FakePublisherClient()
+        publisher = BatchPublisher(client, _TOPIC, ordering=False, compress=True)
+        bars = [['SYM{i}'.format(i=i), 0, 100.0, 100.0, 100.0, 100.0, 1.0] for i in range(100)]
+        for bar in bars:
+            publisher.on_bar(*bar)
+        publisher.flush()
+
+        self.assertEqual(1, len(client.messages))
+        message = client.messages[0]
+        self.assertEqual('', message.ordering_key)
+        self.assertEqual({'kind': KIND_BARS, 'encoding': ENCODING_ZLIB}, message.attributes)
+        self.assertEqual(bars, decode_events(message.data, message.attributes))
+
+    def test_failure_resumes_ordering_key(self):
+        client = FakePublisherClient()
+        client.failure_cnt_per_ordering_key['shard-0'] = 1
+        publisher = BatchPublisher(client, _TOPIC, shard_size=1)
+        publisher.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+        publisher.flush()
+        self.assertEqual(1, publisher.failed_message_cnt)
+        self.assertEqual(set(), client.paused_ordering_keys)
+
+        publisher.on_bar('SYM1', 1, 100.0, 100.0, 100.0, 100.0, 1.0)
+        publisher.flush()
+        self.assertEqual(1, publisher.published_message_cnt)
+        self.assertEqual([['SYM1', 1, 100.0, 100.0, 100.0, 100.0, 1.0]], decode_events(client.messages[0].data))
+
+    def test_backpressure(self):
+        client = _PendingPublisherClient()
+        publisher = BatchPublisher(client, _TOPIC, max_events_per_message=1, max_outstanding=1)
+        publisher.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+        self.assertEqual(1, publisher.get_outstanding_cnt())
+
+        thread = threading.Thread(target=publisher.on_bar, args=('SYM2', 0, 100.0, 100.0, 100.0, 100.0, 1.0))
+        thread.start()
+        thread.join(0.1)
+        # blocked until the first message is done
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(1, len(client.futures))
+
+        client.futures[0].set_result('1')
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(2, len(client.futures))
+        self.assertFalse(publisher.wait(0.01))
+        client.futures[1].set_result('2')
+        self.assertTrue(publisher.wait(10))
+        self.assertEqual(2, publisher.published_message_cnt)
+        self.assertEqual(0, publisher.dropped_message_cnt)
+
+    def test_flush_concurrent_with_add(self):
+        client = _BlockingPublisherClient()
+        publisher = BatchPublisher(client, _TOPIC, max_events_per_message=2, shard_size=1)
+        publisher.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+        flush_thread = threading.Thread(target=publisher.flush)
+        flush_thread.start()
+        self.assertTrue(client.entered.wait(10))
+
+        # the writer fills the next group of the shard while the timer thread is publishing the previous one
+        def add():
+            publisher.on_bar('SYM1', 1, 100.0, 100.0, 100.0, 100.0, 1.0)
+            publisher.on_bar('SYM1', 2, 100.0, 100.0, 100.0, 100.0, 1.0)
+        add_thread = threading.Thread(target=add)
+        add_thread.start()
+        add_thread.join(0.1)
+        self.assertTrue(add_thread.is_alive())
+
+        client.release.set()
+        flush_thread.join(10)
+        add_thread.join(10)
+        self.assertEqual([[0], [1, 2]], [[event[1] for event in decode_events(m.data)] for m in client.messages])
+        self.assertEqual(['0', '1'], [m.attributes['seq'] for m in client.messages])
+
+    def test_backpressure_timeout(self):
+        client = _PendingPublisherClient()
+        publisher = BatchPublisher(client, _TOPIC, max_events_per_message=1, max_outstanding=1, max_outstanding_wait_seconds=0.01, shard_size=1)
+        publisher.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+        # dropped instead of blocking the caller
+        publisher.on_bar('SYM2', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+        self.assertEqual(1, len(client.futures))
+        self.assertEqual(1, publisher.dropped_message_cnt)
+        self.assertEqual(1, publisher.dropped_event_cnt)
+
+        client.futures[0].set_result('1')
+        publisher.on_bar('SYM2', 1, 100.0, 100.0, 100.0, 100.0, 1.0)
+        self.assertEqual(2, len(client.futures))
+        self.assertEqual(1, publisher.dropped_message_cnt)
+        # the consumers see the gap of the dropped message
+        self.assertEqual(['0', '2'], [attributes['seq'] for attributes in client.attributes])
+
+    def test_latency(self):
+        client = FakePublisherClient()
+        publisher = BatchPublisher(client, _TOPIC, max_latency_seconds=0.01).start()
+        publisher.on_bar('SYM1', 0, 100.0, 100.0, 100.0, 100.0, 1.0)
+        for _ in range(1000):
+            if client.messages:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(1, len(client.messages))
+        publisher.on_bar('SYM1', 1, 100.0, 100.0, 100.0, 100.0, 1.0)
+        self.assertTrue(publisher.stop(10))
+        self.assertEqual(2, publisher.published_event_cnt)
@@ -1,32 +1,193 @@
 import os
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(os.getcwd(), 'credential.json')
 
+import base64, hashlib, time
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage
 from google.cloud.exceptions import NotFound
+from us_finance_streaming_data_miner.ingest.streaming.export_format import get_partition_dir
+import us_finance_streaming_data_miner.util.logging as logging
 
 _client = None
+_bucket_per_name = {}
 
 _BUCKET_NAME = 'stock_daily_data'
 _BLOB_NAME = 'us.daily.streaming.csv'
+# the daily file the downstream consumers read from _BLOB_NAME
+_DAILY_CSV_FILENAME = 'daily.csv'
+
+_MAX_WORKERS = 8
+_CHUNK_SIZE = 8 * 1024 * 1024 # a multiple of 256 KB as required by the resumable upload
+_MAX_ATTEMPTS = 5
+_BACKOFF_SECONDS = 1.0
+_READ_SIZE = 1024 * 1024
+# the files saved by the aggregations runs, under base_dir or its date=YYYY-MM-DD partitions
+_UPLOAD_FILE_STEMS = ('minute', 'daily',)
 
 def _get_client():
+    '''
+    The client honors STORAGE_EMULATOR_HOST, to run against a local fake storage server.
+    '''
     global _client
     if _client is None:
         _client = storage.Client()
     return _client
 
+def _get_bucket(bucket_name = _BUCKET_NAME):
+    '''
+    Gets the bucket once, without the lookup request of client.get_bucket.
+    '''
+    bucket = _bucket_per_name.get(bucket_name)
+    if bucket is None:
+        bucket = _get_client().bucket(bucket_name)
+        _bucket_per_name[bucket_name] = bucket
+    return bucket
+
 def get_latest_source_filename():
     base_dir = 'data'
     return os.path.join(base_dir, 'daily.csv')
 
+def get_md5_hash(path):
+    '''
+    :return: the base64 encoded md5 of the file, as the md5_hash of a blob.
+    '''
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_SIZE), b''):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode('ascii')
+
+def get_upload_files(base_dir, prefix = '', file_stems = _UPLOAD_FILE_STEMS, recursive = True):
+    '''
+    Lists the minute and daily files under base_dir, the date partitions included.
+
+    :param prefix: prefix of the blob names, which are the paths relative to base_dir otherwise.
+    :param recursive: if False, only the files directly in base_dir are listed.
+    :return: list of (path, blob_name) in the order of the paths.
+    '''
+    files = []
+    for dir_path, dir_names, filenames in os.walk(base_dir):
+        dir_names.sort()
+        if not recursive:
+            dir_names.clear()
+        for filename in sorted(filenames):
+            if filename.split('.')[0] not in file_stems or filename.endswith('.tmp'):
+                continue
+            path = os.path.join(dir_path, filename)
+            blob_name = os.path.relpath(path, base_dir).replace(os.sep, '/')
+            files.append((path, prefix + blob_name))
+    return files
+
+def get_session_upload_files(base_dir, date_str, partition_by_date = False):
+    '''
+    Lists the minute and daily files of the session of date_str, saved to base_dir or its date partition.
+
+    The files go under the date_str/ prefix so a session does not overwrite the blobs of the previous ones,
+    and the daily csv goes to _BLOB_NAME as well, the blob the downstream consumers read.
+
+    :return: list of (path, blob_name).
+    '''
+    session_dir = get_partition_dir(base_dir, date_str) if partition_by_date else base_dir
+    files = get_upload_files(session_dir, prefix='{date_str}/'.format(date_str=date_str), recursive=False)
+    daily_csv_path = os.path.join(session_dir, _DAILY_CSV_FILENAME)
+    if os.path.exists(daily_csv_path):
+        files.insert(0, (daily_csv_path, _BLOB_NAME))
+    return files
+
+class UploadResult:
+    def __init__(self):
+        self.uploaded, self.skipped, self.failed = [], [], []
+
+    def __str__(self):
+        return 'uploaded: {uploaded}, skipped: {skipped}, failed: {failed}'.format(
+            uploaded=len(self.uploaded), skipped=len(self.skipped), failed=len(self.failed))
+
+class Uploader:
+    '''
+    Uploads many files to a bucket concurrently with a thread pool.
+
+    A file is uploaded in chunks with a resumable upload, retried with an exponential backoff,
+    and skipped if the blob already has the same md5, so a failed run can just be run again.
+    '''
+    def __init__(self, bucket, max_workers = _MAX_WORKERS, chunk_size = _CHUNK_SIZE, max_attempts = _MAX_ATTEMPTS, backoff_seconds = _BACKOFF_SECONDS):
+        '''
+
+        :param bucket: google.cloud.storage.Bucket, or an object with the same blob and get_blob methods.
+        '''
+        self.bucket = bucket
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+
+    def _is_unchanged(self, path, blob_name):
+        blob = self.bucket.get_blob(blob_name)
+        return blob is not None and blob.md5_hash == get_md5_hash(path)
+
+    def upload_file(self, path, blob_name):
+        '''
+        :return: True if uploaded, False if skipped as unchanged.
+        '''
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if self._is_unchanged(path, blob_name):
+                    return False
+                blob = self.bucket.blob(blob_name, chunk_size=self.chunk_size)
+                blob.upload_from_filename(path, checksum='md5')
+                return True
+            except NotFound:
+                raise
+            except Exception as ex:
+                if attempt == self.max_attempts:
+                    raise
+                backoff_seconds = self.backoff_seconds * 2 ** (attempt - 1)
+                logging.warning('attempt {attempt} to upload {path} to {blob_name} failed, retrying in {backoff_seconds} seconds: {ex}',
+                    attempt=attempt, path=path, blob_name=blob_name, backoff_seconds=backoff_seconds, ex=ex)
+                time.sleep(backoff_seconds)
+
+    def upload_files(self, files):
+        '''
+        :param files: list of (path, blob_name)
+        :return: UploadResult of the blob names.
+        '''
+        result = UploadResult()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='uploader') as executor:
+            futures = [(blob_name, executor.submit(self.upload_file, path, blob_name)) for path, blob_name in files]
+            for blob_name, future in futures:
+                try:
+                    (result.uploaded if future.result() else result.skipped).append(blob_name)
+                except Exception as ex:
+                    logging.error('failed to upload {blob_name}: {ex}', blob_name=blob_name, ex=ex)
+                    result.failed.append(blob_name)
+        logging.info('upload of {l} files to {bucket}: {result}', l=len(files), bucket=self.bucket.name, result=result)
+        return result
+
+    def upload_dir(self, base_dir, prefix = ''):
+        '''
+        Uploads the minute and daily files under base_dir, the date partitions included.
+        '''
+        return self.upload_files(get_upload_files(base_dir, prefix))
+
 def upload():
-    try:
-        client = _get_client()
-        bucket = client.get_bucket(_BUCKET_NAME)
-        blob_name = _BLOB_NAME
-        blob = bucket.blob(blob_name)
-        source_file = get_latest_source_filename()
-        blob.upload_from_filename(source_file)
-        print('File {} uploaded to {}.'.format(source_file, blob_name))
-    except NotFound:
-        print("Sorry, that bucket {} does not exist!".format(_BUCKET_NAME))
+    '''
+    Uploads the latest daily csv file to its blob, see upload_dir for the files of the aggregations runs.
+
+    :return: UploadResult of the blob name, the failure of a missing bucket included.
+    '''
+    return Uploader(_get_bucket()).upload_files([(get_latest_source_filename(), _BLOB_NAME)])
+
+def upload_dir(base_dir = 'data', prefix = '', bucket_name = _BUCKET_NAME):
+    '''
+    Uploads the minute and daily files under base_dir to the bucket.
+
+    :return: UploadResult of the blob names.
+    '''
+    return Uploader(_get_bucket(bucket_name)).upload_dir(base_dir, prefix)
+
+def upload_session(base_dir, date_str, partition_by_date = False, bucket_name = _BUCKET_NAME):
+    '''
+    Uploads the minute and daily files of the session of date_str to the bucket, see get_session_upload_files.
+
+    :return: UploadResult of the blob names.
+    '''
+    return Uploader(_get_bucket(bucket_name)).upload_files(get_session_upload_files(base_dir, date_str, partition_by_date))
@@ -0,0 +1,122 @@
+import unittest, base64, hashlib, os, tempfile, threading
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.upload.daily import Uploader, get_upload_files, get_session_upload_files, get_md5_hash
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class _FakeBlob:
+    def __init__(self, bucket, name, chunk_size = None):
+        self.bucket, self.name, self.chunk_size = bucket, name, chunk_size
+
+    @property
+    def md5_hash(self):
+        return base64.b64encode(hashlib.md5(self.bucket.data_per_name[self.name]).digest()).decode('ascii')
+
+    def upload_from_filename(self, filename, checksum = None):
+        with self.bucket.lock:
+            if self.bucket.failure_cnt_per_name.get(self.name, 0):
+                self.bucket.failure_cnt_per_name[self.name] -= 1
+                raise ConnectionError('connection reset')
+        with open(filename, 'rb') as f:
+            data = f.read()
+        with self.bucket.lock:
+            self.bucket.data_per_name[self.name] = data
+            self.bucket.upload_cnt += 1
+
+class _FakeBucket:
+    '''
+    In memory bucket with the methods of google.cloud.storage.Bucket the Uploader uses.
+    '''
+    name = 'fake_bucket'
+
+    def __init__(self):
+        self.data_per_name = {}
+        self.failure_cnt_per_name = {}
+        self.upload_cnt = 0
+        self.lock = threading.Lock()
+
+    def blob(self, blob_name, chunk_size = None):
+        return _FakeBlob(self, blob_name, chunk_size)
+
+    def get_blob(self, blob_name):
+        if blob_name not in self.data_per_name:
+            return None
+        return _FakeBlob(self, blob_name)
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+def _new_base_dir(base_dir):
+    _write(os.path.join(base_dir, 'date=2020-01-02', 'minute.parquet'), 'minute 2')
+    _write(os.path.join(base_dir, 'date=2020-01-02', 'daily.parquet'), 'daily 2')
+    _write(os.path.join(base_dir, 'date=2020-01-03', 'minute.parquet'), 'minute 3')
+    _write(os.path.join(base_dir, 'daily.csv'), 'daily')
+    _write(os.path.join(base_dir, 'segments', 'segment-00000000.feather'), 'segment')
+    _write(os.path.join(base_dir, 'minute.csv.tmp'), 'partial')
+
+class TestUploader(unittest.TestCase):
+    def test_get_upload_files(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            _new_base_dir(base_dir)
+            files = get_upload_files(base_dir, prefix='us/')
+            self.assertEqual(['us/daily.csv', 'us/date=2020-01-02/daily.parquet', 'us/date=2020-01-02/minute.parquet',
+                'us/date=2020-01-03/minute.parquet'], [blob_name for _, blob_name in files])
+            self.assertEqual(os.path.join(base_dir, 'daily.csv'), files[0][0])
+
+    def test_get_session_upload_files(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            _new_base_dir(base_dir)
+            _write(os.path.join(base_dir, 'minute.csv'), 'minute')
+            bucket = _FakeBucket()
+            result = Uploader(bucket).upload_files(get_session_upload_files(base_dir, '2020-01-03'))
+            self.assertEqual(['us.daily.streaming.csv', '2020-01-03/daily.csv', '2020-01-03/minute.csv'], result.uploaded)
+            self.assertEqual(b'daily', bucket.data_per_name['us.daily.streaming.csv'])
+
+    def test_get_session_upload_files_partitioned(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            _new_base_dir(base_dir)
+            _write(os.path.join(base_dir, 'date=2020-01-03', 'daily.csv'), 'daily 3')
+            files = get_session_upload_files(base_dir, '2020-01-03', partition_by_date=True)
+            # only the partition of the session, not the earlier ones
+            self.assertEqual(['us.daily.streaming.csv', '2020-01-03/daily.csv', '2020-01-03/minute.parquet'],
+                [blob_name for _, blob_name in files])
+            self.assertEqual(os.path.join(base_dir, 'date=2020-01-03', 'daily.csv'), files[0][0])
+
+    def test_upload_dir(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            _new_base_dir(base_dir)
+            bucket = _FakeBucket()
+            uploader = Uploader(bucket, max_workers=4, chunk_size=256 * 1024)
+
+            result = uploader.upload_dir(base_dir)
+            self.assertEqual(4, len(result.uploaded))
+            self.assertEqual(b'minute 3', bucket.data_per_name['date=2020-01-03/minute.parquet'])
+
+            # the unchanged files are skipped
+            _write(os.path.join(base_dir, 'daily.csv'), 'daily updated')
+            result = uploader.upload_dir(base_dir)
+            self.assertEqual(['daily.csv'], result.uploaded)
+            self.assertEqual(3, len(result.skipped))
+            self.assertEqual(5, bucket.upload_cnt)
+            self.assertEqual(get_md5_hash(os.path.join(base_dir, 'daily.csv')), bucket.get_blob('daily.csv').md5_hash)
+
+    def test_retry(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            _new_base_dir(base_dir)
+            bucket = _FakeBucket()
+            bucket.failure_cnt_per_name = {'daily.csv': 2, 'date=2020-01-02/daily.parquet': 5}
+            uploader = Uploader(bucket, max_attempts=3, backoff_seconds=0.001)
+
+            result = uploader.upload_dir(base_dir)
+            self.assertEqual(['date=2020-01-02/daily.parquet'], result.failed)
+            self.assertEqual(3, len(result.uploaded))
+            self.assertEqual(b'daily', bucket.data_per_name['daily.csv'])
+
+            # run again, resuming with the failed file only
+            result = uploader.upload_dir(base_dir)
+            self.assertEqual(['date=2020-01-02/daily.parquet'], result.uploaded)
+            self.assertEqual(3, len(result.skipped))
@@ -1,9 +1,12 @@
-import datetime
+import datetime, time
 
 class CurrentTime():
     def get_current_epoch_seconds(self):
         return int(datetime.datetime.now().timestamp())
 
+    def get_current_epoch_seconds_float(self):
+        return time.time()
+
 class MockCurrentTime(CurrentTime):
     def __init__(self, mock_epoch_seconds):
         self.mock_epoch_seconds = mock_epoch_seconds
@@ -11,5 +14,8 @@ class MockCurrentTime(CurrentTime):
     def get_current_epoch_seconds(self):
         return self.mock_epoch_seconds
 
+    def get_current_epoch_seconds_float(self):
+        return float(self.mock_epoch_seconds)
+
     def set_current_epoch_seconds(self, mock_epoch_seconds):
         self.mock_epoch_seconds = mock_epoch_seconds
@@ -0,0 +1,233 @@
+import json, threading, time
+from concurrent.futures import Future
+import us_finance_streaming_data_miner.util.logging as logging
+
+_MAX_DELIVERY_ATTEMPTS = 5
+
+
+class PublishedMessage:
+    def __init__(self, topic, data, ordering_key, attributes):
+        self.topic, self.data, self.ordering_key, self.attributes = topic, data, ordering_key, attributes
+
+class FakePublisherClient:
+    '''
+    In-process stand-in of pubsub_v1.PublisherClient that keeps the published messages in memory.
+
+    The futures are resolved at once, or with an exception for the ordering keys set to fail,
+    and the publishing of an ordering key that failed is paused until resume_publish, as the real client does.
+    '''
+    def __init__(self):
+        self.messages = []
+        self.failure_cnt_per_ordering_key = {}
+        self.paused_ordering_keys = set()
+        self._lock = threading.Lock()
+
+    def publish(self, topic, data, ordering_key = '', **attributes):
+        future = Future()
+        with self._lock:
+            if ordering_key in self.paused_ordering_keys:
+                future.set_exception(RuntimeError('publishing of {ordering_key} is paused'.format(ordering_key=ordering_key)))
+                return future
+            if self.failure_cnt_per_ordering_key.get(ordering_key, 0):
+                self.failure_cnt_per_ordering_key[ordering_key] -= 1
+                if ordering_key:
+                    self.paused_ordering_keys.add(ordering_key)
+                future.set_exception(RuntimeError('failed to publish'))
+                return future
+            self.messages.append(PublishedMessage(topic, data, ordering_key, attributes))
+        future.set_result(str(len(self.messages)))
+        return future
+
+    def resume_publish(self, topic, ordering_key):
+        with self._lock:
+            self.paused_ordering_keys.discard(ordering_key)
+
+class FakeMessage:
+    '''
+    Stand-in of a received pubsub_v1 message. ack and nack release it from the flow control of its subscriber.
+    '''
+    def __init__(self, data, attributes = None, ordering_key = '', message_id = '', publish_time = None):
+        '''
+
+        :param publish_time: epoch seconds the message was published at, the replay is paced by it.
+        '''
+        self.data = data
+        self.attributes = attributes or {}
+        self.ordering_key = ordering_key
+        self.message_id = message_id
+        self.publish_time = publish_time
+        self.delivery_attempt = 0
+        self._subscriber = None
+        self._settled = True
+
+    def ack(self):
+        self._subscriber._on_done(self, acked=True)
+
+    def nack(self):
+        self._subscriber._on_done(self, acked=False)
+
+def _to_fake_message(record, i):
+    if not isinstance(record, dict) or 'data' not in record:
+        record = {'data': record}
+    data = record['data']
+    data = data.encode('utf-8') if isinstance(data, str) else json.dumps(data).encode('utf-8')
+    return FakeMessage(data, record.get('attributes'), record.get('ordering_key', ''),
+        record.get('message_id', str(i)), record.get('publish_time'))
+
+def read_recorded_messages(path):
+    '''
+    Reads the messages recorded one JSON per line as {"data": ..., "attributes": ..., "ordering_key": ..., "publish_time": ...},
+    where data is the payload as a str, or any JSON value encoded as the payload. A line that is not such an object is
+    the data itself.
+
+    :return: list of FakeMessage
+    '''
+    messages = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                messages.append(_to_fake_message(json.loads(line), len(messages)))
+    return messages
+
+def write_recorded_messages(path, messages):
+    '''
+    Records the messages, e.g. pulled from a real subscription, to be read by read_recorded_messages.
+    '''
+    with open(path, 'w') as f:
+        for message in messages:
+            record = {'data': message.data.decode('utf-8'), 'attributes': dict(message.attributes or {}),
+                'ordering_key': message.ordering_key or '', 'publish_time': message.publish_time}
+            f.write(json.dumps(record) + '\n')
+
+class FakeStreamingPullFuture:
+    '''
+    Stand-in of the future returned by SubscriberClient.subscribe. Unlike the real one, it is done once
+    all the messages are replayed and acked, so the run using it ends after the replay.
+    '''
+    def __init__(self, subscriber):
+        self._subscriber = subscriber
+
+    def result(self, timeout = None):
+        if not self._subscriber._done.wait(timeout):
+            raise TimeoutError('the replay is not done in {timeout} seconds'.format(timeout=timeout))
+
+    def done(self):
+        return self._subscriber._done.is_set()
+
+    def cancel(self):
+        self._subscriber._cancelled.set()
+        with self._subscriber._condition:
+            self._subscriber._condition.notify_all()
+        self._subscriber._done.set()
+
+class FakeSubscriberClient:
+    '''
+    In-process stand-in of pubsub_v1.SubscriberClient that replays recorded messages to the subscribe callback.
+
+    The messages are delivered one at a time on a dispatcher thread, paced by their publish_time:
+    at wall clock with speed 1, accelerated with a higher speed, or as fast as possible with speed None.
+    The number of the delivered messages not acked yet is bounded by the max_messages of the flow control,
+    and a nacked message is delivered again after the others. An exception of the callback nacks the message,
+    and a message nacked max_delivery_attempts times is dropped, as by a dead letter policy.
+    '''
+    def __init__(self, messages, speed = None, max_delivery_attempts = _MAX_DELIVERY_ATTEMPTS):
+        '''
+
+        :param messages: list of FakeMessage, or the path of recorded messages.
+        '''
+        self.messages = read_recorded_messages(messages) if isinstance(messages, str) else list(messages)
+        self.speed = speed
+        self.max_delivery_attempts = max_delivery_attempts
+        self.delivered_cnt = 0
+        self.acked_cnt = 0
+        self.nacked_cnt = 0
+        self.failed_cnt = 0
+        self.dropped_cnt = 0
+        self.start_time = None
+        self.end_time = None
+        self._outstanding_cnt = 0
+        self._redeliveries = []
+        self._condition = threading.Condition()
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def subscription_path(self, project_id, subscription_id):
+        return 'projects/{project_id}/subscriptions/{subscription_id}'.format(project_id=project_id, subscription_id=subscription_id)
+
+    def subscribe(self, subscription_path, callback, flow_control = None):
+        max_messages = getattr(flow_control, 'max_messages', 0) or None
+        self._thread = threading.Thread(target=self._run, args=(callback, max_messages), name='fake_subscriber', daemon=True)
+        self._thread.start()
+        return FakeStreamingPullFuture(self)
+
+    def get_rate(self):
+        '''
+        :return: messages acked per second over the replay so far.
+        '''
+        if self.start_time is None:
+            return 0.0
+        elapsed = (self.end_time or time.monotonic()) - self.start_time
+        return self.acked_cnt / elapsed if elapsed > 0 else 0.0
+
+    def _on_done(self, message, acked):
+        with self._condition:
+            # a message is settled once per delivery, later acks and nacks are ignored as by the real client
+            if message._settled:
+                return
+            message._settled = True
+            self._outstanding_cnt -= 1
+            if acked:
+                self.acked_cnt += 1
+            else:
+                self.nacked_cnt += 1
+                if message.delivery_attempt < self.max_delivery_attempts:
+                    self._redeliveries.append(message)
+                else:
+                    self.dropped_cnt += 1
+                    logging.error('dropping the message {message_id} nacked {attempt} times',
+                        message_id=message.message_id, attempt=message.delivery_attempt)
+            self._condition.notify_all()
+
+    def _wait_for(self, predicate):
+        with self._condition:
+            self._condition.wait_for(lambda: predicate() or self._cancelled.is_set())
+        return not self._cancelled.is_set()
+
+    def _deliver(self, callback, message, max_messages):
+        if max_messages and not self._wait_for(lambda: self._outstanding_cnt < max_messages):
+            return False
+        message._subscriber = self
+        message.delivery_attempt += 1
+        with self._condition:
+            message._settled = False
+            self._outstanding_cnt += 1
+            self.delivered_cnt += 1
+        try:
+            callback(message)
+        except Exception as ex:
+            self.failed_cnt += 1
+            logging.error('the callback failed on the message {message_id}: {ex}', message_id=message.message_id, ex=ex)
+            message.nack()
+        return True
+
+    def _run(self, callback, max_messages):
+        self.start_time = time.monotonic()
+        first_publish_time = next((m.publish_time for m in self.messages if m.publish_time is not None), None)
+        for message in self.messages:
+            if self.speed and message.publish_time is not None:
+                delay = (message.publish_time - first_publish_time) / self.speed - (time.monotonic() - self.start_time)
+                if delay > 0 and self._cancelled.wait(delay):
+                    return
+            if not self._deliver(callback, message, max_messages):
+                return
+        while self._wait_for(lambda: self._redeliveries or self._outstanding_cnt == 0):
+            with self._condition:
+                if not self._redeliveries:
+                    break
+                message = self._redeliveries.pop(0)
+            if not self._deliver(callback, message, max_messages):
+                return
+        self.end_time = time.monotonic()
+        self._done.set()
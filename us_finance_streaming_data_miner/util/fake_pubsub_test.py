@@ -0,0 +1,94 @@
+import unittest, json, os, tempfile, threading, time
+
+from us_finance_streaming_data_miner.util.fake_pubsub import FakeMessage, FakeSubscriberClient, read_recorded_messages, write_recorded_messages
+import us_finance_streaming_data_miner.util.logging as logging
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class _FlowControl:
+    def __init__(self, max_messages):
+        self.max_messages = max_messages
+
+class TestFakeSubscriberClient(unittest.TestCase):
+    def test_read_recorded_messages(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            path = os.path.join(base_dir, 'requests.jsonl')
+            with open(path, 'w') as f:
+                f.write(json.dumps({'data': '[{"ev": "T"}]', 'attributes': {'kind': 'trades'}, 'publish_time': 1.5}) + '\n')
+                f.write(json.dumps({'data': [{'ev': 'A'}]}) + '\n\n')
+                f.write(json.dumps([{'ev': 'Q'}]) + '\n')
+            messages = read_recorded_messages(path)
+            self.assertEqual([b'[{"ev": "T"}]', b'[{"ev": "A"}]', b'[{"ev": "Q"}]'], [message.data for message in messages])
+            self.assertEqual({'kind': 'trades'}, messages[0].attributes)
+            self.assertEqual([1.5, None, None], [message.publish_time for message in messages])
+
+            path_written = os.path.join(base_dir, 'written.jsonl')
+            write_recorded_messages(path_written, messages)
+            messages_read = read_recorded_messages(path_written)
+            self.assertEqual([message.data for message in messages], [message.data for message in messages_read])
+            self.assertEqual([message.publish_time for message in messages], [message.publish_time for message in messages_read])
+
+    def test_subscribe_max_speed(self):
+        subscriber = FakeSubscriberClient([FakeMessage(str(i).encode(), publish_time=i * 10.0) for i in range(100)])
+        received = []
+        def callback(message):
+            received.append(message.data)
+            message.ack()
+        future = subscriber.subscribe(subscriber.subscription_path('project', 'sub'), callback)
+        future.result(timeout=5)
+        self.assertTrue(future.done())
+        self.assertEqual([str(i).encode() for i in range(100)], received)
+        self.assertEqual(100, subscriber.acked_cnt)
+        self.assertGreater(subscriber.get_rate(), 0)
+
+    def test_subscribe_speed(self):
+        subscriber = FakeSubscriberClient([FakeMessage(b'', publish_time=t) for t in (100.0, 100.1, 100.2)], speed=2.0)
+        start = time.monotonic()
+        subscriber.subscribe('sub', lambda message: message.ack()).result(timeout=5)
+        # 0.2 seconds of publish times replayed at twice the speed
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_flow_control_and_nack(self):
+        subscriber = FakeSubscriberClient([FakeMessage(str(i).encode()) for i in range(10)])
+        leased = []
+        max_leased_cnt = [0]
+        lock = threading.Lock()
+        def ack_later(message):
+            with lock:
+                leased.remove(message)
+            # the first delivery of the message 3 is nacked, to be delivered again
+            if message.data == b'3' and message.delivery_attempt == 1:
+                message.nack()
+            else:
+                message.ack()
+        def callback(message):
+            with lock:
+                leased.append(message)
+                max_leased_cnt[0] = max(max_leased_cnt[0], len(leased))
+            threading.Timer(0.001, ack_later, args=(message,)).start()
+        subscriber.subscribe('sub', callback, flow_control=_FlowControl(2)).result(timeout=5)
+        self.assertLessEqual(max_leased_cnt[0], 2)
+        self.assertEqual(11, subscriber.delivered_cnt)
+        self.assertEqual(10, subscriber.acked_cnt)
+        self.assertEqual(1, subscriber.nacked_cnt)
+
+    def test_cancel(self):
+        subscriber = FakeSubscriberClient([FakeMessage(b'', publish_time=t) for t in (0.0, 100.0)], speed=1.0)
+        future = subscriber.subscribe('sub', lambda message: message.ack())
+        future.cancel()
+        future.result(timeout=1)
+        self.assertLessEqual(subscriber.acked_cnt, 1)
+
+    def test_callback_exception(self):
+        subscriber = FakeSubscriberClient([FakeMessage(b'not json'), FakeMessage(b'[1]')], max_delivery_attempts=3)
+        received = []
+        def callback(message):
+            received.append(json.loads(message.data))
+            message.ack()
+        subscriber.subscribe('sub', callback).result(timeout=5)
+        self.assertEqual([[1]], received)
+        self.assertEqual(4, subscriber.delivered_cnt)
+        self.assertEqual(3, subscriber.failed_cnt)
+        self.assertEqual(1, subscriber.acked_cnt)
+        self.assertEqual(1, subscriber.dropped_cnt)
@@ -1,8 +1,28 @@
+import atexit, os, queue, threading, time
+import logging as std_logging
 from google.cloud import logging
 
 LOG_NAME = 'us_finance_streaming_data_miner'
 
+_QUEUE_MAX_SIZE = 10000
+_BATCH_MAX_SIZE = 500
+_BATCH_MAX_LATENCY_SECONDS = 1.0
+_ERROR_PUT_TIMEOUT_SECONDS = 0.1
+_SHUTDOWN_FLUSH_TIMEOUT_SECONDS = 5.0
+
+DEBUG = std_logging.DEBUG
+INFO = std_logging.INFO
+WARNING = std_logging.WARNING
+ERROR = std_logging.ERROR
+
+_SEVERITY_LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR}
+# queued after the entries to stop the writer thread once they are written
+_STOP = object()
+
 _client = None
+_level = _SEVERITY_LEVELS[os.getenv('LOG_LEVEL', 'INFO').upper()]
+_writer = None
+_writer_lock = threading.Lock()
 
 def _get_client():
     global _client
@@ -13,26 +33,198 @@ def _get_client():
 def get_logger(log_name=LOG_NAME):
     return _get_client().logger(log_name)
 
+class CloudLoggingSink:
+    '''
+    Writes log entries to Cloud Logging, a batch in a single request.
+    '''
+    def __init__(self, log_name=LOG_NAME):
+        self.log_name = log_name
+
+    def write_entries(self, entries):
+        batch = get_logger(self.log_name).batch()
+        for severity, text in entries:
+            batch.log_text(text, severity=severity)
+        batch.commit()
+
+class LocalSink:
+    '''
+    Keeps the log entries in memory, a stand-in for Cloud Logging in tests.
+    '''
+    def __init__(self):
+        self.entries = []
+
+    def write_entries(self, entries):
+        self.entries.extend(entries)
+
+class AsyncLogWriter:
+    '''
+    Queues the log entries and writes them to the sink in batches from a background thread.
+
+    When the queue is full, entries are dropped (an error waits briefly first)
+    and the number of the dropped entries is reported with the next batch.
+    '''
+    def __init__(self, sink, max_queue_size=_QUEUE_MAX_SIZE, max_batch_size=_BATCH_MAX_SIZE, max_latency_seconds=_BATCH_MAX_LATENCY_SECONDS):
+        self.sink = sink
+        self.max_batch_size = max_batch_size
+        self.max_latency_seconds = max_latency_seconds
+        self.queue = queue.Queue(max_queue_size)
+        self.dropped_cnt = 0
+        self._reported_dropped_cnt = 0
+        self._dropped_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, severity, text):
+        try:
+            if severity == 'ERROR':
+                self.queue.put((severity, text), timeout=_ERROR_PUT_TIMEOUT_SECONDS)
+            else:
+                self.queue.put_nowait((severity, text))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped_cnt += 1
+
+    def flush(self, timeout=None):
+        '''
+        Waits until the entries queued so far are written.
+
+        :return: False if the timeout passed before that.
+        '''
+        flushed = threading.Event()
+        try:
+            self.queue.put(flushed, timeout=timeout)
+        except queue.Full:
+            return False
+        return flushed.wait(timeout)
+
+    def stop(self, timeout=None):
+        '''
+        Writes the entries queued so far and stops the thread.
+
+        :return: False if the timeout passed before that.
+        '''
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _next_batch(self):
+        '''
+        :return: (entries, flush_events, stopped) of the next batch.
+        '''
+        entries, flush_events = [], []
+        item = self.queue.get()
+        deadline = time.monotonic() + self.max_latency_seconds
+        while True:
+            if item is _STOP:
+                return entries, flush_events, True
+            if isinstance(item, threading.Event):
+                flush_events.append(item)
+                break
+            entries.append(item)
+            if len(entries) >= self.max_batch_size:
+                break
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self.queue.get(timeout=remaining)
+                else:
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        return entries, flush_events, False
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            entries, flush_events, stopped = self._next_batch()
+            with self._dropped_lock:
+                dropped_cnt = self.dropped_cnt - self._reported_dropped_cnt
+            if dropped_cnt:
+                self._reported_dropped_cnt += dropped_cnt
+                entries.append(('WARNING', '{cnt} log entries were dropped as the log queue was full'.format(cnt=dropped_cnt)))
+            if entries:
+                try:
+                    self.sink.write_entries(entries)
+                except Exception as ex:
+                    print('failed to write {l} log entries: {ex}'.format(l=len(entries), ex=ex))
+            for flushed in flush_events:
+                flushed.set()
+
+def set_sink(sink):
+    '''
+    Replaces the sink the log entries are written to, e.g. with LocalSink in tests.
+    The writer of the previous sink is stopped once the entries queued to it are written.
+    '''
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop(_SHUTDOWN_FLUSH_TIMEOUT_SECONDS)
+        _writer = AsyncLogWriter(sink)
+    return _writer
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AsyncLogWriter(CloudLoggingSink())
+    return _writer
+
+def flush(timeout=_SHUTDOWN_FLUSH_TIMEOUT_SECONDS):
+    if _writer is not None:
+        _writer.flush(timeout)
+
+atexit.register(flush)
+
+def set_level(severity):
+    '''
+    Sets the minimum severity to emit, one of DEBUG, INFO, WARNING, ERROR.
+    The initial level is read from the LOG_LEVEL environment variable, INFO if not set.
+    '''
+    global _level
+    _level = _SEVERITY_LEVELS[severity.upper()]
+
+def is_enabled_for(severity):
+    return _SEVERITY_LEVELS[severity] >= _level
+
+def _format(messages, kwargs):
+    '''
+    Joins the messages, formatting the first one with the kwargs if given.
+    '''
+    if kwargs:
+        messages = (str(messages[0]).format(**kwargs),) + messages[1:]
+    return ', '.join(list(map(lambda m: str(m), messages)))
+
 def _print_with_severity_prefix(severity, text):
     print('{severity}: {text}'.format(severity=severity, text=text))
 
 def _log_print_with_severity(severity, text):
     _print_with_severity_prefix(severity, text)
-    logger = get_logger()
-    logger.log_text(text, severity=severity)
+    _get_writer().put(severity, text)
 
-def debug(*messages):
-    text = ', '.join(list(map(lambda m: str(m), messages)))
-    _log_print_with_severity('DEBUG', text)
+def debug(*messages, **kwargs):
+    '''
+    Logs the messages joined by comma. With kwargs, the first message is a format string
+    that is formatted only when DEBUG is enabled, e.g. debug('{cnt} bars', cnt=len(bars)).
+    '''
+    if _level > DEBUG:
+        return
+    _log_print_with_severity('DEBUG', _format(messages, kwargs))
 
-def info(*messages):
-    text = ', '.join(list(map(lambda m: str(m), messages)))
-    _log_print_with_severity('INFO', text)
+def info(*messages, **kwargs):
+    if _level > INFO:
+        return
+    _log_print_with_severity('INFO', _format(messages, kwargs))
 
-def error(*messages):
-    text = ', '.join(list(map(lambda m: str(m), messages)))
-    _log_print_with_severity('ERROR', text)
+def error(*messages, **kwargs):
+    if _level > ERROR:
+        return
+    _log_print_with_severity('ERROR', _format(messages, kwargs))
 
-def warning(*messages):
-    text = ', '.join(list(map(lambda m: str(m), messages)))
-    _log_print_with_severity('WARNING', text)
+def warning(*messages, **kwargs):
+    if _level > WARNING:
+        return
+    _log_print_with_severity('WARNING', _format(messages, kwargs))
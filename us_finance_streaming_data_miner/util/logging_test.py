@@ -0,0 +1,99 @@
+import unittest, threading
+
+import us_finance_streaming_data_miner.util.logging as logging
+
+class _BlockingSink(logging.LocalSink):
+    def __init__(self):
+        super(_BlockingSink, self).__init__()
+        self.release = threading.Event()
+        self.batches = []
+
+    def write_entries(self, entries):
+        self.release.wait()
+        self.batches.append(list(entries))
+        super(_BlockingSink, self).write_entries(entries)
+
+class TestAsyncLogWriter(unittest.TestCase):
+    def test_flush(self):
+        sink = logging.LocalSink()
+        writer = logging.AsyncLogWriter(sink)
+        writer.put('INFO', 'message 1')
+        writer.put('ERROR', 'message 2')
+        self.assertTrue(writer.flush(1))
+        self.assertEqual([('INFO', 'message 1'), ('ERROR', 'message 2')], sink.entries)
+
+    def test_batch(self):
+        sink = _BlockingSink()
+        writer = logging.AsyncLogWriter(sink, max_batch_size=3, max_latency_seconds=0)
+        writer.put('INFO', 'message 0')
+        for i in range(1, 7):
+            writer.put('INFO', 'message {i}'.format(i=i))
+        sink.release.set()
+        self.assertTrue(writer.flush(1))
+        self.assertEqual(7, len(sink.entries))
+        self.assertTrue(all(len(batch) <= 3 for batch in sink.batches))
+        self.assertLess(len(sink.batches), 7)
+
+    def test_drop_when_full(self):
+        sink = _BlockingSink()
+        writer = logging.AsyncLogWriter(sink, max_queue_size=2, max_batch_size=1, max_latency_seconds=0)
+        for i in range(10):
+            writer.put('INFO', 'message {i}'.format(i=i))
+        self.assertGreater(writer.dropped_cnt, 0)
+        sink.release.set()
+        self.assertTrue(writer.flush(1))
+        self.assertIn(('WARNING', '{cnt} log entries were dropped as the log queue was full'.format(cnt=writer.dropped_cnt)), sink.entries)
+
+    def test_stop(self):
+        sink = _BlockingSink()
+        writer = logging.AsyncLogWriter(sink)
+        for i in range(10):
+            writer.put('INFO', 'message {i}'.format(i=i))
+        sink.release.set()
+        self.assertTrue(writer.stop(1))
+        self.assertFalse(writer._thread.is_alive())
+        self.assertEqual(10, len(sink.entries))
+
+class TestLogging(unittest.TestCase):
+    def test_set_sink(self):
+        sink = logging.LocalSink()
+        logging.set_sink(sink)
+        logging.info('message', 1)
+        logging.flush(1)
+        self.assertEqual([('INFO', 'message, 1')], sink.entries)
+
+    def test_set_sink_stops_previous_writer(self):
+        sink = _BlockingSink()
+        previous_writer = logging.set_sink(sink)
+        logging.info('message')
+        sink.release.set()
+        logging.set_sink(logging.LocalSink())
+        # the entry queued before is written and the thread is not leaked
+        self.assertEqual([('INFO', 'message')], sink.entries)
+        self.assertFalse(previous_writer._thread.is_alive())
+
+    def test_level(self):
+        class _Counted:
+            def __init__(self):
+                self.cnt = 0
+
+            def __format__(self, format_spec):
+                self.cnt += 1
+                return 'counted'
+
+        sink = logging.LocalSink()
+        logging.set_sink(sink)
+        counted = _Counted()
+        try:
+            logging.set_level('WARNING')
+            self.assertFalse(logging.is_enabled_for('INFO'))
+            self.assertTrue(logging.is_enabled_for('ERROR'))
+            logging.debug('debug {v}', v=counted)
+            logging.info('info {v}', v=counted)
+            logging.warning('warning {v}', v=counted)
+            logging.error('error {v}', {'k': 'v'}, v=counted)
+            logging.flush(1)
+        finally:
+            logging.set_level('INFO')
+        self.assertEqual(2, counted.cnt)
+        self.assertEqual([('WARNING', 'warning counted'), ('ERROR', "error counted, {'k': 'v'}")], sink.entries)
@@ -0,0 +1,90 @@
+import threading
+import us_finance_streaming_data_miner.util.current_time as current_time
+import us_finance_streaming_data_miner.util.logging as logging
+
+_MIN_WAIT_SECONDS = 0.001
+_MAX_CATCH_UP_MINUTES = 24 * 60
+
+
+class MinuteClock:
+    '''
+    Keeps the current epoch minute and calls the callbacks with the new minute at each minute boundary.
+
+    The clock is driven either by the wall clock, with start() running a thread that wakes up at the boundaries,
+    or by the event time of the data, with advance_to() called with the timestamps of the events.
+    The per event code reads current_minute instead of the system clock.
+    '''
+    def __init__(self, a_current_time = None, max_catch_up_minutes = _MAX_CATCH_UP_MINUTES):
+        '''
+
+        :param max_catch_up_minutes: the most minutes the callbacks are called for at once, when the clock jumps
+            further, e.g. from the initial wall clock minute to the first event of a replay, the earlier ones are skipped.
+        '''
+        self.current_time = a_current_time if a_current_time else current_time.CurrentTime()
+        self.max_catch_up_minutes = max_catch_up_minutes
+        self.current_minute = self.current_time.get_current_epoch_seconds() // 60
+        self.callbacks = []
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add_callback(self, callback):
+        '''
+        :param callback: function called with the new epoch minute, once for each minute boundary crossed in order,
+            so several minutes passed at once call it with each of them.
+        '''
+        self.callbacks.append(callback)
+
+    def advance_to(self, epoch_seconds):
+        '''
+        Moves the clock forward to epoch_seconds, calling the callbacks for each minute boundary crossed.
+        Going backward, e.g. with a late event, is ignored.
+
+        :return: True if a minute boundary is crossed.
+        '''
+        minute = int(epoch_seconds) // 60
+        if minute <= self.current_minute:
+            return False
+        with self._lock:
+            if minute <= self.current_minute:
+                return False
+            # the clock steps through the minutes crossed, so the callbacks read each of them as current_minute
+            for crossed_minute in range(max(self.current_minute + 1, minute - self.max_catch_up_minutes + 1), minute + 1):
+                if crossed_minute <= self.current_minute:
+                    # a callback advanced the clock past it
+                    continue
+                self.current_minute = crossed_minute
+                for callback in self.callbacks:
+                    try:
+                        callback(crossed_minute)
+                    except Exception as ex:
+                        logging.error('minute clock callback failed at {minute}: {ex}', minute=crossed_minute, ex=ex)
+        return True
+
+    def tick(self):
+        '''
+        Moves the clock to the current time.
+        '''
+        return self.advance_to(self.current_time.get_current_epoch_seconds())
+
+    def start(self):
+        '''
+        Starts the thread that ticks the clock at the wall clock minute boundaries.
+        '''
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='minute_clock', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout = None):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            remaining = (self.current_minute + 1) * 60 - self.current_time.get_current_epoch_seconds_float()
+            if self._stopped.wait(max(remaining, _MIN_WAIT_SECONDS)):
+                break
+            self.tick()
@@ -0,0 +1,61 @@
+import unittest, threading
+
+import us_finance_streaming_data_miner.util.logging as logging
+from us_finance_streaming_data_miner.util.current_time import MockCurrentTime
+from us_finance_streaming_data_miner.util.minute_clock import MinuteClock
+
+def setUpModule():
+    logging.set_sink(logging.LocalSink())
+
+class TestMinuteClock(unittest.TestCase):
+    def test_advance_to(self):
+        clock = MinuteClock(MockCurrentTime(10))
+        minutes = []
+        clock.add_callback(minutes.append)
+        self.assertEqual(0, clock.current_minute)
+
+        self.assertFalse(clock.advance_to(59))
+        self.assertTrue(clock.advance_to(60))
+        self.assertFalse(clock.advance_to(30))
+        # several minutes passed at once call the callbacks for each of them
+        self.assertTrue(clock.advance_to(300))
+        self.assertEqual([1, 2, 3, 4, 5], minutes)
+        self.assertEqual(5, clock.current_minute)
+
+    def test_advance_to_catch_up(self):
+        clock = MinuteClock(MockCurrentTime(0), max_catch_up_minutes=3)
+        minutes = []
+        clock.add_callback(minutes.append)
+        clock.advance_to(100 * 60)
+        self.assertEqual([98, 99, 100], minutes)
+
+    def test_tick(self):
+        current_time = MockCurrentTime(0)
+        clock = MinuteClock(current_time)
+        minutes = []
+        clock.add_callback(minutes.append)
+        clock.tick()
+        current_time.set_current_epoch_seconds(61)
+        clock.tick()
+        self.assertEqual([1], minutes)
+
+    def test_callback_error(self):
+        clock = MinuteClock(MockCurrentTime(0))
+        minutes = []
+        clock.add_callback(lambda minute: 1 / 0)
+        clock.add_callback(minutes.append)
+        clock.advance_to(60)
+        self.assertEqual([1], minutes)
+
+    def test_start(self):
+        current_time = MockCurrentTime(119)
+        clock = MinuteClock(current_time)
+        fired = threading.Event()
+        clock.add_callback(lambda minute: fired.set())
+        clock.start()
+        current_time.set_current_epoch_seconds(120)
+        # the thread wakes up at the boundary, a second later in the mock time
+        self.assertTrue(fired.wait(5))
+        self.assertEqual(2, clock.current_minute)
+        clock.stop(5)
+        self.assertIsNone(clock._thread)
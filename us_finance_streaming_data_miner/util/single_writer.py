@@ -0,0 +1,64 @@
+import queue, threading
+from concurrent.futures import Future
+import us_finance_streaming_data_miner.util.logging as logging
+
+_MAX_QUEUE_SIZE = 100000
+
+
+class SingleWriter:
+    '''
+    Runs the submitted functions one at a time on a dedicated thread, in the order submitted.
+
+    Routing every mutation of a state through submit() makes the thread its only writer, and
+    a function passed to call() sees the state between two mutations, a consistent snapshot.
+    '''
+    def __init__(self, max_queue_size=_MAX_QUEUE_SIZE, name='single_writer'):
+        self.queue = queue.Queue(max_queue_size)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def is_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, f, *args):
+        '''
+        Queues f(*args) without waiting for it. Blocks while the queue is full.
+        '''
+        if self.is_writer_thread():
+            f(*args)
+            return
+        self.queue.put((f, args, None))
+
+    def call(self, f, *args):
+        '''
+        Runs f(*args) on the writer thread after the functions queued so far, and returns its result.
+        '''
+        if self.is_writer_thread():
+            return f(*args)
+        future = Future()
+        self.queue.put((f, args, future))
+        return future.result()
+
+    def stop(self, timeout=None):
+        '''
+        Runs the functions queued so far and stops the thread.
+        '''
+        self.queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            f, args, future = item
+            try:
+                result = f(*args)
+            except Exception as ex:
+                if future:
+                    future.set_exception(ex)
+                else:
+                    logging.error('failed to run {f}: {ex}', f=getattr(f, '__name__', f), ex=ex)
+                continue
+            if future:
+                future.set_result(result)
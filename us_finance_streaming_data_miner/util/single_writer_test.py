@@ -0,0 +1,29 @@
+import unittest, threading
+
+from us_finance_streaming_data_miner.util.single_writer import SingleWriter
+
+class TestSingleWriter(unittest.TestCase):
+    def test_submit_and_call(self):
+        writer = SingleWriter()
+        state = []
+        threads = [threading.Thread(target=lambda: [writer.submit(state.append, i) for i in range(1000)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4000, writer.call(len, state))
+        writer.stop(1)
+
+    def test_call_exception(self):
+        writer = SingleWriter()
+        with self.assertRaises(ZeroDivisionError):
+            writer.call(lambda: 1 / 0)
+        # the writer keeps running after a failure
+        writer.submit(lambda: 1 / 0)
+        self.assertEqual(2, writer.call(lambda: 2))
+        writer.stop(1)
+
+    def test_call_from_writer_thread(self):
+        writer = SingleWriter()
+        self.assertEqual(3, writer.call(lambda: writer.call(lambda: 3)))
+        writer.stop(1)